@@ -1,213 +1,1390 @@
-from tkinter import *
-
-class SmartDevice():
-    """
-    This class is the parent that includes the defaults for any smart device, including the power status, and the ability to toggle the
-    power status. aswell as the empty variable for the name of a device.
-    """
-    def __init__(self):
-        self.switchedOn = False
-        self.name = None
-        self.widgets = {}
-    def toggleSwitch(self):
-        """
-        This method turns the Device on or off.
-        """
-        if self.switchedOn == False:
-            self.switchedOn = True
-        else:
-            self.switchedOn = False
-    def getDeviceStatus(self):
-        """
-        this method returns whether or not the device is on.
-        """
-        if self.switchedOn == True:
-            return "On"
-        else: 
-            return "Off"
-
-    def getDeviceName(self):
-        """
-        This returns the device name.
-        """
-        return self.name
-    def setUpText(self, frame, index, device):
-        """
-        This function creates the text box and inserts the devices information, given the frame and index of said deivce.
-        """
-        deviceText = Text(frame, height=1, pady=20)
-        deviceLabel = "{}.".format(index+1) + str(device)
-        deviceText.insert("1.0", deviceLabel)
-        deviceText.pack(side=LEFT, expand=False, fill="both")
-        self.widgets["textBox"] = deviceText
-    def setUpConfig(self, frame):
-        """
-        This function creates the button to configure the options of the current device.
-        """
-        configBtn = Button(frame, text="Configure")
-        configBtn.pack(side=LEFT, expand=True, fill="both")
-        self.widgets["configButton"] = configBtn
-
-    def setUpToggle(self, frame):
-        """
-        This function creates the button to toggle the current device.
-        """
-        deviceBtn = Button(frame, text="Toggle this")
-        deviceBtn.pack(side=LEFT, expand=True, fill="both")
-        self.widgets["toggleButton"] = deviceBtn
-    def getWidgets(self):
-        """
-        This function retruns the dictionary contain the widgets connected to the device.
-        """
-        return self.widgets
-
-class SmartPlug(SmartDevice):
-    """
-    This creates a Smart plug object that is by default turned off and has a default of zero consumption rate.
-    """
-    def __init__(self):
-        super().__init__()
-        self.consumptionRate = 0
-        self.name = "Smart Plug"
-    def setConsumptionRate(self, rate):
-        """
-        This method sets the consumption rate of the plug.
-        """
-        if 0 <= rate <= 150:
-            self.consumptionRate = rate
-        else:
-            return(print("Invalid consumption rate entered!"))
-    def getConsumptionRate(self):
-        """
-        This method returns the consumption rate of the plug.
-        """
-        return self.consumptionRate
-    def __str__(self):
-        if self.switchedOn == True:
-            status = "ON"
-        else:
-            status = "OFF"
-        output = "Smart plug: {} | Consumption rate: {}".format(status, self.consumptionRate)
-        return output
-
-class SmartWashingMachine(SmartDevice):
-    """
-    This creates a Smart washing machine obejct. 
-    The object contains whether it is on or off and a wash  mode. 
-    The available wash modes are Daily wash, Quick wash, Eco.
-    """
-    def __init__(self):
-        super().__init__()
-        self.washMode_list = ["Daily wash", "Quick wash", "Eco"]
-        self.washMode = "Daily wash"
-        self.name = "Smart Washing Machine"
-    def setWashMode(self, mode):
-        """
-        This sets the wash mode of the device, only accepts "Daily wash", "Quick wash" or "Eco".
-        """
-        if mode in self.washMode_list:
-            self.washMode = mode
-        else:
-            return(print("Invalid wash mode entered!"))
-    def getWashMode(self):
-        """
-        This returns the current wash mode of the device.
-        """
-        return self.washMode
-    def getWashOptions(self):
-        """
-        This returns a list of the options for this device.
-        """
-        return self.washMode_list
-    def __str__(self):
-        if self.switchedOn == True:
-            status = "ON"
-        else:
-            status = "OFF"
-        output = "Washing machine: {} | Wash mode: {}".format(status, self.washMode)
-        return output
-
-class SmartHome():
-    """
-    This creates a smart home object in which a group of devices can be stored.
-    """
-    def __init__(self):
-        self.devices = []
-    def getDevices(self):
-        """
-        this returns a group of all the devices in the smart home object.    
-        """
-        return self.devices
-    def getDeviceAt(self, index):
-        """
-        This retruns the specific device at a certain index in the smart home object.
-        """
-        return self.devices[index]
-    def addDevice(self, device):
-        """
-        This adds a device to the smart home object.
-        """
-        self.devices.append(device)
-    def toggleSwitch(self, index):
-        """
-        This turns the device at a certain index on or off.
-        """
-        self.devices[index].toggleSwitch()
-    def turnOnAll(self):
-        """
-        This turns on all the devices inside a smart home object.
-        """
-        for device in self.devices:
-            if device.getDeviceStatus() == "Off":
-                device.toggleSwitch()
-    def turnOffAll(self):
-        """
-        This turns off all the devices inside a smart home object.
-        """
-        for device in self.devices:
-            if device.getDeviceStatus() == "On":
-                device.toggleSwitch()
-    def deleteDeviceAt(self, index):
-        """
-        This command deletes a device from the smart home object given the index of said device.
-        """
-        del self.devices[index]
-    def getIndex(self, device):
-        """
-        This command returns the index of a given device in the smart home.
-        """
-        if device in self.devices:
-            return self.devices.index(device)
-        else:
-            print("Entered device not in smart home")
-    def __str__(self):
-        output = "Your smart home contains:\n"
-        for i in range(len(self.devices)):
-            output += "{}\n".format(self.devices[i])
-        return output
-    def countTotalOn(self):
-        """
-        This command returns a count of the total smart devices that are currently turned on.
-        """
-        count = 0
-        for device in self.devices:
-            if device.getDeviceStatus() == "On":
-                count += 1
-        return count
-    def displayTotalOn(self, frame):
-        """
-        This command calculates the total number of devices that are on and displays the total that are on.
-        """
-        count = 0
-        for device in self.devices:
-            if device.getDeviceStatus() == "On":
-                count += 1
-        self.totalOnLabel = Label(frame, text="Total activated: {}".format(count), font=("Arial", 16), pady=15)
-        self.totalOnLabel.pack(fill="both", expand=TRUE)
-    def updateTotalOn(self, count):
-        """
-        This command updates the total on label to the inputted count.
-        """
-        self.totalOnLabel.configure(text="Total activated: {}".format(count))
-
-
+import threading
+from bisect import bisect_left, bisect_right, insort
+from collections import namedtuple
+from contextlib import contextmanager
+from enum import IntEnum
+from functools import wraps
+from heapq import heapify, heappop, heappush
+from itertools import count
+
+_deviceIds = count(1)
+
+def reserveDeviceIds(lastId):
+    """
+    This makes sure new devices get IDs above lastId, for when devices with saved IDs are restored.
+    """
+    global _deviceIds
+    nextId = next(_deviceIds)
+    _deviceIds = count(max(nextId, lastId + 1))
+
+class WashMode(IntEnum):
+    """
+    This is the code a washing machine stores for its wash mode, the names shown to the user are in WASH_MODE_NAMES.
+    """
+    DAILY_WASH = 0
+    QUICK_WASH = 1
+    ECO = 2
+
+WASH_MODE_NAMES = ("Daily wash", "Quick wash", "Eco")
+
+class SmartDevice():
+    """
+    This class is the parent that includes the defaults for any smart device, including the power status, and the ability to toggle the
+    power status. aswell as the empty variable for the name of a device.
+    Every device is given a stable ID when it is created, which the smart home uses to find it.
+    Devices use __slots__ and keep their name as a class attribute, so each one only stores its own state.
+    A device in a smart home is only changed while holding the home's lock, so it can be changed from any thread.
+    """
+    __slots__ = ("switchedOn", "deviceId", "home")
+    name = None
+
+    def __init__(self):
+        self.switchedOn = False
+        self.deviceId = next(_deviceIds)
+        self.home = None
+    def getDeviceId(self):
+        """
+        This returns the stable ID of the device.
+        """
+        return self.deviceId
+    def _whileLocked(self, change, *args):
+        """
+        This makes a change to the device while holding the lock of the home it is in. The home is checked again once the lock
+        is held, in case another thread took the device out of it meanwhile.
+        """
+        while True:
+            home = self.home
+            if home is None:
+                return change(*args)
+            with home.lock:
+                if self.home is home:
+                    return change(*args)
+    def toggleSwitch(self):
+        """
+        This method turns the Device on or off, and tells the smart home it belongs to so its totals stay up to date.
+        """
+        home = self.home
+        if home is not None:
+            with home.lock:
+                if self.home is home:
+                    self._toggle()
+                    return
+        self._whileLocked(self._toggle)
+    def _toggle(self):
+        """
+        This does the work of toggleSwitch for a caller that already holds the home's lock.
+        """
+        if self.switchedOn == False:
+            self.switchedOn = True
+        else:
+            self.switchedOn = False
+        if self.home is not None:
+            self.home._deviceToggled(self)
+    def getDeviceStatus(self):
+        """
+        this method returns whether or not the device is on.
+        """
+        if self.switchedOn == True:
+            return "On"
+        else: 
+            return "Off"
+
+    def getDeviceName(self):
+        """
+        This returns the device name.
+        """
+        return self.name
+
+class SmartPlug(SmartDevice):
+    """
+    This creates a Smart plug object that is by default turned off and has a default of zero consumption rate.
+    """
+    __slots__ = ("consumptionRate",)
+    name = "Smart Plug"
+
+    def __init__(self):
+        super().__init__()
+        self.consumptionRate = 0
+    def setConsumptionRate(self, rate):
+        """
+        This method sets the consumption rate of the plug, raising ValueError if the rate is not between 0 and 150.
+        """
+        if not 0 <= rate <= 150:
+            raise ValueError("Invalid consumption rate entered!")
+        self._whileLocked(self._setRate, rate)
+    def _setRate(self, rate):
+        oldRate = self.consumptionRate
+        self.consumptionRate = rate
+        if self.home is not None:
+            self.home._rateChanged(self, oldRate)
+    def getConsumptionRate(self):
+        """
+        This method returns the consumption rate of the plug.
+        """
+        return self.consumptionRate
+    def __str__(self):
+        if self.switchedOn == True:
+            status = "ON"
+        else:
+            status = "OFF"
+        output = "Smart plug: {} | Consumption rate: {}".format(status, self.consumptionRate)
+        return output
+
+class SmartWashingMachine(SmartDevice):
+    """
+    This creates a Smart washing machine obejct. 
+    The object contains whether it is on or off and a wash  mode. 
+    The available wash modes are Daily wash, Quick wash, Eco. The mode is stored as a WashMode code and the list of options
+    is shared by every washing machine.
+    """
+    __slots__ = ("washModeCode",)
+    name = "Smart Washing Machine"
+    washMode_list = WASH_MODE_NAMES
+    _washModeCodes = {name: WashMode(code) for code, name in enumerate(WASH_MODE_NAMES)}
+
+    def __init__(self):
+        super().__init__()
+        self.washModeCode = WashMode.DAILY_WASH
+    @property
+    def washMode(self):
+        return WASH_MODE_NAMES[self.washModeCode]
+    def setWashMode(self, mode):
+        """
+        This sets the wash mode of the device, only accepts "Daily wash", "Quick wash" or "Eco" and raises ValueError otherwise.
+        """
+        code = self._washModeCodes.get(mode)
+        if code is None:
+            raise ValueError("Invalid wash mode entered!")
+        self._whileLocked(self._setMode, code)
+    def _setMode(self, code):
+        self.washModeCode = code
+        if self.home is not None:
+            self.home._modeChanged(self)
+    def getWashMode(self):
+        """
+        This returns the current wash mode of the device.
+        """
+        return WASH_MODE_NAMES[self.washModeCode]
+    def getWashOptions(self):
+        """
+        This returns a list of the options for this device.
+        """
+        return self.washMode_list
+    def __str__(self):
+        if self.switchedOn == True:
+            status = "ON"
+        else:
+            status = "OFF"
+        output = "Washing machine: {} | Wash mode: {}".format(status, self.washMode)
+        return output
+
+class _OrderIndex():
+    """
+    This keeps the order of the device IDs in a smart home. Every ID sits in a numbered slot and a Fenwick tree counts the
+    occupied slots, so the position of an ID, the ID at a position, appending and removing all take O(log n).
+    Moving an ID takes a free slot between its new neighbours, the slots are respaced when there is no gap left. The slots are
+    sized from the number of IDs held, and are compacted once most of them are empty, so adding and removing IDs over and over
+    does not grow the index.
+    """
+    _GAP = 4
+    # Removing IDs compacts the slots once fewer than one in _SPARSE of them is in use.
+    _SPARSE = 16
+
+    def __init__(self):
+        self.slotOf = {}
+        self.slots = [None]
+        self.tree = [0]
+        self.lastSlot = 0
+    @classmethod
+    def fromIds(cls, ids):
+        """
+        This builds an order index holding the given IDs in order, filling slots 1 to n so the tree can be written directly
+        instead of adding the IDs one at a time.
+        """
+        index = cls()
+        size = len(ids)
+        capacity = 16
+        while capacity <= size:
+            capacity *= 2
+        index.slots = [None]
+        index.slots.extend(ids)
+        index.slots.extend([None] * (capacity - size - 1))
+        # A tree node covers the slots (slot - lowbit, slot], and only the slots up to size are occupied.
+        index.tree = [max(0, min(slot, size) - slot + (slot & -slot)) for slot in range(capacity)]
+        index.tree[0] = 0
+        index.slotOf = dict(zip(ids, range(1, size + 1)))
+        index.lastSlot = size
+        return index
+    def __len__(self):
+        return len(self.slotOf)
+    def __contains__(self, deviceId):
+        return deviceId in self.slotOf
+    def __iter__(self):
+        for deviceId in self.slots:
+            if deviceId is not None:
+                yield deviceId
+    def _add(self, slot, delta):
+        tree = self.tree
+        size = len(tree)
+        while slot < size:
+            tree[slot] += delta
+            slot += slot & -slot
+    def _prefix(self, slot):
+        tree = self.tree
+        total = 0
+        while slot > 0:
+            total += tree[slot]
+            slot -= slot & -slot
+        return total
+    def _select(self, position):
+        """
+        This returns the slot holding the ID at a position, walking down the Fenwick tree.
+        """
+        tree = self.tree
+        size = len(tree)
+        slot = 0
+        step = 1 << (size - 1).bit_length()
+        remaining = position + 1
+        while step:
+            nextSlot = slot + step
+            if nextSlot < size and tree[nextSlot] < remaining:
+                slot = nextSlot
+                remaining -= tree[nextSlot]
+            step >>= 1
+        return slot + 1
+    def _rebuild(self, gap, extra=0):
+        """
+        This respaces every ID with the given gap between slots and rebuilds the Fenwick tree in O(n).
+        """
+        ids = list(self)
+        capacity = 16
+        while capacity < (len(ids) + extra + 1) * gap:
+            capacity *= 2
+        slots = [None] * capacity
+        tree = [0] * capacity
+        slotOf = {}
+        slot = 0
+        for deviceId in ids:
+            slot += gap
+            slots[slot] = deviceId
+            tree[slot] = 1
+            slotOf[deviceId] = slot
+        for child in range(1, capacity):
+            parent = child + (child & -child)
+            if parent < capacity:
+                tree[parent] += tree[child]
+        self.slots = slots
+        self.tree = tree
+        self.slotOf = slotOf
+        self.lastSlot = slotOf[ids[-1]] if ids else 0
+    def _place(self, deviceId, slot):
+        self.slots[slot] = deviceId
+        self.slotOf[deviceId] = slot
+        self._add(slot, 1)
+        if slot > self.lastSlot:
+            self.lastSlot = slot
+    def append(self, deviceId):
+        """
+        This puts an ID at the end of the order.
+        """
+        slot = self.lastSlot + 1
+        if slot >= len(self.slots):
+            self._rebuild(1, len(self.slotOf))
+            slot = self.lastSlot + 1
+        self._place(deviceId, slot)
+    def insert(self, deviceId, position):
+        """
+        This puts an ID at the given position, shifting the later IDs along by one. A position past the end appends it.
+        """
+        if position < 0:
+            raise IndexError("device index out of range")
+        if position >= len(self.slotOf):
+            self.append(deviceId)
+            return
+        for attempt in range(2):
+            right = self._select(position)
+            left = self._select(position - 1) if position > 0 else 0
+            if right - left > 1:
+                self._place(deviceId, (left + right) // 2)
+                return
+            self._rebuild(self._GAP)
+        raise RuntimeError("no free slot for device {} at position {}".format(deviceId, position))
+    def remove(self, deviceId):
+        """
+        This takes an ID out of the order.
+        """
+        slot = self.slotOf.pop(deviceId)
+        self.slots[slot] = None
+        self._add(slot, -1)
+        if len(self.slots) > 64 and len(self.slotOf) * self._SPARSE < len(self.slots):
+            self._rebuild(self._GAP)
+    def position(self, deviceId):
+        """
+        This returns the position of an ID in the order.
+        """
+        return self._prefix(self.slotOf[deviceId]) - 1
+    def idAt(self, position):
+        """
+        This returns the ID at a position in the order.
+        """
+        if not 0 <= position < len(self.slotOf):
+            raise IndexError("device index out of range")
+        return self.slots[self._select(position)]
+
+class _DeviceView():
+    """
+    This is a read only, ordered view of the devices in a smart home. It supports len(), indexing, slicing, iteration, == and
+    repr() like the list of devices it replaces, without copying the devices until it is sliced, compared or printed.
+    """
+    def __init__(self, home):
+        self.home = home
+    def __len__(self):
+        return len(self.home.order)
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return list(self)[index]
+        return self.home.getDeviceAt(index)
+    def __eq__(self, other):
+        if isinstance(other, _DeviceView):
+            other = list(other)
+        return list(self) == other
+    def __repr__(self):
+        return repr(list(self))
+    def __iter__(self):
+        # The devices are copied out under the lock, so another thread changing the home cannot break the iteration.
+        home = self.home
+        with home.lock:
+            registry = home.registry
+            return iter([registry[deviceId] for deviceId in home.order])
+    def __contains__(self, device):
+        return self.home.registry.get(device.deviceId) is device
+
+class _QueryIndex():
+    """
+    This keeps secondary indexes over the devices of a smart home: the IDs of each device type, of the devices that are on and
+    off, and of the washing machines in each wash mode, plus a list of (consumptionRate, ID) pairs for the plugs kept sorted
+    so a range of rates is found by bisection. The home updates it on every change, so a query never scans the whole home.
+    """
+    def __init__(self):
+        self.byType = {}
+        self.byState = {True: set(), False: set()}
+        self.byMode = {mode: set() for mode in WashMode}
+        self.rates = []
+    @classmethod
+    def fromDevices(cls, devices):
+        """
+        This builds the indexes for many devices in one pass, sorting the rates once instead of inserting them one at a time.
+        """
+        index = cls()
+        for device in devices:
+            index._addSets(device)
+        index.rates = sorted((device.consumptionRate, device.deviceId) for device in devices if isinstance(device, SmartPlug))
+        return index
+    def _addSets(self, device):
+        deviceId = device.deviceId
+        self.byType.setdefault(device.getDeviceName(), set()).add(deviceId)
+        self.byState[device.switchedOn].add(deviceId)
+        if isinstance(device, SmartWashingMachine):
+            self.byMode[device.washModeCode].add(deviceId)
+    def add(self, device):
+        self._addSets(device)
+        if isinstance(device, SmartPlug):
+            insort(self.rates, (device.consumptionRate, device.deviceId))
+    def remove(self, device):
+        deviceId = device.deviceId
+        self.byType[device.getDeviceName()].discard(deviceId)
+        self.byState[device.switchedOn].discard(deviceId)
+        if isinstance(device, SmartWashingMachine):
+            self.byMode[device.washModeCode].discard(deviceId)
+        else:
+            self._removeRate(device.consumptionRate, deviceId)
+    def _removeRate(self, rate, deviceId):
+        position = bisect_left(self.rates, (rate, deviceId))
+        if position < len(self.rates) and self.rates[position] == (rate, deviceId):
+            del self.rates[position]
+    def toggled(self, device):
+        self.byState[not device.switchedOn].discard(device.deviceId)
+        self.byState[device.switchedOn].add(device.deviceId)
+    def rateChanged(self, device, oldRate):
+        self._removeRate(oldRate, device.deviceId)
+        insort(self.rates, (device.consumptionRate, device.deviceId))
+    def modeChanged(self, device):
+        for ids in self.byMode.values():
+            ids.discard(device.deviceId)
+        self.byMode[device.washModeCode].add(device.deviceId)
+    def rateRange(self, low=None, high=None):
+        """
+        This returns the IDs of the plugs with low <= consumptionRate <= high, in order of rate.
+        """
+        start = 0 if low is None else bisect_left(self.rates, (low,))
+        end = len(self.rates) if high is None else bisect_right(self.rates, (high, float("inf")))
+        return [deviceId for rate, deviceId in self.rates[start:end]]
+
+class _PriorityTotals():
+    """
+    This keeps the power drawn by the running plugs at each priority, with a Fenwick tree over the priorities in sorted order
+    so the power drawn below a priority is found in O(log n) rather than by adding up every level. A priority that starts
+    running plugs and is not in the tree yet is kept to one side until there are enough of them to be worth a rebuild, and a
+    priority whose last plug stops is dropped, from the tree once enough of its levels are empty.
+    """
+    def __init__(self):
+        # Only the priorities with running plugs are in used and plugs.
+        self.used = {}
+        self.plugs = {}
+        self.levels = []
+        self.slotOf = {}
+        self.tree = [0]
+        self.extra = set()
+        self.empty = 0
+    def _add(self, slot, delta):
+        tree = self.tree
+        size = len(tree)
+        while slot < size:
+            tree[slot] += delta
+            slot += slot & -slot
+    def _rebuild(self):
+        """
+        This rebuilds the tree over the priorities with running plugs in O(n), dropping the empty ones.
+        """
+        self.levels = sorted(self.used)
+        self.slotOf = {level: slot for slot, level in enumerate(self.levels, 1)}
+        tree = [0]
+        tree.extend(self.used[level] for level in self.levels)
+        size = len(tree)
+        for child in range(1, size):
+            parent = child + (child & -child)
+            if parent < size:
+                tree[parent] += tree[child]
+        self.tree = tree
+        self.extra = set()
+        self.empty = 0
+    def change(self, priority, delta):
+        """
+        This changes the power drawn at a priority when a running plug is re-rated.
+        """
+        self.used[priority] += delta
+        slot = self.slotOf.get(priority)
+        if slot is not None:
+            self._add(slot, delta)
+    def start(self, priority, rate):
+        """
+        This counts a plug starting to run at a priority.
+        """
+        if priority in self.plugs:
+            self.plugs[priority] += 1
+        else:
+            self.plugs[priority] = 1
+            self.used[priority] = 0
+            if priority in self.slotOf:
+                self.empty -= 1
+            else:
+                self.extra.add(priority)
+                if len(self.extra) > 16 and len(self.extra) ** 2 > len(self.levels):
+                    self._rebuild()
+        self.change(priority, rate)
+    def stop(self, priority, rate):
+        """
+        This counts a plug drawing rate at a priority stopping.
+        """
+        self.plugs[priority] -= 1
+        if self.plugs[priority]:
+            self.change(priority, -rate)
+            return
+        del self.plugs[priority]
+        rest = self.used.pop(priority)
+        if priority in self.extra:
+            self.extra.discard(priority)
+            return
+        self._add(self.slotOf[priority], -rest)
+        self.empty += 1
+        if self.empty > 16 and 2 * self.empty > len(self.levels):
+            self._rebuild()
+    def below(self, priority):
+        """
+        This returns the power drawn by the running plugs with a lower priority.
+        """
+        slot = bisect_left(self.levels, priority)
+        tree = self.tree
+        total = 0
+        while slot > 0:
+            total += tree[slot]
+            slot -= slot & -slot
+        return total + sum(self.used[level] for level in self.extra if level < priority)
+
+# Rates are added and taken away as floats, so the power budget allows for rounding errors this small.
+_BUDGET_SLACK = 1e-9
+
+class _PowerBudget():
+    """
+    This decides which smart plugs may be on so their total consumption stays under a cap. A plug that is switched on asks to
+    run: it runs if it fits under the cap, or if switching off running plugs of lower priority makes it fit, and otherwise it
+    is switched off again and waits. When a plug is re-rated above the room left, the running plugs with the lowest priority
+    are switched off until the rest fit. Whenever room frees up the waiting plugs are let on strictly in order of priority,
+    and then in the order they asked, so a small plug never jumps the queue ahead of a bigger one with a higher priority.
+    Plugs that draw nothing are never held back.
+    The running plugs are kept in a min-heap by priority, so the next one to switch off is found in O(log n), and the waiting
+    plugs in a max-heap, so the next one to let on is too. Changes only leave the old heap entries behind, and a heap is
+    rebuilt without them once most of it is stale, so a change costs O(log n) for each plug it switches rather than a pass
+    over every plug. The power drawn at each priority is kept in a _PriorityTotals, so deciding whether switching off lower
+    priority plugs makes room for a waiting one does not add up every priority either.
+    """
+    def __init__(self, home, cap):
+        self.home = home
+        self.cap = cap
+        self.used = 0
+        self.usedByPriority = _PriorityTotals()
+        # Running and waiting plugs map to the stamp of their live heap entry, and any other entry for them is stale.
+        self.admitted = {}
+        self.waiting = {}
+        self.admittedHeap = []
+        self.waitingHeap = []
+        self.sequence = count()
+        self.touched = set()
+        self.dirty = False
+        self.switching = False
+    def _priority(self, deviceId):
+        return self.home.priorities.get(deviceId, 0)
+    def _admit(self, deviceId, rate):
+        stamp = next(self.sequence)
+        priority = self._priority(deviceId)
+        self.admitted[deviceId] = stamp
+        heappush(self.admittedHeap, (priority, -stamp, deviceId))
+        self.used += rate
+        self.usedByPriority.start(priority, rate)
+        self.touched.add(deviceId)
+    def _unadmit(self, deviceId, priority, rate):
+        del self.admitted[deviceId]
+        self.used -= rate
+        self.usedByPriority.stop(priority, rate)
+        self.touched.add(deviceId)
+    def _wait(self, deviceId):
+        stamp = next(self.sequence)
+        self.waiting[deviceId] = stamp
+        heappush(self.waitingHeap, (-self._priority(deviceId), stamp, deviceId))
+        self.touched.add(deviceId)
+    def _lowestAdmitted(self):
+        heap = self.admittedHeap
+        while heap and self.admitted.get(heap[0][2]) != -heap[0][1]:
+            heappop(heap)
+        return heap[0] if heap else None
+    def _firstWaiting(self):
+        heap = self.waitingHeap
+        while heap and self.waiting.get(heap[0][2]) != heap[0][1]:
+            heappop(heap)
+        return heap[0] if heap else None
+    def _compact(self):
+        if len(self.admittedHeap) > 64 and len(self.admittedHeap) > 2 * len(self.admitted):
+            self.admittedHeap = [(self._priority(deviceId), -stamp, deviceId) for deviceId, stamp in self.admitted.items()]
+            heapify(self.admittedHeap)
+        if len(self.waitingHeap) > 64 and len(self.waitingHeap) > 2 * len(self.waiting):
+            self.waitingHeap = [(-self._priority(deviceId), stamp, deviceId) for deviceId, stamp in self.waiting.items()]
+            heapify(self.waitingHeap)
+    def request(self, device):
+        """
+        This is called when a plug asks to run. A plug that is already running or waiting keeps its place.
+        """
+        deviceId = device.deviceId
+        if deviceId in self.admitted or deviceId in self.waiting:
+            self.touched.add(deviceId)
+        elif device.consumptionRate == 0:
+            self._admit(deviceId, 0)
+        else:
+            self._wait(deviceId)
+        self.dirty = True
+    def withdraw(self, device, rate=None):
+        """
+        This is called when a plug no longer asks to run, and returns whether it was waiting.
+        """
+        deviceId = device.deviceId
+        if deviceId in self.admitted:
+            self._unadmit(deviceId, self._priority(deviceId), device.consumptionRate if rate is None else rate)
+            self.dirty = True
+            return False
+        if deviceId in self.waiting:
+            del self.waiting[deviceId]
+            self.dirty = True
+            return True
+        return False
+    def withdrawWaiting(self):
+        """
+        This drops every waiting plug, and returns them in the order they would have been let on.
+        """
+        registry = self.home.registry
+        waiting = [registry[deviceId] for deviceId in self.waitingOrder()]
+        self.waiting = {}
+        self.waitingHeap = []
+        return waiting
+    def waitingOrder(self):
+        return sorted(self.waiting, key=lambda deviceId: (-self._priority(deviceId), self.waiting[deviceId]))
+    def toggled(self, device):
+        if self.switching or not isinstance(device, SmartPlug):
+            return
+        if device.switchedOn:
+            self.request(device)
+        else:
+            self.withdraw(device)
+    def rateChanged(self, device, oldRate):
+        deviceId = device.deviceId
+        if deviceId in self.admitted:
+            change = device.consumptionRate - oldRate
+            self.used += change
+            self.usedByPriority.change(self._priority(deviceId), change)
+            self.dirty = True
+        elif deviceId in self.waiting:
+            if device.consumptionRate == 0:
+                del self.waiting[deviceId]
+                self._admit(deviceId, 0)
+            self.dirty = True
+    def priorityChanged(self, device, oldPriority):
+        deviceId = device.deviceId
+        if deviceId in self.admitted:
+            self._unadmit(deviceId, oldPriority, device.consumptionRate)
+            self._admit(deviceId, device.consumptionRate)
+        elif deviceId in self.waiting:
+            self._wait(deviceId)
+        else:
+            return
+        self.dirty = True
+    def added(self, device):
+        if isinstance(device, SmartPlug) and device.switchedOn:
+            self.request(device)
+    def deleted(self, device):
+        if isinstance(device, SmartPlug):
+            self.withdraw(device)
+            self.touched.discard(device.deviceId)
+    def _shedLowest(self, kept):
+        """
+        This switches off the running plug with the lowest priority, setting aside plugs that draw nothing in kept.
+        """
+        entry = heappop(self.admittedHeap)
+        priority, stamp, deviceId = entry
+        rate = self.home.registry[deviceId].consumptionRate
+        if rate == 0:
+            kept.append(entry)
+            return
+        self._unadmit(deviceId, priority, rate)
+        self._wait(deviceId)
+    def rebalance(self):
+        """
+        This switches off the lowest priority plugs until the running ones fit under the cap, lets waiting plugs on while
+        they fit, and then switches every plug whose place has changed to match.
+        """
+        registry = self.home.registry
+        cap = self.cap + _BUDGET_SLACK
+        kept = []
+        while self.used > cap and self._lowestAdmitted() is not None:
+            self._shedLowest(kept)
+        while True:
+            entry = self._firstWaiting()
+            if entry is None:
+                break
+            priority, deviceId = -entry[0], entry[2]
+            rate = registry[deviceId].consumptionRate
+            if self.used + rate > cap:
+                lower = self.usedByPriority.below(priority)
+                if self.used - lower + rate > cap:
+                    break
+                while self.used + rate > cap:
+                    self._lowestAdmitted()
+                    self._shedLowest(kept)
+            heappop(self.waitingHeap)
+            del self.waiting[deviceId]
+            self._admit(deviceId, rate)
+        for entry in kept:
+            heappush(self.admittedHeap, entry)
+        self._compact()
+        # Plugs are switched off before any are switched on, so the total never goes over the cap on the way.
+        devices = sorted((registry[deviceId] for deviceId in self.touched if deviceId in registry),
+                         key=lambda device: (device.deviceId in self.admitted, device.deviceId))
+        self.touched = set()
+        self.switching = True
+        try:
+            for device in devices:
+                if device.switchedOn != (device.deviceId in self.admitted):
+                    device._toggle()
+        finally:
+            self.switching = False
+        self.dirty = False
+    def verify(self):
+        """
+        This asserts the running totals match the running plugs, and once the budget has settled that exactly the running
+        plugs are on and they fit under the cap.
+        """
+        registry = self.home.registry
+        assert not set(self.admitted) & set(self.waiting), "a plug is both running and waiting"
+        used = {}
+        for deviceId in self.admitted:
+            priority = self._priority(deviceId)
+            used[priority] = used.get(priority, 0) + registry[deviceId].consumptionRate
+        assert abs(sum(used.values()) - self.used) < 1e-6, "budget use {} != {}".format(self.used, sum(used.values()))
+        totals = self.usedByPriority
+        assert set(used) <= set(totals.used), "a priority with running plugs has no total"
+        for priority in totals.used:
+            assert abs(used.get(priority, 0) - totals.used[priority]) < 1e-6, \
+                "budget use at priority {} is wrong".format(priority)
+            lower = sum(rate for level, rate in used.items() if level < priority)
+            assert abs(totals.below(priority) - lower) < 1e-6, "budget use below priority {} is wrong".format(priority)
+        if not self.dirty:
+            assert self.used <= self.cap + 1e-6, "budget use {} is over the cap {}".format(self.used, self.cap)
+            onPlugs = self.home.queryIndex.byState[True] & self.home.queryIndex.byType.get(SmartPlug.name, set())
+            assert onPlugs == set(self.admitted), "the plugs that are on are not the running plugs"
+
+def _switchBack(device):
+    """
+    This returns a batch undo action that puts a device back to the on/off state it is in now. It is made before the device is
+    switched, and does nothing if the switch never happened.
+    """
+    switchedOn = device.switchedOn
+    def undo():
+        if device.switchedOn != switchedOn:
+            device._toggle()
+    return undo
+
+def _locked(method):
+    """
+    This makes a SmartHome method hold the home's lock while it runs.
+    """
+    @wraps(method)
+    def locked(self, *args, **kwargs):
+        with self.lock:
+            return method(self, *args, **kwargs)
+    return locked
+
+# One device in a HomeSnapshot. consumptionRate is None for washing machines and washMode is None for plugs.
+DeviceState = namedtuple("DeviceState", ("deviceId", "name", "switchedOn", "consumptionRate", "washMode"))
+
+class HomeSnapshot():
+    """
+    This is a read-only copy of a smart home at one moment between changes: its devices in order as DeviceState tuples, and
+    the totals that go with them. Any thread can read it without holding the home's lock.
+    """
+    __slots__ = ("devices", "onCount", "onCountByType", "consumption")
+
+    def __init__(self, devices, onCount, onCountByType, consumption):
+        self.devices = devices
+        self.onCount = onCount
+        self.onCountByType = onCountByType
+        self.consumption = consumption
+    def __len__(self):
+        return len(self.devices)
+    def __iter__(self):
+        return iter(self.devices)
+
+class SmartHome():
+    """
+    This creates a smart home object in which a group of devices can be stored.
+    The devices are kept in a registry keyed by their stable ID, with a separate order index that gives every device its
+    position, so devices can be found, toggled, deleted and moved without scanning the whole home.
+    The home also keeps live totals of the devices that are on, which the devices update as they change. With
+    checkConsistency set, every change recomputes the totals from scratch and asserts they match.
+    Listeners added with addListener are called as listener(event, device) straight after every change, even inside a
+    batch, where event is one of "add", "delete", "toggle", "rate", "mode" or "move". Change listeners added with
+    addChangeListener are called once per change, or once per batch of changes, with the list of (event, device) pairs.
+    Secondary indexes by device type, on/off state, wash mode and consumption rate are kept up to date as well, and
+    findDevices() and getPlugsByRate() answer queries from them.
+    With setPowerBudget() the home keeps the total consumption of its plugs under a cap, switching plugs on and off by the
+    priorities given with setPriority().
+    The home can be used from many threads. Every change, and every read that walks the devices, holds the home's lock, and a
+    batch holds it until the batch ends, so other threads never see half of a change. Listeners are called on the thread
+    that made the change while it still holds the lock, so they must not wait on another thread that uses the home.
+    snapshot() gives readers a copy of the whole home that is only rebuilt after the home has changed.
+    """
+    def __init__(self, checkConsistency=False):
+        self.registry = {}
+        self.order = _OrderIndex()
+        self.onCount = 0
+        self.onCountByType = {}
+        self.onConsumption = 0
+        self.queryIndex = _QueryIndex()
+        self.priorities = {}
+        self.powerBudget = None
+        self.checkConsistency = checkConsistency
+        self.listeners = []
+        self.changeListeners = []
+        self.observed = False
+        self.batchDepth = 0
+        self.pendingChanges = []
+        self.lock = threading.RLock()
+        self.snapshotCache = None
+        self.snapshotWatched = False
+        self.batchThread = None
+    @_locked
+    def addListener(self, listener):
+        """
+        This registers a callable to be told about every change to the home.
+        """
+        self.listeners.append(listener)
+        self.observed = True
+    @_locked
+    def removeListener(self, listener):
+        """
+        This stops a listener being told about changes to the home.
+        """
+        self.listeners.remove(listener)
+        self.observed = bool(self.listeners or self.changeListeners)
+    @_locked
+    def addChangeListener(self, listener):
+        """
+        This registers a callable to be given the list of changes after every change or batch of changes.
+        """
+        self.changeListeners.append(listener)
+        self.observed = True
+    @_locked
+    def removeChangeListener(self, listener):
+        """
+        This stops a change listener being told about changes to the home.
+        """
+        self.changeListeners.remove(listener)
+        self.observed = bool(self.listeners or self.changeListeners)
+    def _notify(self, event, device):
+        # Listeners read the device as it is now, so they are called straight away even inside a batch, where a later change
+        # could otherwise move or switch the device before they see it. Only the change listeners wait for the batch to end.
+        for listener in self.listeners:
+            listener(event, device)
+        if self.batchDepth:
+            self.pendingChanges.append((event, device))
+            return
+        for listener in self.changeListeners:
+            listener([(event, device)])
+    @contextmanager
+    def batchChanges(self):
+        """
+        This groups the changes made inside a with block, so change listeners get a single notification once the block
+        ends. Listeners added with addListener still hear about each change as it is made. The power budget switches plugs
+        as the outermost batch ends, and change listeners hear about those switches in the same notification. The home's
+        lock is held until the batch ends.
+        """
+        with self.lock:
+            self.batchDepth += 1
+            self.batchThread = threading.get_ident()
+            try:
+                yield
+            finally:
+                if self.batchDepth == 1 and self.powerBudget is not None and self.powerBudget.dirty:
+                    self.powerBudget.rebalance()
+                self.batchDepth -= 1
+                if self.batchDepth == 0:
+                    self.batchThread = None
+                if self.batchDepth == 0 and self.pendingChanges:
+                    changes = self.pendingChanges
+                    self.pendingChanges = []
+                    for listener in self.changeListeners:
+                        listener(changes)
+    def snapshot(self):
+        """
+        This returns a HomeSnapshot of the home. The snapshot is copied once and shared by every reader until the home next
+        changes, so reading it often costs nothing while the home is not changing. Other threads keep getting the shared
+        snapshot while a batch runs, but the thread running the batch gets a fresh copy with its changes so far, which is not
+        shared because the batch is not finished.
+        """
+        snapshot = self.snapshotCache
+        # Only the thread running a batch can see batchThread set to itself, so other threads can skip the lock.
+        if snapshot is not None and self.batchThread != threading.get_ident():
+            return snapshot
+        with self.lock:
+            if self.snapshotCache is not None and not self.batchDepth:
+                return self.snapshotCache
+            if not self.snapshotWatched:
+                self.addChangeListener(self._dropSnapshot)
+                self.snapshotWatched = True
+            registry = self.registry
+            devices = tuple(DeviceState(device.deviceId, device.name, device.switchedOn,
+                                        device.consumptionRate if isinstance(device, SmartPlug) else None,
+                                        device.getWashMode() if isinstance(device, SmartWashingMachine) else None)
+                            for device in (registry[deviceId] for deviceId in self.order))
+            snapshot = HomeSnapshot(devices, self.onCount, dict(self.onCountByType), self.onConsumption)
+            if not self.batchDepth:
+                self.snapshotCache = snapshot
+            return snapshot
+    def _dropSnapshot(self, changes):
+        self.snapshotCache = None
+    def getDevices(self):
+        """
+        this returns a group of all the devices in the smart home object, in order.
+        """
+        return _DeviceView(self)
+    @_locked
+    def getDeviceAt(self, index):
+        """
+        This retruns the specific device at a certain index in the smart home object.
+        """
+        if index < 0:
+            index += len(self.order)
+        return self.registry[self.order.idAt(index)]
+    def getDevice(self, deviceId):
+        """
+        This returns the device with the given ID.
+        """
+        return self.registry[deviceId]
+    @_locked
+    def addDevice(self, device):
+        """
+        This adds a device to the end of the smart home object.
+        """
+        if device.deviceId in self.registry:
+            print("Entered device already in smart home")
+            return
+        if device.home is not None:
+            print("Entered device already in another smart home")
+            return
+        self.registry[device.deviceId] = device
+        self.order.append(device.deviceId)
+        device.home = self
+        self.queryIndex.add(device)
+        if device.switchedOn:
+            self._countOn(device, 1)
+        if self.powerBudget is not None:
+            self.powerBudget.added(device)
+        if self.checkConsistency:
+            self.verifyAggregates()
+        if self.observed:
+            self._notify("add", device)
+        if self.powerBudget is not None:
+            self._settleBudget()
+    @_locked
+    def addDevices(self, devices):
+        """
+        This adds many devices to the end of the smart home object at once. Adding to an empty home builds the order index
+        and totals in one pass, which is how saved homes are restored. Every device is checked first, so a device that is
+        already in a smart home, or listed twice, raises ValueError and nothing is added.
+        """
+        devices = list(devices)
+        for device in devices:
+            if device.home is not None:
+                raise ValueError("Entered device already in another smart home")
+        ids = [device.deviceId for device in devices]
+        registry = dict(zip(ids, devices))
+        if len(registry) != len(devices) or any(deviceId in self.registry for deviceId in ids):
+            raise ValueError("Entered devices are not unique")
+        if self.registry:
+            for device in devices:
+                self.addDevice(device)
+            return
+        for device in devices:
+            device.home = self
+        self.registry = registry
+        self.order = _OrderIndex.fromIds(ids)
+        self.onCount, self.onCountByType, self.onConsumption = self._computeAggregates()
+        self.queryIndex = _QueryIndex.fromDevices(devices)
+        if self.powerBudget is not None:
+            for device in devices:
+                self.powerBudget.added(device)
+        if self.observed:
+            with self.batchChanges():
+                for device in devices:
+                    self._notify("add", device)
+        elif self.powerBudget is not None:
+            self._settleBudget()
+    @_locked
+    def toggleSwitch(self, index):
+        """
+        This turns the device at a certain index on or off.
+        """
+        if index < 0:
+            index += len(self.order)
+        self.registry[self.order.idAt(index)]._toggle()
+    @_locked
+    def toggleSwitchById(self, deviceId):
+        """
+        This turns the device with the given ID on or off.
+        """
+        self.registry[deviceId]._toggle()
+    @_locked
+    def turnOnAll(self):
+        """
+        This turns on all the devices inside a smart home object, and returns the devices that were switched on.
+        """
+        changed = [self.registry[deviceId] for deviceId in self.queryIndex.byState[False]]
+        # The lock is already held here, so the devices are switched without taking it again for each one.
+        with self.batchChanges():
+            for device in changed:
+                device._toggle()
+        return changed
+    @_locked
+    def turnOffAll(self):
+        """
+        This turns off all the devices inside a smart home object, and returns the devices that were switched off. Plugs
+        waiting for room under the power budget stop waiting.
+        """
+        if self.powerBudget is not None:
+            self.powerBudget.withdrawWaiting()
+        changed = [self.registry[deviceId] for deviceId in self.queryIndex.byState[True]]
+        with self.batchChanges():
+            for device in changed:
+                device._toggle()
+        return changed
+    @_locked
+    def applyBatch(self, commands):
+        """
+        This applies a list of commands as one unit. Every command is checked before anything is changed, so a bad command
+        raises ValueError (or KeyError for an unknown device ID) and leaves the home untouched. If applying still fails part way,
+        for example because a listener raises, every change already made is undone, including those of a command that only
+        got part way through, and the error is raised. Change listeners get a single notification once the whole batch has been
+        applied, and hear nothing when it is undone. Listeners added with addListener hear each change as it is made, and the
+        changes that undo them too. Returns the list of (event, device) changes, which leaves out the plugs the
+        power budget switches in response.
+        Commands are tuples:
+            ("toggle", deviceId), ("switchOn", deviceId), ("switchOff", deviceId),
+            ("setConsumptionRate", deviceId, rate), ("setWashMode", deviceId, mode),
+            ("turnOnAll",) and ("turnOffAll",), optionally followed by a device name to only switch devices of that type.
+        """
+        steps = [self._checkCommand(number, command) for number, command in enumerate(commands)]
+        # The changes are collected even when nobody is listening, so they can be returned.
+        self.observed = True
+        try:
+            with self.batchChanges():
+                start = len(self.pendingChanges)
+                undo = []
+                try:
+                    for step in steps:
+                        step(undo)
+                except BaseException:
+                    for action in reversed(undo):
+                        # A listener that fails again while the batch is undone must not stop the rest being undone.
+                        try:
+                            action()
+                        except Exception:
+                            pass
+                    del self.pendingChanges[start:]
+                    raise
+                changes = self.pendingChanges[start:]
+        finally:
+            self.observed = bool(self.listeners or self.changeListeners)
+        return changes
+    def _checkCommand(self, number, command):
+        """
+        This checks one batch command and returns a function that applies it. The function is given the list of undo actions
+        and adds the one for each change before making it, so a command that fails part way can still be undone.
+        """
+        if not command:
+            raise ValueError("command {} is empty".format(number))
+        op, args = command[0], command[1:]
+        if op in ("turnOnAll", "turnOffAll"):
+            if len(args) > 1:
+                raise ValueError("command {}: {} takes at most a device name".format(number, op))
+            name = args[0] if args else None
+            on = op == "turnOnAll"
+            def apply(undo):
+                if not on and self.powerBudget is not None and name in (None, SmartPlug.name):
+                    budget = self.powerBudget
+                    undo.extend(lambda device=device: budget.request(device) for device in reversed(budget.withdrawWaiting()))
+                ids = self.queryIndex.byState[not on]
+                if name is not None:
+                    ids = ids & self.queryIndex.byType.get(name, set())
+                for device in [self.registry[deviceId] for deviceId in ids]:
+                    undo.append(_switchBack(device))
+                    device._toggle()
+            return apply
+        expected = {"toggle": 1, "switchOn": 1, "switchOff": 1, "setConsumptionRate": 2, "setWashMode": 2}
+        if op not in expected:
+            raise ValueError("command {}: unknown command {!r}".format(number, op))
+        if len(args) != expected[op]:
+            raise ValueError("command {}: {} takes {} arguments".format(number, op, expected[op]))
+        if args[0] not in self.registry:
+            raise KeyError("command {}: no device with ID {}".format(number, args[0]))
+        device = self.registry[args[0]]
+        if op == "toggle":
+            def apply(undo):
+                undo.append(_switchBack(device))
+                device._toggle()
+            return apply
+        if op in ("switchOn", "switchOff"):
+            on = op == "switchOn"
+            def apply(undo):
+                if device.switchedOn == on:
+                    # Switching off a plug that is waiting for room under the power budget stops it waiting.
+                    budget = self.powerBudget
+                    if not on and budget is not None and isinstance(device, SmartPlug) and budget.withdraw(device):
+                        undo.append(lambda: budget.request(device))
+                    return
+                undo.append(_switchBack(device))
+                device._toggle()
+            return apply
+        if op == "setConsumptionRate":
+            rate = args[1]
+            if not isinstance(device, SmartPlug):
+                raise ValueError("command {}: device {} is not a smart plug".format(number, device.deviceId))
+            if not 0 <= rate <= 150:
+                raise ValueError("command {}: Invalid consumption rate entered!".format(number))
+            def apply(undo):
+                oldRate = device.consumptionRate
+                undo.append(lambda: device.setConsumptionRate(oldRate))
+                device.setConsumptionRate(rate)
+            return apply
+        mode = args[1]
+        if not isinstance(device, SmartWashingMachine):
+            raise ValueError("command {}: device {} is not a smart washing machine".format(number, device.deviceId))
+        if mode not in WASH_MODE_NAMES:
+            raise ValueError("command {}: Invalid wash mode entered!".format(number))
+        def apply(undo):
+            oldMode = device.getWashMode()
+            undo.append(lambda: device.setWashMode(oldMode))
+            device.setWashMode(mode)
+        return apply
+    @_locked
+    def deleteDeviceAt(self, index):
+        """
+        This command deletes a device from the smart home object given the index of said device.
+        """
+        if index < 0:
+            index += len(self.order)
+        self.deleteDevice(self.order.idAt(index))
+    @_locked
+    def deleteDevice(self, deviceId):
+        """
+        This command deletes the device with the given ID from the smart home object.
+        """
+        device = self.registry.pop(deviceId)
+        self.order.remove(deviceId)
+        self.queryIndex.remove(device)
+        device.home = None
+        if device.switchedOn:
+            self._countOn(device, -1)
+        if self.powerBudget is not None:
+            self.powerBudget.deleted(device)
+        self.priorities.pop(deviceId, None)
+        if self.checkConsistency:
+            self.verifyAggregates()
+        if self.observed:
+            self._notify("delete", device)
+        if self.powerBudget is not None:
+            self._settleBudget()
+    @_locked
+    def moveDevice(self, deviceId, index):
+        """
+        This command moves the device with the given ID to a new index in the smart home object. A negative index counts
+        from the end, and an index outside the home raises IndexError.
+        """
+        if deviceId not in self.registry:
+            raise KeyError(deviceId)
+        if index < 0:
+            index += len(self.order)
+        if not 0 <= index < len(self.order):
+            raise IndexError("device index out of range")
+        self.order.remove(deviceId)
+        self.order.insert(deviceId, index)
+        if self.observed:
+            self._notify("move", self.registry[deviceId])
+    @_locked
+    def getIndex(self, device):
+        """
+        This command returns the index of a given device in the smart home.
+        """
+        if self.registry.get(device.deviceId) is device:
+            return self.order.position(device.deviceId)
+        else:
+            print("Entered device not in smart home")
+    @_locked
+    def __str__(self):
+        output = "Your smart home contains:\n"
+        for device in self.getDevices():
+            output += "{}\n".format(device)
+        return output
+    def _countOn(self, device, sign):
+        """
+        This adds (sign 1) or removes (sign -1) a switched on device from the running totals.
+        """
+        self.onCount += sign
+        name = device.getDeviceName()
+        self.onCountByType[name] = self.onCountByType.get(name, 0) + sign
+        if isinstance(device, SmartPlug):
+            self.onConsumption += sign * device.consumptionRate
+    def _deviceToggled(self, device):
+        """
+        This is called by a device in the home after it has been turned on or off.
+        """
+        self._countOn(device, 1 if device.switchedOn else -1)
+        self.queryIndex.toggled(device)
+        if self.powerBudget is not None:
+            self.powerBudget.toggled(device)
+        if self.checkConsistency:
+            self.verifyAggregates()
+        if self.observed:
+            self._notify("toggle", device)
+        if self.powerBudget is not None:
+            self._settleBudget()
+    def _rateChanged(self, device, oldRate):
+        """
+        This is called by a plug in the home after its consumption rate has changed.
+        """
+        if device.switchedOn:
+            self.onConsumption += device.consumptionRate - oldRate
+        self.queryIndex.rateChanged(device, oldRate)
+        if self.powerBudget is not None:
+            self.powerBudget.rateChanged(device, oldRate)
+        if self.checkConsistency:
+            self.verifyAggregates()
+        if self.observed:
+            self._notify("rate", device)
+        if self.powerBudget is not None:
+            self._settleBudget()
+    def _modeChanged(self, device):
+        """
+        This is called by a washing machine in the home after its wash mode has changed.
+        """
+        self.queryIndex.modeChanged(device)
+        if self.observed:
+            self._notify("mode", device)
+    def countTotalOn(self):
+        """
+        This command returns a count of the total smart devices that are currently turned on.
+        """
+        return self.onCount
+    def countTotalOnByType(self, name):
+        """
+        This command returns how many devices with the given device name are currently turned on.
+        """
+        return self.onCountByType.get(name, 0)
+    def getTotalConsumption(self):
+        """
+        This command returns the total consumption rate of the smart plugs that are currently turned on.
+        """
+        return self.onConsumption
+    @_locked
+    def findDevices(self, name=None, switchedOn=None, washMode=None, minRate=None, maxRate=None):
+        """
+        This command returns the devices that match every condition given, in order. name is a device name such as
+        "Smart Plug", switchedOn is True or False, washMode is one of WASH_MODE_NAMES, and minRate and maxRate bound the
+        consumption rate of smart plugs. Each condition is looked up in an index and the smallest match is checked against the
+        others, so only the matching devices are looked at.
+        """
+        index = self.queryIndex
+        candidates = []
+        if name is not None:
+            candidates.append(index.byType.get(name, set()))
+        if switchedOn is not None:
+            candidates.append(index.byState[bool(switchedOn)])
+        if washMode is not None:
+            if washMode not in WASH_MODE_NAMES:
+                raise ValueError("Invalid wash mode entered!")
+            candidates.append(index.byMode[WashMode(WASH_MODE_NAMES.index(washMode))])
+        if minRate is not None or maxRate is not None:
+            candidates.append(set(index.rateRange(minRate, maxRate)))
+        if not candidates:
+            return list(self.getDevices())
+        candidates.sort(key=len)
+        ids = [deviceId for deviceId in candidates[0] if all(deviceId in others for others in candidates[1:])]
+        ids.sort(key=self.order.position)
+        return [self.registry[deviceId] for deviceId in ids]
+    @_locked
+    def getPlugsByRate(self, minRate=None, maxRate=None):
+        """
+        This command returns the smart plugs with a consumption rate between minRate and maxRate inclusive, lowest rate first.
+        """
+        return [self.registry[deviceId] for deviceId in self.queryIndex.rateRange(minRate, maxRate)]
+    @_locked
+    def setPowerBudget(self, cap, priorities=None):
+        """
+        This command limits the total consumption of the plugs that are on to cap, and can set many priorities at once from a
+        dict of device ID to priority. From then on, whenever a plug is switched on or re-rated, the home works out which
+        plugs may be on and switches the rest off until there is room for them, highest priority first. Raises ValueError
+        if the cap is negative.
+        """
+        if cap < 0:
+            raise ValueError("Invalid power budget entered!")
+        with self.batchChanges():
+            for deviceId, priority in (priorities or {}).items():
+                self.setPriority(deviceId, priority)
+            if self.powerBudget is None:
+                self.powerBudget = _PowerBudget(self, cap)
+                for deviceId in self.order:
+                    self.powerBudget.added(self.registry[deviceId])
+            self.powerBudget.cap = cap
+            self.powerBudget.dirty = True
+    @_locked
+    def clearPowerBudget(self):
+        """
+        This command stops limiting the total consumption. Plugs waiting for room stay off.
+        """
+        self.powerBudget = None
+    def getPowerBudget(self):
+        """
+        This command returns the consumption cap, or None when there is no power budget.
+        """
+        return self.powerBudget.cap if self.powerBudget is not None else None
+    @_locked
+    def setPriority(self, deviceId, priority):
+        """
+        This command sets the priority of a smart plug under the power budget. Plugs with a higher priority are let on first
+        and switched off last, and every plug starts at priority 0. Raises ValueError for a device that is not a smart plug.
+        """
+        device = self.registry[deviceId]
+        if not isinstance(device, SmartPlug):
+            raise ValueError("Only smart plugs have a priority!")
+        oldPriority = self.priorities.get(deviceId, 0)
+        self.priorities[deviceId] = priority
+        if self.powerBudget is not None and priority != oldPriority:
+            self.powerBudget.priorityChanged(device, oldPriority)
+            self._settleBudget()
+    def getPriority(self, deviceId):
+        """
+        This command returns the priority of a smart plug under the power budget.
+        """
+        return self.priorities.get(deviceId, 0)
+    @_locked
+    def getWaitingPlugs(self):
+        """
+        This command returns the plugs that have been switched on but are held off until there is room under the power
+        budget, in the order they will be let on.
+        """
+        if self.powerBudget is None:
+            return []
+        return [self.registry[deviceId] for deviceId in self.powerBudget.waitingOrder()]
+    def _settleBudget(self):
+        """
+        This lets the power budget switch plugs after a change. Inside a batch it waits for the outermost batch to end, and
+        otherwise its switches are grouped into a batch of their own.
+        """
+        if self.powerBudget.dirty and not self.batchDepth:
+            with self.batchChanges():
+                pass
+    def _computeAggregates(self):
+        """
+        This computes the totals from scratch by looking at every device.
+        """
+        count = 0
+        byType = {}
+        consumption = 0
+        for device in self.registry.values():
+            if device.switchedOn:
+                count += 1
+                name = device.getDeviceName()
+                byType[name] = byType.get(name, 0) + 1
+                if isinstance(device, SmartPlug):
+                    consumption += device.consumptionRate
+        return count, byType, consumption
+    @_locked
+    def verifyAggregates(self):
+        """
+        This command recomputes the totals and query indexes from every device and asserts they match the running ones.
+        """
+        count, byType, consumption = self._computeAggregates()
+        assert count == self.onCount, "on count {} != {}".format(self.onCount, count)
+        for name in set(byType) | set(self.onCountByType):
+            assert byType.get(name, 0) == self.onCountByType.get(name, 0), "on count for {} is wrong".format(name)
+        assert abs(consumption - self.onConsumption) < 1e-6, "consumption {} != {}".format(self.onConsumption, consumption)
+        expected = _QueryIndex.fromDevices(list(self.registry.values()))
+        index = self.queryIndex
+        assert {name: ids for name, ids in index.byType.items() if ids} == expected.byType, "type index is wrong"
+        assert index.byState == expected.byState, "on/off index is wrong"
+        assert index.byMode == expected.byMode, "wash mode index is wrong"
+        assert index.rates == expected.rates, "consumption rate index is wrong"
+        if self.powerBudget is not None:
+            self.powerBudget.verify()
+        return True
+    def displayTotalOn(self, frame):
+        """
+        This command calculates the total number of devices that are on and displays the total that are on.
+        The Tk view layer is only imported here, so the model itself can be used without a display.
+        """
+        import tkview
+        self.totalOnLabel = tkview.totalOnLabel(frame, self.onCount)
+    def updateTotalOn(self, count=None):
+        """
+        This command updates the total on label to the inputted count, or to the running total if no count is given.
+        """
+        if count is None:
+            count = self.onCount
+        self.totalOnLabel.configure(text="Total activated: {}".format(count))
+
+
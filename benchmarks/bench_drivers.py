@@ -0,0 +1,47 @@
+"""
+This benchmark times "turn all on" and "turn all off" through the driver layer against the simulated device server, for a range
+of concurrency limits. The serial time is what sending one command after another would cost: devices times latency.
+
+Run it from the repository root with:
+    python -m benchmarks.bench_drivers [--devices N] [--latency SECONDS] [--concurrency N ...]
+"""
+import argparse
+import asyncio
+import time
+from backend import SmartHome, SmartPlug, SmartWashingMachine
+from drivers import DeviceClient, DeviceDriverLayer
+from simserver import SimulatedDeviceServer
+
+async def run(devices, latency, concurrencies, connections):
+    server = SimulatedDeviceServer(latency=latency)
+    port = await server.start()
+    print("{} devices, {:.0f} ms latency, serial estimate {:.1f} s".format(devices, latency * 1000, devices * latency))
+    print("{:>12}{:>14}{:>14}{:>16}".format("concurrency", "all on (s)", "all off (s)", "commands/s"))
+    for concurrency in concurrencies:
+        home = SmartHome()
+        home.addDevices([SmartPlug() if number % 2 else SmartWashingMachine() for number in range(devices)])
+        client = DeviceClient("127.0.0.1", port, connections=connections, timeout=max(1.0, latency * 10))
+        drivers = DeviceDriverLayer(home, client, concurrency=concurrency)
+        start = time.perf_counter()
+        failedOn = await drivers.turnOnAll()
+        onTime = time.perf_counter() - start
+        start = time.perf_counter()
+        failedOff = await drivers.turnOffAll()
+        offTime = time.perf_counter() - start
+        await client.close()
+        failed = len(failedOn) + len(failedOff)
+        print("{:>12}{:>14.2f}{:>14.2f}{:>16,.0f}{}".format(concurrency, onTime, offTime, 2 * devices / (onTime + offTime),
+                                                           "  ({} failed)".format(failed) if failed else ""))
+    await server.stop()
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the asyncio driver layer against simulated devices.")
+    parser.add_argument("--devices", type=int, default=1000)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--connections", type=int, default=4)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[10, 100, 1000])
+    args = parser.parse_args()
+    asyncio.run(run(args.devices, args.latency, args.concurrency, args.connections))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+"""
+This benchmark measures the command throughput of a fleet of homes sharded across worker processes, and the time to compute
+the fleet-wide totals, for 1 worker up to one per CPU. Each round sends every worker its share of a block of toggle commands
+in one message.
+
+Run it from the repository root with:
+    python -m benchmarks.bench_fleet [--homes N] [--devices N] [--commands N] [--batch N] [--workers N ...]
+"""
+import argparse
+import os
+import random
+import time
+from fleet import HomeManager
+
+def run(workers, homes, devices, commands, batch):
+    random.seed(1)
+    with HomeManager(workers) as manager:
+        start = time.perf_counter()
+        deviceIds = manager.addHomes([(homeId, devices - devices // 2, devices // 2) for homeId in range(homes)])
+        setUpTime = time.perf_counter() - start
+        homeIds = list(deviceIds)
+        blocks = []
+        for first in range(0, commands, batch):
+            block = []
+            for number in range(min(batch, commands - first)):
+                homeId = random.choice(homeIds)
+                block.append((homeId, [("toggle", random.choice(deviceIds[homeId]))]))
+            blocks.append(block)
+        start = time.perf_counter()
+        for block in blocks:
+            manager.applyMany(block)
+        applyTime = time.perf_counter() - start
+        start = time.perf_counter()
+        stats = manager.fleetStats()
+        statsTime = time.perf_counter() - start
+    return setUpTime, commands / applyTime, statsTime, stats
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark sharding homes across worker processes.")
+    parser.add_argument("--homes", type=int, default=2000)
+    parser.add_argument("--devices", type=int, default=20)
+    parser.add_argument("--commands", type=int, default=200000)
+    parser.add_argument("--batch", type=int, default=5000)
+    parser.add_argument("--workers", type=int, nargs="+")
+    args = parser.parse_args()
+    workerCounts = args.workers or sorted({1, 2, 4, os.cpu_count() or 1})
+    print("{} homes of {} devices, {} toggles in blocks of {}, {} CPUs".format(args.homes, args.devices, args.commands,
+                                                                            args.batch, os.cpu_count()))
+    print("{:>8}{:>14}{:>16}{:>10}{:>18}".format("workers", "set up (s)", "commands/s", "speedup", "fleet stats (ms)"))
+    baseline = None
+    for workers in workerCounts:
+        setUpTime, throughput, statsTime, stats = run(workers, args.homes, args.devices, args.commands, args.batch)
+        baseline = baseline or throughput
+        print("{:>8}{:>14.2f}{:>16,.0f}{:>9.2f}x{:>18.1f}".format(workers, setUpTime, throughput, throughput / baseline,
+                                                                statsTime * 1000))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""
+This benchmark compares the memory used per device and the construction throughput of the slotted device classes in backend
+against copies of the original dict based classes, which carried a widgets dict and their own wash mode list.
+
+Run it from the repository root with:
+    python -m benchmarks.bench_memory [sizes...]
+"""
+import gc
+import sys
+import time
+import tracemalloc
+from backend import SmartPlug, SmartWashingMachine
+
+DEFAULT_SIZES = (10**3, 10**5, 10**6)
+
+class LegacySmartDevice():
+    """
+    This is the device layout before the slotted classes: every attribute lives in the instance __dict__.
+    """
+    def __init__(self):
+        self.switchedOn = False
+        self.name = None
+        self.widgets = {}
+
+class LegacySmartPlug(LegacySmartDevice):
+    def __init__(self):
+        super().__init__()
+        self.consumptionRate = 0
+        self.name = "Smart Plug"
+
+class LegacySmartWashingMachine(LegacySmartDevice):
+    def __init__(self):
+        super().__init__()
+        self.washMode_list = ["Daily wash", "Quick wash", "Eco"]
+        self.washMode = "Daily wash"
+        self.name = "Smart Washing Machine"
+
+CLASSES = (
+    ("legacy plug", LegacySmartPlug),
+    ("slotted plug", SmartPlug),
+    ("legacy washer", LegacySmartWashingMachine),
+    ("slotted washer", SmartWashingMachine),
+)
+
+def bytesPerDevice(cls, size):
+    """
+    This returns the bytes allocated per device when size devices are built and kept in a list.
+    The list's own pointer to each device is included, as any container holding a fleet pays it.
+    """
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    devices = [cls() for _ in range(size)]
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del devices
+    return (after - before) / size
+
+def devicesPerSecond(cls, size):
+    """
+    This returns how many devices of the class can be constructed per second.
+    """
+    gc.collect()
+    start = time.perf_counter()
+    devices = [cls() for _ in range(size)]
+    elapsed = time.perf_counter() - start
+    del devices
+    return size / elapsed
+
+def main(argv):
+    sizes = [int(float(arg)) for arg in argv] or DEFAULT_SIZES
+    print("{:<16}{:>10}{:>16}{:>18}".format("class", "devices", "bytes/device", "devices/second"))
+    for size in sizes:
+        for label, cls in CLASSES:
+            print("{:<16}{:>10}{:>16.1f}{:>18,.0f}".format(label, size, bytesPerDevice(cls, size), devicesPerSecond(cls, size)))
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,188 @@
+"""
+This benchmark times the SmartHome operations and the frontend handlers at a range of home sizes, works out how each one grows
+with the number of devices, and can compare the results with a saved baseline to catch regressions.
+
+The frontend handlers run against the stub widgets in benchmarks.stubtk, so no display is needed, and each handler is timed up
+to and including the repaint it causes.
+
+Run it from the repository root with:
+    python -m benchmarks.bench_ops [--sizes N ...] [--output FILE] [--baseline FILE] [--threshold FRACTION]
+The exit status is 1 when any operation is slower than the baseline by more than the threshold. benchmarks/baseline_ops.json
+holds a baseline for every default size. Timings depend on the machine, so regenerate it with --output on the machine that
+runs the comparison.
+"""
+import argparse
+import json
+import math
+import platform
+import random
+import sys
+import time
+from benchmarks import stubtk
+
+stubtk.install()
+
+import frontend
+from backend import SmartHome, SmartPlug, SmartWashingMachine
+
+DEFAULT_SIZES = (10, 100, 1000, 10**4, 10**5, 10**6)
+# Each operation is repeated until it has run for this long, or for MAX_CALLS calls.
+MIN_TIME = 0.05
+MAX_CALLS = 2000
+# Differences smaller than this are timer noise and are never reported as regressions.
+NOISE_FLOOR = 2e-6
+
+def makeHome(size):
+    home = SmartHome()
+    home.addDevices([SmartPlug() if number % 2 == 0 else SmartWashingMachine() for number in range(size)])
+    return home
+
+def timeCalls(call, setUp=None):
+    """
+    This returns the median time of one call, leaving setUp out of the timing.
+    """
+    times = []
+    started = time.perf_counter()
+    while len(times) < MAX_CALLS and (len(times) < 3 or time.perf_counter() - started < MIN_TIME):
+        argument = setUp() if setUp is not None else None
+        start = time.perf_counter()
+        call(argument)
+        times.append(time.perf_counter() - start)
+    times.sort()
+    return times[len(times) // 2]
+
+def backendTimings(size):
+    home = makeHome(size)
+    results = {}
+
+    def newPlug():
+        # The devices added by earlier calls are taken off again, so every call sees a home of the same size.
+        while len(home.getDevices()) > size:
+            home.deleteDeviceAt(-1)
+        return SmartPlug()
+    results["addDevice"] = timeCalls(home.addDevice, newPlug)
+    newPlug()
+    def deleteAt(index):
+        home.deleteDeviceAt(index)
+    results["deleteDeviceAt"] = timeCalls(deleteAt, lambda: (home.addDevice(SmartPlug()), random.randrange(size))[1])
+    results["getIndex"] = timeCalls(home.getIndex, lambda: home.getDeviceAt(random.randrange(size)))
+    results["toggleSwitch"] = timeCalls(home.toggleSwitch, lambda: random.randrange(size))
+    results["turnOnAll"] = timeCalls(lambda argument: home.turnOnAll(), home.turnOffAll)
+    results["countTotalOn"] = timeCalls(lambda argument: home.countTotalOn())
+    results["__str__"] = timeCalls(lambda argument: str(home))
+    return results
+
+def frontendTimings(size):
+    """
+    This sets the frontend up on a home of the given size with stub widgets, and times each handler followed by the repaint it
+    queues.
+    """
+    home = makeHome(size)
+    frontend.home = home
+    frontend.mainWin = stubtk.Tk()
+    frontend.setUpMainWin()
+    stubtk.runPending()
+    results = {}
+
+    def handled(handler):
+        def call(argument):
+            handler(argument)
+            stubtk.runPending()
+        return call
+    results["frontend.toggleDevice"] = timeCalls(handled(frontend.toggleDevice),
+                                                 lambda: home.getDeviceAt(random.randrange(size)))
+    def turnOffAll():
+        home.turnOffAll()
+        stubtk.runPending()
+    results["frontend.turnOnAllDevices"] = timeCalls(handled(lambda argument: frontend.turnOnAllDevices()), turnOffAll)
+    def deleteSetUp():
+        home.addDevice(SmartPlug())
+        stubtk.runPending()
+        return home.getDeviceAt(random.randrange(size))
+    results["frontend.deleteSelection"] = timeCalls(handled(frontend.deleteSelection), deleteSetUp)
+    def addSetUp():
+        while len(home.getDevices()) > size:
+            home.deleteDeviceAt(-1)
+        stubtk.runPending()
+        return "Smart Plug"
+    results["frontend.addDeviceProcess"] = timeCalls(handled(frontend.addDeviceProcess), addSetUp)
+    home.removeChangeListener(frontend.renderer.onChanges)
+    return results
+
+def growth(sizes, times):
+    """
+    This fits time = c * size^k by least squares on a log-log scale and returns k with a rough description.
+    """
+    points = [(math.log(size), math.log(max(times[size], 1e-9))) for size in sizes if size in times]
+    if len(points) < 2:
+        return None, "-"
+    meanX = sum(x for x, y in points) / len(points)
+    meanY = sum(y for x, y in points) / len(points)
+    slope = (sum((x - meanX) * (y - meanY) for x, y in points) / sum((x - meanX) ** 2 for x, y in points))
+    if slope < 0.15:
+        shape = "O(1) or O(log n)"
+    elif slope < 0.75:
+        shape = "sublinear"
+    elif slope < 1.25:
+        shape = "O(n)"
+    else:
+        shape = "superlinear"
+    return slope, shape
+
+def compare(results, baseline, threshold):
+    """
+    This returns (operation, size, time, baseline time) for every timing slower than the baseline by more than threshold.
+    """
+    regressions = []
+    for operation, times in results.items():
+        for size, seconds in times.items():
+            before = baseline.get(operation, {}).get(str(size))
+            if before is not None and seconds > before * (1 + threshold) and seconds - before > NOISE_FLOOR:
+                regressions.append((operation, size, seconds, before))
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark SmartHome operations and frontend handlers across home sizes.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=list(DEFAULT_SIZES))
+    parser.add_argument("--output", help="file to save the results to as JSON")
+    parser.add_argument("--baseline", help="JSON results to compare against")
+    parser.add_argument("--threshold", type=float, default=0.25, help="slowdown that counts as a regression (0.25 = 25%%)")
+    args = parser.parse_args()
+    random.seed(1)
+
+    results = {}
+    for size in args.sizes:
+        started = time.perf_counter()
+        for timings in (backendTimings(size), frontendTimings(size)):
+            for operation, seconds in timings.items():
+                results.setdefault(operation, {})[size] = seconds
+        print("{:,} devices timed in {:.1f} s".format(size, time.perf_counter() - started), file=sys.stderr)
+
+    print("{:<28}".format("operation") + "".join("{:>14,}".format(size) for size in args.sizes) + "   growth")
+    for operation, times in results.items():
+        slope, shape = growth(args.sizes, times)
+        cells = "".join("{:>12.2f}us".format(times[size] * 1e6) for size in args.sizes)
+        print("{:<28}{}   {}".format(operation, cells, "n^{:.2f} {}".format(slope, shape) if slope is not None else shape))
+
+    if args.output:
+        document = {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "sizes": args.sizes,
+            "results": {operation: {str(size): seconds for size, seconds in times.items()}
+                        for operation, times in results.items()},
+        }
+        with open(args.output, "w") as file:
+            json.dump(document, file, indent=2)
+    if args.baseline:
+        with open(args.baseline) as file:
+            regressions = compare(results, json.load(file)["results"], args.threshold)
+        for operation, size, seconds, before in regressions:
+            print("REGRESSION {} at {:,} devices: {:.2f}us, baseline {:.2f}us ({:+.0%})".format(
+                operation, size, seconds * 1e6, before * 1e6, seconds / before - 1))
+        if regressions:
+            sys.exit(1)
+        print("No regressions against {}".format(args.baseline))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+"""
+This benchmark measures the cold start cost of the headless model against the GUI path. Every run is a fresh interpreter, timed
+from the outside and with -X importtime, so nothing is cached between runs.
+
+Run it from the repository root with:
+    python -m benchmarks.bench_startup [runs]
+"""
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PATHS = (
+    ("headless", "import backend"),
+    ("gui", "import frontend"),
+)
+
+def importTime(statement):
+    """
+    This runs a statement in a fresh interpreter with -X importtime and returns the wall time of the whole process and the
+    total cumulative import time of the top level imports, in microseconds.
+    """
+    start = time.perf_counter()
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", statement], cwd=ROOT, capture_output=True, text=True,
+                            check=True)
+    wall = (time.perf_counter() - start) * 1e6
+    cumulative = 0
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        fields = line[len("import time:"):].split("|")
+        name = fields[2]
+        # Top level imports are the ones printed without indentation.
+        if name.startswith(" ") and not name.startswith("  "):
+            cumulative += int(fields[1])
+    return wall, cumulative
+
+def checkHeadless():
+    """
+    This checks that importing the model does not import tkinter.
+    """
+    statement = "import sys, backend; sys.exit('tkinter' in sys.modules)"
+    return subprocess.run([sys.executable, "-c", statement], cwd=ROOT).returncode == 0
+
+def main(argv):
+    runs = int(argv[0]) if argv else 20
+    print("backend imports without tkinter: {}".format(checkHeadless()))
+    print("{:<10}{:>18}{:>22}".format("path", "median wall (ms)", "median imports (ms)"))
+    results = {}
+    for label, statement in PATHS:
+        samples = [importTime(statement) for _ in range(runs)]
+        wall = statistics.median(sample[0] for sample in samples) / 1000
+        imports = statistics.median(sample[1] for sample in samples) / 1000
+        results[label] = imports
+        print("{:<10}{:>18.2f}{:>22.2f}".format(label, wall, imports))
+    print("headless imports are {:.1f}x faster".format(results["gui"] / results["headless"]))
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,172 @@
+"""
+This stress test changes one smart home from many threads at once and checks it is never seen half changed. While the writer
+threads toggle, re-rate, re-mode, add and delete devices and apply batches, reader threads check that every snapshot they take
+adds up, and the main thread plays the Tk main loop: it drains the MainThreadDispatcher and repaints the frontend on the stub
+widgets in benchmarks.stubtk, which count any widget call made from another thread. At the end the running totals, indexes and
+power budget are checked against a recount of every device.
+
+The thread switch interval is made very short, so the threads interleave far more often than they normally would.
+
+Run it from the repository root with:
+    python -m benchmarks.bench_threads [--writers N] [--readers N] [--devices N] [--seconds S] [--budget CAP]
+The exit status is 1 when any check fails.
+"""
+import argparse
+import random
+import sys
+import threading
+import time
+from benchmarks import stubtk
+
+stubtk.install()
+
+import frontend
+from backend import SmartHome, SmartPlug, SmartWashingMachine, WASH_MODE_NAMES
+from tkview import MainThreadDispatcher
+
+def makeHome(size):
+    home = SmartHome()
+    home.addDevices([SmartPlug() if number % 2 == 0 else SmartWashingMachine() for number in range(size)])
+    return home
+
+def checkSnapshot(snapshot):
+    """
+    This returns what is wrong with a snapshot's totals, or None when they match its devices.
+    """
+    on = [device for device in snapshot.devices if device.switchedOn]
+    consumption = sum(device.consumptionRate for device in on if device.consumptionRate is not None)
+    if len(on) != snapshot.onCount:
+        return "snapshot has {} devices on but counts {}".format(len(on), snapshot.onCount)
+    if abs(consumption - snapshot.consumption) > 1e-6:
+        return "snapshot consumption {} != {}".format(snapshot.consumption, consumption)
+    for name, count in snapshot.onCountByType.items():
+        if count != sum(1 for device in on if device.name == name):
+            return "snapshot count of {} on is wrong".format(name)
+    return None
+
+def writer(home, ids, stop, counts, failures, seed):
+    """
+    This makes random changes until stop is set. Devices deleted by another thread raise KeyError, and bad batches raise
+    ValueError, which are expected.
+    """
+    chooser = random.Random(seed)
+    done = 0
+    while not stop.is_set():
+        deviceId = chooser.choice(ids)
+        choice = chooser.random()
+        try:
+            if choice < 0.4:
+                home.getDevice(deviceId).toggleSwitch()
+            elif choice < 0.55:
+                device = home.getDevice(deviceId)
+                if isinstance(device, SmartPlug):
+                    device.setConsumptionRate(chooser.randrange(151))
+                else:
+                    device.setWashMode(chooser.choice(WASH_MODE_NAMES))
+            elif choice < 0.75:
+                home.applyBatch([("toggle", chooser.choice(ids)) for number in range(chooser.randrange(1, 6))])
+            elif choice < 0.85:
+                with home.batchChanges():
+                    for number in range(4):
+                        home.toggleSwitchById(chooser.choice(ids))
+            elif choice < 0.93:
+                home.deleteDevice(deviceId)
+                device = SmartPlug() if chooser.random() < 0.5 else SmartWashingMachine()
+                home.addDevice(device)
+                ids[chooser.randrange(len(ids))] = device.deviceId
+            elif choice < 0.97:
+                home.moveDevice(deviceId, chooser.randrange(len(home.getDevices())))
+            elif choice < 0.985:
+                home.turnOnAll()
+            else:
+                home.turnOffAll()
+        except (KeyError, ValueError):
+            pass
+        except Exception as error:
+            failures.append("writer: {!r}".format(error))
+            return
+        done += 1
+    counts.append(done)
+
+def reader(home, stop, counts, failures):
+    done = 0
+    while not stop.is_set():
+        problem = checkSnapshot(home.snapshot())
+        if problem is not None:
+            failures.append(problem)
+            return
+        if home.countTotalOn() < 0:
+            failures.append("negative on count")
+            return
+        done += 1
+    counts.append(done)
+
+def main():
+    parser = argparse.ArgumentParser(description="Stress a smart home with many threads and check it stays consistent.")
+    parser.add_argument("--writers", type=int, default=8)
+    parser.add_argument("--readers", type=int, default=2)
+    parser.add_argument("--devices", type=int, default=1000)
+    parser.add_argument("--seconds", type=float, default=5)
+    parser.add_argument("--budget", type=float, help="also keep the plugs under this power budget")
+    args = parser.parse_args()
+    random.seed(1)
+    sys.setswitchinterval(1e-6)
+
+    home = makeHome(args.devices)
+    if args.budget is not None:
+        home.setPowerBudget(args.budget, {device.deviceId: random.randrange(4) for device in home.getDevices()
+                                          if isinstance(device, SmartPlug)})
+    stubtk.owner = threading.get_ident()
+    frontend.home = home
+    frontend.mainWin = stubtk.Tk()
+    frontend.dispatcher = MainThreadDispatcher(frontend.mainWin)
+    frontend.setUpMainWin()
+    stubtk.runPending()
+
+    ids = [device.deviceId for device in home.getDevices()]
+    stop = threading.Event()
+    writes, reads, failures = [], [], []
+    threads = [threading.Thread(target=writer, args=(home, list(ids), stop, writes, failures, number))
+               for number in range(args.writers)]
+    threads += [threading.Thread(target=reader, args=(home, stop, reads, failures)) for number in range(args.readers)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    repaints = 0
+    while time.perf_counter() - started < args.seconds and not failures:
+        # The stub main loop: the dispatcher's drain and the repaints it queues run here, on the main thread.
+        stubtk.runPending()
+        repaints += 1
+        time.sleep(0.005)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    for number in range(3):
+        stubtk.runPending()
+
+    try:
+        home.verifyAggregates()
+    except AssertionError as error:
+        failures.append("totals after the run: {}".format(error))
+    problem = checkSnapshot(home.snapshot())
+    if problem is not None:
+        failures.append(problem)
+    if home.totalOnLabel.options.get("text") != "Total activated: {}".format(home.countTotalOn()):
+        failures.append("the window does not show the final total")
+    if stubtk.wrongThreadCalls:
+        failures.append("{} widget calls came from other threads".format(stubtk.wrongThreadCalls))
+
+    print("{} writers made {:,} changes ({:,.0f}/s), {} readers checked {:,} snapshots, {:,} main loop passes".format(
+        args.writers, sum(writes), sum(writes) / elapsed, args.readers, sum(reads), repaints))
+    print("{:,} devices, {:,} on, consumption {:g}{}".format(len(home.getDevices()), home.countTotalOn(),
+                                                              home.getTotalConsumption(),
+                                                              ", budget {:g}".format(args.budget) if args.budget else ""))
+    for failure in failures:
+        print("FAILED: {}".format(failure))
+    if failures:
+        sys.exit(1)
+    print("Consistent")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+"""
+This is a stand-in for tkinter with widgets that accept every call and draw nothing, so the frontend handlers can be timed
+without a display. after() and after_idle() callbacks are queued, and runPending() runs them, which is where the frontend does
+its repainting.
+
+install() must be called before frontend or tkview is imported. Setting owner to a thread's ident makes the widgets count every
+call that comes from any other thread in wrongThreadCalls, as real Tk widgets must only be used from one thread.
+"""
+import sys
+import threading
+
+LEFT = "left"
+RIGHT = "right"
+TOP = "top"
+BOTTOM = "bottom"
+BOTH = "both"
+TRUE = True
+FALSE = False
+END = "end"
+VERTICAL = "vertical"
+HORIZONTAL = "horizontal"
+N = "n"
+S = "s"
+E = "e"
+W = "w"
+NSEW = "nsew"
+
+pending = []
+owner = None
+wrongThreadCalls = 0
+
+def _checkThread():
+    global wrongThreadCalls
+    if owner is not None and threading.get_ident() != owner:
+        wrongThreadCalls += 1
+
+def install():
+    """
+    This makes "import tkinter" and "from tkinter import *" give this module.
+    """
+    sys.modules["tkinter"] = sys.modules[__name__]
+
+def runPending():
+    """
+    This runs the queued after() and after_idle() callbacks, but not the ones they queue in turn, so callbacks that re-arm
+    themselves do not run forever.
+    """
+    callbacks = pending[:]
+    del pending[:]
+    for function, args in callbacks:
+        function(*args)
+
+class Misc():
+    def __init__(self, master=None, *args, **options):
+        self.options = dict(options)
+        self.text = ""
+        self.value = None
+    def pack(self, **options):
+        pass
+    def grid(self, **options):
+        _checkThread()
+    def grid_remove(self):
+        _checkThread()
+    def grid_configure(self, **options):
+        _checkThread()
+    def grid_propagate(self, *args):
+        pass
+    def grid_columnconfigure(self, *args, **options):
+        pass
+    def rowconfigure(self, *args, **options):
+        pass
+    columnconfigure = rowconfigure
+    def configure(self, **options):
+        _checkThread()
+        self.options.update(options)
+    config = configure
+    def bind(self, event, function):
+        pass
+    def destroy(self):
+        pass
+    def winfo_reqheight(self):
+        return 56
+    def title(self, *args):
+        pass
+    def resizable(self, *args):
+        pass
+    def geometry(self, *args):
+        pass
+    def transient(self, *args):
+        pass
+    def grab_set(self):
+        pass
+    def mainloop(self):
+        pass
+    def after(self, ms, function=None, *args):
+        _checkThread()
+        pending.append((function, args))
+        return len(pending)
+    def after_idle(self, function, *args):
+        _checkThread()
+        pending.append((function, args))
+        return len(pending)
+    def after_cancel(self, identifier):
+        pass
+    def get(self, *args):
+        return self.value if self.value is not None else self.text
+    def set(self, *args):
+        self.value = args[0] if len(args) == 1 else args
+    def insert(self, index, text):
+        _checkThread()
+        self.text = text + self.text
+    def delete(self, first, last=None):
+        _checkThread()
+        self.text = ""
+
+class Tk(Misc):
+    pass
+
+class Toplevel(Misc):
+    pass
+
+class Frame(Misc):
+    pass
+
+class Label(Misc):
+    pass
+
+class Button(Misc):
+    pass
+
+class Text(Misc):
+    pass
+
+class Scrollbar(Misc):
+    pass
+
+class Scale(Misc):
+    pass
+
+class OptionMenu(Misc):
+    pass
+
+class StringVar(Misc):
+    pass
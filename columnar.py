@@ -0,0 +1,356 @@
+from array import array
+from itertools import compress
+from math import fsum
+from backend import SmartPlug, SmartWashingMachine, WASH_MODE_NAMES
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+EMPTY = 0
+PLUG = 1
+WASHER = 2
+TYPE_NAMES = (None, "Smart Plug", "Smart Washing Machine")
+WASH_MODES = WASH_MODE_NAMES
+
+# Maps every type code to 1 and the empty code to 0, used to switch on every live row without a python loop.
+_LIVE_TABLE = bytes([0] + [1] * 255)
+
+class ColumnarDevice():
+    """
+    This is a light proxy for one row of a columnar smart home. It exposes the same methods as a smart device, but every
+    value is read from and written to the columns of the home, so it holds nothing but the home and the row number.
+    """
+    __slots__ = ("home", "deviceId")
+
+    def __init__(self, home, deviceId):
+        self.home = home
+        self.deviceId = deviceId
+    def __eq__(self, other):
+        return isinstance(other, ColumnarDevice) and other.home is self.home and other.deviceId == self.deviceId
+    def __hash__(self):
+        return hash((id(self.home), self.deviceId))
+    def _row(self):
+        row = self.deviceId
+        if self.home.typeCodes[row] == EMPTY:
+            raise KeyError("device {} has been deleted".format(self.deviceId))
+        return row
+    @property
+    def switchedOn(self):
+        return self.home.switches[self._row()] == 1
+    def getDeviceId(self):
+        """
+        This returns the stable ID of the device, which is its row in the home.
+        """
+        return self.deviceId
+    def toggleSwitch(self):
+        """
+        This method turns the Device on or off.
+        """
+        row = self._row()
+        self.home.switches[row] = 1 - self.home.switches[row]
+    def getDeviceStatus(self):
+        """
+        this method returns whether or not the device is on.
+        """
+        if self.switchedOn:
+            return "On"
+        else:
+            return "Off"
+    def getDeviceName(self):
+        """
+        This returns the device name.
+        """
+        return TYPE_NAMES[self.home.typeCodes[self._row()]]
+
+class ColumnarPlug(ColumnarDevice):
+    """
+    This is the proxy for a smart plug row.
+    """
+    __slots__ = ()
+
+    @property
+    def consumptionRate(self):
+        return self.home.rates[self._row()]
+    def setConsumptionRate(self, rate):
+        """
+        This method sets the consumption rate of the plug.
+        """
+        if not 0 <= rate <= 150:
+            raise ValueError("Invalid consumption rate entered!")
+        self.home.rates[self._row()] = rate
+    def getConsumptionRate(self):
+        """
+        This method returns the consumption rate of the plug.
+        """
+        return self.consumptionRate
+    def __str__(self):
+        if self.switchedOn:
+            status = "ON"
+        else:
+            status = "OFF"
+        return "Smart plug: {} | Consumption rate: {}".format(status, _formatRate(self.consumptionRate))
+
+class ColumnarWashingMachine(ColumnarDevice):
+    """
+    This is the proxy for a smart washing machine row. The wash mode is stored as a code into WASH_MODES.
+    """
+    __slots__ = ()
+
+    @property
+    def washMode(self):
+        return WASH_MODES[self.home.washModes[self._row()]]
+    def setWashMode(self, mode):
+        """
+        This sets the wash mode of the device, only accepts "Daily wash", "Quick wash" or "Eco".
+        """
+        if mode not in WASH_MODES:
+            raise ValueError("Invalid wash mode entered!")
+        self.home.washModes[self._row()] = WASH_MODES.index(mode)
+    def getWashMode(self):
+        """
+        This returns the current wash mode of the device.
+        """
+        return self.washMode
+    def getWashOptions(self):
+        """
+        This returns a list of the options for this device.
+        """
+        return list(WASH_MODES)
+    def __str__(self):
+        if self.switchedOn:
+            status = "ON"
+        else:
+            status = "OFF"
+        return "Washing machine: {} | Wash mode: {}".format(status, self.washMode)
+
+_PROXIES = (None, ColumnarPlug, ColumnarWashingMachine)
+
+def _formatRate(rate):
+    """
+    This shows whole number rates without the trailing .0 the float column would add.
+    """
+    if rate == int(rate):
+        return int(rate)
+    return rate
+
+class _ColumnarView():
+    """
+    This is a read only, ordered view of the devices in a columnar smart home.
+    """
+    def __init__(self, home):
+        self.home = home
+    def __len__(self):
+        return self.home.liveCount
+    def __getitem__(self, index):
+        return self.home.getDeviceAt(index)
+    def __iter__(self):
+        home = self.home
+        for row, code in enumerate(home.typeCodes):
+            if code != EMPTY:
+                yield _PROXIES[code](home, row)
+
+class ColumnarSmartHome():
+    """
+    This is a smart home for very large numbers of devices. Instead of one object per device it keeps one compact array per
+    field: type code, switch state, consumption rate and wash mode code, and hands out ColumnarDevice proxies on demand.
+    A device's ID is its row, rows are never reused, and a deleted row is left as an empty tombstone.
+    Turning everything on or off and counting or summing the devices that are on are bulk operations over the arrays, done with
+    numpy when it is installed and with the array module otherwise.
+    """
+    def __init__(self):
+        self.typeCodes = array("B")
+        self.switches = array("B")
+        self.rates = array("d")
+        self.washModes = array("B")
+        self.liveCount = 0
+        # Fenwick tree of live rows, only built once a device has been deleted. Until then a row is its own index.
+        self.tree = None
+    def _appendRows(self, code, count, switchedOn, rate, washMode):
+        firstRow = len(self.typeCodes)
+        self.typeCodes.frombytes(bytes([code]) * count)
+        self.switches.frombytes(bytes([1 if switchedOn else 0]) * count)
+        self.rates.extend(array("d", [rate]) * count)
+        self.washModes.frombytes(bytes([washMode]) * count)
+        self.liveCount += count
+        if self.tree is not None:
+            for row in range(firstRow, firstRow + count):
+                self._treeAppend(row)
+        return firstRow
+    def addDevice(self, device):
+        """
+        This copies the state of a smart plug or washing machine into a new row and returns the proxy for it.
+        """
+        if isinstance(device, (SmartPlug, ColumnarPlug)):
+            return self.addPlug(device.getConsumptionRate(), device.switchedOn)
+        if isinstance(device, (SmartWashingMachine, ColumnarWashingMachine)):
+            return self.addWashingMachine(device.getWashMode(), device.switchedOn)
+        raise TypeError("Unsupported device: {!r}".format(device))
+    def addPlug(self, rate=0, switchedOn=False):
+        """
+        This adds a smart plug and returns the proxy for it.
+        """
+        if not 0 <= rate <= 150:
+            raise ValueError("Invalid consumption rate entered!")
+        return ColumnarPlug(self, self._appendRows(PLUG, 1, switchedOn, rate, 0))
+    def addWashingMachine(self, washMode="Daily wash", switchedOn=False):
+        """
+        This adds a smart washing machine and returns the proxy for it.
+        """
+        return ColumnarWashingMachine(self, self._appendRows(WASHER, 1, switchedOn, 0, WASH_MODES.index(washMode)))
+    def addDevices(self, name, count, switchedOn=False, rate=0, washMode="Daily wash"):
+        """
+        This adds count devices of the given device name in one go, and returns the ID of the first one.
+        """
+        code = TYPE_NAMES.index(name)
+        if code == PLUG:
+            if not 0 <= rate <= 150:
+                raise ValueError("Invalid consumption rate entered!")
+            return self._appendRows(PLUG, count, switchedOn, rate, 0)
+        return self._appendRows(WASHER, count, switchedOn, 0, WASH_MODES.index(washMode))
+    def getDevices(self):
+        """
+        this returns a group of all the devices in the smart home object, in order.
+        """
+        return _ColumnarView(self)
+    def getDevice(self, deviceId):
+        """
+        This returns the proxy for the device with the given ID.
+        """
+        if not 0 <= deviceId < len(self.typeCodes) or self.typeCodes[deviceId] == EMPTY:
+            raise KeyError(deviceId)
+        return _PROXIES[self.typeCodes[deviceId]](self, deviceId)
+    def getDeviceAt(self, index):
+        """
+        This retruns the specific device at a certain index in the smart home object.
+        """
+        if index < 0:
+            index += self.liveCount
+        if not 0 <= index < self.liveCount:
+            raise IndexError("device index out of range")
+        row = index if self.tree is None else self._select(index)
+        return _PROXIES[self.typeCodes[row]](self, row)
+    def getIndex(self, device):
+        """
+        This command returns the index of a given device in the smart home.
+        """
+        if device.home is not self or self.typeCodes[device.deviceId] == EMPTY:
+            print("Entered device not in smart home")
+            return None
+        if self.tree is None:
+            return device.deviceId
+        return self._prefix(device.deviceId + 1) - 1
+    def toggleSwitch(self, index):
+        """
+        This turns the device at a certain index on or off.
+        """
+        self.getDeviceAt(index).toggleSwitch()
+    def toggleSwitchById(self, deviceId):
+        """
+        This turns the device with the given ID on or off.
+        """
+        self.getDevice(deviceId).toggleSwitch()
+    def deleteDeviceAt(self, index):
+        """
+        This command deletes a device from the smart home object given the index of said device.
+        """
+        self.deleteDevice(self.getDeviceAt(index).deviceId)
+    def deleteDevice(self, deviceId):
+        """
+        This command deletes the device with the given ID, leaving an empty row behind.
+        """
+        self.getDevice(deviceId)
+        if self.tree is None:
+            self._buildTree()
+        self.typeCodes[deviceId] = EMPTY
+        self.switches[deviceId] = 0
+        self.rates[deviceId] = 0
+        self.washModes[deviceId] = 0
+        self.liveCount -= 1
+        row = deviceId + 1
+        tree = self.tree
+        while row < len(tree):
+            tree[row] -= 1
+            row += row & -row
+    def _buildTree(self):
+        tree = array("l", [0])
+        tree.extend(self.typeCodes.tobytes().translate(_LIVE_TABLE))
+        size = len(tree)
+        for child in range(1, size):
+            parent = child + (child & -child)
+            if parent < size:
+                tree[parent] += tree[child]
+        self.tree = tree
+    def _treeAppend(self, row):
+        position = row + 1
+        low = position & -position
+        self.tree.append(1 + self._prefix(position - 1) - self._prefix(position - low))
+    def _prefix(self, position):
+        tree = self.tree
+        total = 0
+        while position > 0:
+            total += tree[position]
+            position -= position & -position
+        return total
+    def _select(self, index):
+        tree = self.tree
+        size = len(tree)
+        position = 0
+        step = 1 << (size - 1).bit_length()
+        remaining = index + 1
+        while step:
+            nextPosition = position + step
+            if nextPosition < size and tree[nextPosition] < remaining:
+                position = nextPosition
+                remaining -= tree[nextPosition]
+            step >>= 1
+        return position
+    def turnOnAll(self):
+        """
+        This turns on all the devices inside the smart home in one bulk operation.
+        """
+        if numpy is not None:
+            switches = numpy.frombuffer(self.switches, dtype=numpy.uint8)
+            switches[:] = numpy.frombuffer(self.typeCodes, dtype=numpy.uint8) != EMPTY
+        else:
+            memoryview(self.switches)[:] = self.typeCodes.tobytes().translate(_LIVE_TABLE)
+    def turnOffAll(self):
+        """
+        This turns off all the devices inside the smart home in one bulk operation.
+        """
+        if numpy is not None:
+            numpy.frombuffer(self.switches, dtype=numpy.uint8)[:] = 0
+        else:
+            memoryview(self.switches)[:] = bytes(len(self.switches))
+    def countTotalOn(self):
+        """
+        This command returns a count of the total smart devices that are currently turned on.
+        """
+        if numpy is not None:
+            return int(numpy.count_nonzero(numpy.frombuffer(self.switches, dtype=numpy.uint8)))
+        return self.switches.count(1)
+    def countTotalOnByType(self, name):
+        """
+        This command returns how many devices with the given device name are currently turned on.
+        """
+        code = TYPE_NAMES.index(name)
+        if numpy is not None:
+            switches = numpy.frombuffer(self.switches, dtype=numpy.uint8)
+            codes = numpy.frombuffer(self.typeCodes, dtype=numpy.uint8)
+            return int(numpy.count_nonzero((codes == code) & (switches != 0)))
+        return bytes(compress(self.typeCodes, self.switches)).count(code)
+    def getTotalConsumption(self):
+        """
+        This command returns the total consumption rate of the smart plugs that are currently turned on.
+        Washing machines and empty rows always have a rate of zero, so only the switch column needs masking.
+        """
+        if numpy is not None:
+            switches = numpy.frombuffer(self.switches, dtype=numpy.uint8)
+            return float(numpy.dot(numpy.frombuffer(self.rates, dtype=numpy.float64), switches))
+        return fsum(compress(self.rates, self.switches))
+    def __str__(self):
+        output = "Your smart home contains:\n"
+        for device in self.getDevices():
+            output += "{}\n".format(device)
+        return output
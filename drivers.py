@@ -0,0 +1,205 @@
+"""
+This is the asyncio driver layer that sends commands to networked smart devices.
+
+DeviceClient keeps a small pool of connections open and pipelines requests over them, matching answers to requests by ID, with
+a timeout and retries for every request. DeviceDriverLayer sits in front of a SmartHome: it sends each command to the device and
+only changes the model once the device has confirmed it, fanning bulk commands out concurrently up to a limit. AsyncRunner
+runs the event loop on a background thread so a Tk main loop never waits on the network.
+"""
+import asyncio
+import itertools
+import json
+import threading
+
+class DeviceError(Exception):
+    """
+    This is raised when a device refuses a command or cannot be reached after every retry.
+    """
+
+class _Connection():
+    """
+    This is one connection to the device server, with a task that reads answers and resolves the waiting requests.
+    """
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+        self.waiting = {}
+        self.readerTask = asyncio.ensure_future(self.readAnswers())
+    @property
+    def closed(self):
+        return self.readerTask.done()
+    async def readAnswers(self):
+        try:
+            while True:
+                line = await self.reader.readline()
+                if not line:
+                    break
+                answer = json.loads(line)
+                future = self.waiting.pop(answer["id"], None)
+                if future is not None and not future.done():
+                    future.set_result(answer)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            for future in self.waiting.values():
+                if not future.done():
+                    future.set_exception(ConnectionResetError("connection to device server lost"))
+            self.waiting.clear()
+    def send(self, request):
+        future = asyncio.get_running_loop().create_future()
+        self.waiting[request["id"]] = future
+        self.writer.write(json.dumps(request).encode() + b"\n")
+        return future
+    def forget(self, requestId):
+        self.waiting.pop(requestId, None)
+    def close(self):
+        self.readerTask.cancel()
+        self.writer.close()
+
+class DeviceClient():
+    """
+    This sends requests to the devices behind a device server over a pool of up to connections reused connections.
+    A request that is not answered within timeout seconds, or whose connection drops, is retried up to retries more times,
+    waiting backoff seconds before the first retry and twice as long before each one after.
+    """
+    def __init__(self, host, port, connections=4, timeout=1.0, retries=2, backoff=0.05):
+        self.host = host
+        self.port = port
+        self.poolSize = connections
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.pool = []
+        self.nextConnection = itertools.count()
+        self.requestIds = itertools.count(1)
+        self.connecting = None
+    async def _connection(self):
+        """
+        This returns the next connection in the pool round robin. While the pool is not full another connection is opened in
+        the background, and a request only waits for it when there is no open connection at all.
+        """
+        self.pool = [connection for connection in self.pool if not connection.closed]
+        if len(self.pool) < self.poolSize and self.connecting is None:
+            self.connecting = asyncio.ensure_future(self._open())
+            self.connecting.add_done_callback(lambda future: future.cancelled() or future.exception())
+        if not self.pool:
+            await asyncio.shield(self.connecting)
+        return self.pool[next(self.nextConnection) % len(self.pool)]
+    async def _open(self):
+        try:
+            reader, writer = await asyncio.open_connection(self.host, self.port)
+            self.pool.append(_Connection(reader, writer))
+        finally:
+            self.connecting = None
+    async def request(self, deviceId, op, **fields):
+        """
+        This sends one request to a device and returns its answer.
+        """
+        delay = self.backoff
+        for attempt in range(self.retries + 1):
+            request = dict(fields, id=next(self.requestIds), device=deviceId, op=op)
+            connection = None
+            try:
+                connection = await self._connection()
+                answer = await asyncio.wait_for(connection.send(request), self.timeout)
+            except (asyncio.TimeoutError, OSError) as error:
+                if connection is not None:
+                    connection.forget(request["id"])
+                if attempt == self.retries:
+                    raise DeviceError("device {} did not answer {!r}: {}".format(deviceId, op, str(error) or "timed out"))
+                await asyncio.sleep(delay)
+                delay *= 2
+                continue
+            if not answer.get("ok"):
+                raise DeviceError(answer.get("error", "device {} refused {!r}".format(deviceId, op)))
+            return answer
+    async def close(self):
+        for connection in self.pool:
+            connection.close()
+        self.pool = []
+
+class DeviceDriverLayer():
+    """
+    This drives the devices of a smart home through a DeviceClient. Every command is sent to the device first and the model is
+    only changed once the device has answered, so the home always shows what the devices have confirmed.
+    Bulk commands send to every device at once, with at most concurrency commands waiting on the network.
+    applyChange is called with a function that changes the model and returns the devices it changed, so a GUI can run the
+    change on its own thread. By default the change is made straight away.
+    """
+    def __init__(self, home, client, concurrency=100, applyChange=None):
+        self.home = home
+        self.client = client
+        self.concurrency = concurrency
+        self.limit = None
+        self.applyChange = applyChange if applyChange is not None else (lambda change: change())
+    def _limit(self):
+        # The semaphore is made on first use so it belongs to the loop that runs the commands.
+        if self.limit is None:
+            self.limit = asyncio.Semaphore(self.concurrency)
+        return self.limit
+    async def _send(self, device, op, **fields):
+        async with self._limit():
+            return await self.client.request(device.deviceId, op, **fields)
+    async def setSwitch(self, device, on):
+        """
+        This switches a device on or off.
+        """
+        await self._send(device, "set", on=on)
+        def change():
+            if device.switchedOn != on:
+                device.toggleSwitch()
+                return [device]
+            return []
+        self.applyChange(change)
+    async def toggleSwitch(self, device):
+        """
+        This turns a device on or off.
+        """
+        await self.setSwitch(device, not device.switchedOn)
+    async def setConsumptionRate(self, device, rate):
+        """
+        This sets the consumption rate of a smart plug.
+        """
+        await self._send(device, "rate", value=rate)
+        def change():
+            device.setConsumptionRate(rate)
+            return [device]
+        self.applyChange(change)
+    async def setWashMode(self, device, mode):
+        """
+        This sets the wash mode of a smart washing machine.
+        """
+        await self._send(device, "mode", value=mode)
+        def change():
+            device.setWashMode(mode)
+            return [device]
+        self.applyChange(change)
+    async def _setAll(self, on):
+        devices = [device for device in self.home.getDevices() if device.switchedOn != on]
+        results = await asyncio.gather(*(self.setSwitch(device, on) for device in devices), return_exceptions=True)
+        return [(device, result) for device, result in zip(devices, results) if isinstance(result, Exception)]
+    async def turnOnAll(self):
+        """
+        This turns on every device in the home, and returns (device, error) for the devices that could not be switched.
+        """
+        return await self._setAll(True)
+    async def turnOffAll(self):
+        """
+        This turns off every device in the home, and returns (device, error) for the devices that could not be switched.
+        """
+        return await self._setAll(False)
+
+class AsyncRunner():
+    """
+    This runs an asyncio event loop on a daemon thread. submit() hands it a coroutine from any thread and returns a
+    concurrent.futures.Future straight away, so the calling thread never blocks on the network.
+    """
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self.thread.start()
+    def submit(self, coroutine):
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop)
+    def stop(self):
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
@@ -0,0 +1,213 @@
+"""
+This manages a fleet of smart homes sharded across worker processes.
+
+Every home lives in exactly one worker, picked from its home ID, so commands for a home are always routed to the same process
+and each worker only ever touches its own homes. Commands for many homes are grouped into one message per worker and the
+workers apply them in parallel. Fleet-wide totals are a map-reduce: every worker adds up the running totals of its own homes at
+the same time, and the manager adds the workers' answers together.
+"""
+import multiprocessing
+import os
+import zlib
+from backend import SmartHome, SmartPlug, SmartWashingMachine
+
+def shardOf(homeId, workers):
+    """
+    This returns the worker that owns a home. It is a checksum of the home ID rather than hash(), so it is the same in every
+    process and every run.
+    """
+    return zlib.crc32(str(homeId).encode()) % workers
+
+class _Shard():
+    """
+    This is the part of the fleet held by one worker process.
+    """
+    def __init__(self):
+        self.homes = {}
+    def addHome(self, homeId, plugs, washers):
+        if homeId in self.homes:
+            raise ValueError("home {} already exists".format(homeId))
+        home = SmartHome()
+        home.addDevices([SmartPlug() for number in range(plugs)] + [SmartWashingMachine() for number in range(washers)])
+        self.homes[homeId] = home
+        return [device.deviceId for device in home.getDevices()]
+    def addHomes(self, specs):
+        return [self.addHome(*spec) for spec in specs]
+    def removeHome(self, homeId):
+        del self.homes[homeId]
+    def apply(self, batches):
+        """
+        This applies a list of (homeId, commands) and returns, for each, the number of changes or the exception it raised.
+        """
+        results = []
+        for homeId, commands in batches:
+            try:
+                results.append(len(self.homes[homeId].applyBatch(commands)))
+            except Exception as error:
+                # A malformed command can raise anything, and it must not stop the other homes' batches.
+                results.append(error)
+        return results
+    def describe(self, homeId):
+        return [(device.deviceId, device.getDeviceName(), device.switchedOn,
+                 device.consumptionRate if isinstance(device, SmartPlug) else device.getWashMode())
+                for device in self.homes[homeId].getDevices()]
+    def homeStats(self, homeId):
+        return _homeStats(self.homes[homeId])
+    def stats(self):
+        """
+        This is the map step of the fleet totals: the totals of every home in this shard added together.
+        """
+        total = {"homes": 0, "devices": 0, "on": 0, "consumption": 0, "onByType": {}}
+        for home in self.homes.values():
+            _addStats(total, _homeStats(home))
+        return total
+
+def _homeStats(home):
+    return {"homes": 1, "devices": len(home.getDevices()), "on": home.countTotalOn(),
+            "consumption": home.getTotalConsumption(), "onByType": dict(home.onCountByType)}
+
+def _addStats(total, stats):
+    for key in ("homes", "devices", "on", "consumption"):
+        total[key] += stats[key]
+    for name, count in stats["onByType"].items():
+        total["onByType"][name] = total["onByType"].get(name, 0) + count
+
+def _serve(connection):
+    """
+    This is the loop each worker process runs: it takes (operation, arguments) messages and answers each one with
+    (True, result) or (False, exception).
+    """
+    shard = _Shard()
+    while True:
+        try:
+            message = connection.recv()
+        except EOFError:
+            return
+        if message is None:
+            return
+        operation, args = message
+        try:
+            connection.send((True, getattr(shard, operation)(*args)))
+        except Exception as error:
+            connection.send((False, error))
+
+class HomeManager():
+    """
+    This starts worker processes (one per CPU by default) and shards homes across them by home ID.
+    Use it as a context manager, or call close() to stop the workers.
+    """
+    def __init__(self, workers=None):
+        self.workerCount = workers or os.cpu_count() or 1
+        self.connections = []
+        self.processes = []
+        for number in range(self.workerCount):
+            parentEnd, childEnd = multiprocessing.Pipe()
+            process = multiprocessing.Process(target=_serve, args=(childEnd,), daemon=True)
+            process.start()
+            childEnd.close()
+            self.connections.append(parentEnd)
+            self.processes.append(process)
+    def __enter__(self):
+        return self
+    def __exit__(self, *exc):
+        self.close()
+    def close(self):
+        for connection in self.connections:
+            try:
+                connection.send(None)
+            except OSError:
+                pass
+        for process in self.processes:
+            process.join()
+        for connection in self.connections:
+            connection.close()
+        self.connections = []
+        self.processes = []
+    def _receive(self, shard):
+        ok, result = self.connections[shard].recv()
+        if not ok:
+            raise result
+        return result
+    def _call(self, homeId, operation, *args):
+        shard = shardOf(homeId, self.workerCount)
+        self.connections[shard].send((operation, args))
+        return self._receive(shard)
+    def _mapShards(self, messages):
+        """
+        This sends one message to each listed worker before waiting for any answer, so the workers run at the same time.
+        Returns the answers in the same order. Every answer is read before the first error is raised, so none is left in a
+        pipe to be taken as the answer to a later message.
+        """
+        for shard, message in messages:
+            self.connections[shard].send(message)
+        replies = [self.connections[shard].recv() for shard, message in messages]
+        for ok, result in replies:
+            if not ok:
+                raise result
+        return [result for ok, result in replies]
+    def addHome(self, homeId, plugs=0, washers=0):
+        """
+        This creates a home with the given number of smart plugs and washing machines, and returns their device IDs.
+        """
+        return self._call(homeId, "addHome", homeId, plugs, washers)
+    def addHomes(self, specs):
+        """
+        This creates many homes from a list of (homeId, plugs, washers), one message per worker. Returns a dict of each home's
+        device IDs.
+        """
+        byShard = {}
+        for spec in specs:
+            byShard.setdefault(shardOf(spec[0], self.workerCount), []).append(spec)
+        shards = list(byShard)
+        deviceIds = {}
+        for shard, answer in zip(shards, self._mapShards([(shard, ("addHomes", (byShard[shard],))) for shard in shards])):
+            for spec, ids in zip(byShard[shard], answer):
+                deviceIds[spec[0]] = ids
+        return deviceIds
+    def removeHome(self, homeId):
+        self._call(homeId, "removeHome", homeId)
+    def apply(self, homeId, commands):
+        """
+        This applies a list of SmartHome.applyBatch commands to one home, and returns the number of changes made.
+        """
+        result = self._call(homeId, "apply", [(homeId, commands)])[0]
+        if isinstance(result, Exception):
+            raise result
+        return result
+    def applyMany(self, batches):
+        """
+        This applies a list of (homeId, commands) across the fleet, sending each worker all of its homes' commands in one
+        message. Returns, in the same order, the number of changes for each batch or the exception that stopped it.
+        """
+        byShard = {}
+        for position, (homeId, commands) in enumerate(batches):
+            positions, shardBatches = byShard.setdefault(shardOf(homeId, self.workerCount), ([], []))
+            positions.append(position)
+            shardBatches.append((homeId, commands))
+        shards = list(byShard)
+        answers = self._mapShards([(shard, ("apply", (byShard[shard][1],))) for shard in shards])
+        results = [None] * len(batches)
+        for shard, answer in zip(shards, answers):
+            for position, result in zip(byShard[shard][0], answer):
+                results[position] = result
+        return results
+    def describe(self, homeId):
+        """
+        This returns (deviceId, name, switchedOn, rate or wash mode) for every device in a home, in order.
+        """
+        return self._call(homeId, "describe", homeId)
+    def homeStats(self, homeId):
+        return self._call(homeId, "homeStats", homeId)
+    def fleetStats(self):
+        """
+        This returns the number of homes and devices in the fleet, the number of devices on overall and by type, and the
+        total consumption, with every worker adding up its own homes in parallel.
+        """
+        total = {"homes": 0, "devices": 0, "on": 0, "consumption": 0, "onByType": {}}
+        for stats in self._mapShards([(shard, ("stats", ())) for shard in range(self.workerCount)]):
+            _addStats(total, stats)
+        return total
+    def countTotalOn(self):
+        return self.fleetStats()["on"]
+    def getTotalConsumption(self):
+        return self.fleetStats()["consumption"]
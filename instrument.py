@@ -0,0 +1,215 @@
+"""
+This is opt-in instrumentation for finding where the time goes between a click and the repaint that follows it.
+
+Nothing is measured until enable() is called, and until then the code runs exactly as written: enable() replaces the backend
+methods, frontend handlers and view methods with timing wrappers, and disable() puts the originals back, so there is no
+overhead at all while instrumentation is off. Every wrapped call adds to a counter and a latency histogram for its operation,
+and each frontend handler that leads to a repaint also records the time from the handler starting to the repaint finishing.
+The results can be printed as a text report or written as a stream of JSON lines.
+"""
+import json
+import math
+import time
+
+# Histogram buckets are a quarter of a power of two wide, so a bucket's bounds are within 19% of each other.
+_BUCKETS_PER_DOUBLING = 4
+
+class LatencyHistogram():
+    """
+    This counts call latencies in nanoseconds into logarithmic buckets, keeping the count, total, minimum and maximum exactly.
+    """
+    __slots__ = ("count", "total", "minimum", "maximum", "buckets")
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0
+        self.minimum = None
+        self.maximum = 0
+        self.buckets = {}
+    def record(self, nanoseconds):
+        self.count += 1
+        self.total += nanoseconds
+        if self.minimum is None or nanoseconds < self.minimum:
+            self.minimum = nanoseconds
+        if nanoseconds > self.maximum:
+            self.maximum = nanoseconds
+        bucket = int(math.log2(nanoseconds) * _BUCKETS_PER_DOUBLING) if nanoseconds > 0 else 0
+        self.buckets[bucket] = self.buckets.get(bucket, 0) + 1
+    def percentile(self, fraction):
+        """
+        This returns the upper bound of the bucket holding the given fraction of the calls, capped at the real maximum.
+        """
+        if not self.count:
+            return 0
+        wanted = fraction * self.count
+        seen = 0
+        for bucket in sorted(self.buckets):
+            seen += self.buckets[bucket]
+            if seen >= wanted:
+                return min(self.maximum, int(2 ** ((bucket + 1) / _BUCKETS_PER_DOUBLING)))
+        return self.maximum
+    def summary(self):
+        return {
+            "count": self.count,
+            "totalNs": self.total,
+            "meanNs": self.total // self.count if self.count else 0,
+            "minNs": self.minimum or 0,
+            "p50Ns": self.percentile(0.5),
+            "p95Ns": self.percentile(0.95),
+            "p99Ns": self.percentile(0.99),
+            "maxNs": self.maximum,
+        }
+
+# The frontend functions that run in response to the user.
+FRONTEND_HANDLERS = ("toggleDevice", "turnOnAllDevices", "turnOffAllDevices", "deleteDevice", "deleteSelection", "addDevice",
+                     "addDeviceProcess", "configWindow")
+# SmartHome methods that are not timed: batchChanges only builds a context manager, and the rest only touch widgets.
+_SKIPPED_HOME_METHODS = ("batchChanges", "displayTotalOn")
+
+class Instrumentation():
+    """
+    This holds the histograms for every instrumented operation, keyed by name, and the wrappers that fill them.
+    """
+    def __init__(self):
+        self.histograms = {}
+        self.patched = []
+        self.openEvent = None
+        self.repaintPending = False
+        self.started = None
+    def histogram(self, name):
+        histogram = self.histograms.get(name)
+        if histogram is None:
+            histogram = self.histograms[name] = LatencyHistogram()
+        return histogram
+    def reset(self):
+        self.histograms = {}
+        self.openEvent = None
+    @property
+    def enabled(self):
+        return bool(self.patched)
+    def _patch(self, owner, attribute, wrapper):
+        original = owner.__dict__[attribute] if isinstance(owner, type) else getattr(owner, attribute)
+        self.patched.append((owner, attribute, original))
+        setattr(owner, attribute, wrapper(original))
+    def _timed(self, name):
+        histogram = self.histogram(name)
+        clock = time.perf_counter_ns
+        def wrapper(function):
+            def timed(*args, **kwargs):
+                start = clock()
+                try:
+                    return function(*args, **kwargs)
+                finally:
+                    histogram.record(clock() - start)
+            timed.__wrapped__ = function
+            return timed
+        return wrapper
+    def _handler(self, name):
+        """
+        This times a frontend handler and opens an event that the next repaint closes. When the handler queues no repaint
+        the event is dropped.
+        """
+        histogram = self.histogram("frontend." + name)
+        clock = time.perf_counter_ns
+        def wrapper(function):
+            def timed(*args, **kwargs):
+                start = clock()
+                outermost = self.openEvent is None
+                if outermost:
+                    self.openEvent = (name, start)
+                try:
+                    return function(*args, **kwargs)
+                finally:
+                    histogram.record(clock() - start)
+                    if outermost and not self.repaintPending:
+                        self.openEvent = None
+            timed.__wrapped__ = function
+            return timed
+        return wrapper
+    def _schedule(self, function):
+        def scheduled(renderer):
+            self.repaintPending = True
+            return function(renderer)
+        return scheduled
+    def _flush(self, function):
+        histogram = self.histogram("view.RenderScheduler.flush")
+        clock = time.perf_counter_ns
+        def flushed(renderer):
+            start = clock()
+            try:
+                return function(renderer)
+            finally:
+                end = clock()
+                histogram.record(end - start)
+                self.repaintPending = False
+                if self.openEvent is not None:
+                    name, opened = self.openEvent
+                    self.histogram("event to repaint." + name).record(end - opened)
+                    self.openEvent = None
+        return flushed
+    def enable(self, frontend=None):
+        """
+        This starts timing the SmartHome and device methods, and when the frontend module is given its handlers and the view's
+        row, list and render methods too. The handlers must be instrumented before the window is set up, because the list view
+        keeps the toggle and configure handlers it was given.
+        """
+        if self.patched:
+            return
+        import backend
+        import tkview
+        self.started = time.time()
+        for attribute, value in list(vars(backend.SmartHome).items()):
+            if callable(value) and not attribute.startswith("_") and attribute not in _SKIPPED_HOME_METHODS:
+                self._patch(backend.SmartHome, attribute, self._timed("SmartHome." + attribute))
+        self._patch(backend.SmartHome, "__str__", self._timed("SmartHome.__str__"))
+        self._patch(backend.SmartDevice, "toggleSwitch", self._timed("SmartDevice.toggleSwitch"))
+        self._patch(backend.SmartPlug, "setConsumptionRate", self._timed("SmartPlug.setConsumptionRate"))
+        self._patch(backend.SmartWashingMachine, "setWashMode", self._timed("SmartWashingMachine.setWashMode"))
+        self._patch(tkview.DeviceRow, "setText", self._timed("view.DeviceRow.setText"))
+        self._patch(tkview.DeviceListView, "refresh", self._timed("view.DeviceListView.refresh"))
+        self._patch(tkview.RenderScheduler, "schedule", self._schedule)
+        self._patch(tkview.RenderScheduler, "flush", self._flush)
+        if frontend is not None:
+            for name in FRONTEND_HANDLERS:
+                self._patch(frontend, name, self._handler(name))
+    def disable(self):
+        """
+        This puts back every original method and function.
+        """
+        for owner, attribute, original in reversed(self.patched):
+            setattr(owner, attribute, original)
+        self.patched = []
+    def snapshot(self):
+        """
+        This returns the summaries of every histogram, for one line of the JSON stream.
+        """
+        return {"time": time.time(), "since": self.started,
+                "operations": {name: histogram.summary() for name, histogram in sorted(self.histograms.items())
+                               if histogram.count}}
+    def writeJson(self, file):
+        """
+        This appends the current snapshot to a file as one JSON line.
+        """
+        file.write(json.dumps(self.snapshot()) + "\n")
+        file.flush()
+    def streamJson(self, window, file, interval=10000):
+        """
+        This appends a snapshot to file every interval milliseconds from the Tk event loop of window.
+        """
+        def write():
+            self.writeJson(file)
+            window.after(interval, write)
+        window.after(interval, write)
+    def report(self):
+        """
+        This returns a text table of every operation that has been called, slowest total first.
+        """
+        lines = ["{:<44}{:>9}{:>11}{:>11}{:>11}{:>11}{:>11}{:>12}".format("operation", "calls", "mean us", "p50 us",
+                                                                          "p95 us", "p99 us", "max us", "total ms")]
+        histograms = sorted((item for item in self.histograms.items() if item[1].count), key=lambda item: -item[1].total)
+        for name, histogram in histograms:
+            summary = histogram.summary()
+            lines.append("{:<44}{:>9}{:>11.1f}{:>11.1f}{:>11.1f}{:>11.1f}{:>11.1f}{:>12.2f}".format(
+                name, summary["count"], summary["meanNs"] / 1e3, summary["p50Ns"] / 1e3, summary["p95Ns"] / 1e3,
+                summary["p99Ns"] / 1e3, summary["maxNs"] / 1e3, summary["totalNs"] / 1e6))
+        return "\n".join(lines)
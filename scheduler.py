@@ -0,0 +1,246 @@
+"""
+This runs timed automation rules against a smart home, such as "turn off the washing machines at 23:00" or "switch this plug
+on for 2 hours".
+
+Every rule waits in one heap ordered by when it is next due, so adding a rule and running the next one both take O(log n)
+however many rules there are. Cancelling a rule only marks it, and the heap is rebuilt without the cancelled rules once they
+make up most of it. Under Tk the scheduler keeps a single pending after() call, set for the earliest rule. Without a window
+the rules are run by calling runDue(), and a VirtualClock lets tests jump forward in time without waiting.
+"""
+import heapq
+import itertools
+import time
+from datetime import datetime, timedelta
+
+class VirtualClock():
+    """
+    This is a clock that only moves when it is told to, for running rules headless and deterministically.
+    """
+    def __init__(self, now=0.0):
+        self.now = now
+    def __call__(self):
+        return self.now
+    def advance(self, seconds):
+        self.now += seconds
+
+class Rule():
+    """
+    This is one scheduled rule. action is either a function taking the home, or a list of SmartHome.applyBatch commands.
+    A rule with an interval runs again every interval seconds, and a rule with a daily (hour, minute) time runs again at that
+    local time every day. Any other rule runs once.
+    """
+    __slots__ = ("action", "due", "interval", "daily", "name", "cancelled", "scheduler", "entry")
+
+    def __init__(self, action, due, interval=None, daily=None, name=None):
+        self.action = action
+        self.due = due
+        self.interval = interval
+        self.daily = daily
+        self.name = name
+        self.cancelled = False
+        self.scheduler = None
+        # The rule's heap entry while it is waiting to run. Any other entry for it is stale.
+        self.entry = None
+    def cancel(self):
+        """
+        This stops the rule from running again.
+        """
+        if self.cancelled:
+            return
+        self.cancelled = True
+        if self.scheduler is not None:
+            self.scheduler._cancelled(self)
+    def nextDue(self, now):
+        """
+        This returns when a recurring rule is next due after now, skipping the runs missed while the scheduler was behind, or
+        None for a rule that only runs once.
+        """
+        if self.interval is not None:
+            missed = int((now - self.due) // self.interval) + 1
+            return self.due + max(missed, 1) * self.interval
+        if self.daily is not None:
+            return nextDailyTime(now, *self.daily)
+        return None
+
+def nextDailyTime(now, hour, minute=0):
+    """
+    This returns the first time after now that the local clock reads hour:minute.
+    """
+    today = datetime.fromtimestamp(now)
+    due = today.replace(hour=hour, minute=minute, second=0, microsecond=0)
+    if due.timestamp() <= now:
+        due += timedelta(days=1)
+    return due.timestamp()
+
+class Scheduler():
+    """
+    This holds the automation rules for a smart home and runs each one when it is due. clock returns the current time in
+    seconds, time.time by default. Rules that fail, for example because their device has been deleted, are reported to onError
+    with the rule and the exception and the other rules carry on. By default the error is printed.
+    """
+    MAX_WAIT = 60000
+
+    def __init__(self, home, clock=time.time, onError=None):
+        self.home = home
+        self.clock = clock
+        self.onError = onError if onError is not None else (lambda rule, error: print("Rule {} failed: {}".format(
+            rule.name or rule.action, error)))
+        self.heap = []
+        self.sequence = itertools.count()
+        self.live = 0
+        self.cancelledCount = 0
+        self.window = None
+        self.pending = None
+        self.pendingDue = None
+    def __len__(self):
+        return self.live
+    def add(self, rule):
+        """
+        This schedules a rule and returns it, so it can be cancelled later. A cancelled rule can be added again, but adding a
+        rule that is still waiting to run raises ValueError.
+        """
+        if rule.entry is not None:
+            raise ValueError("rule {} is already scheduled".format(rule.name or rule.action))
+        rule.scheduler = self
+        rule.cancelled = False
+        self._push(rule)
+        self.live += 1
+        self._arm()
+        return rule
+    def _push(self, rule):
+        rule.entry = (rule.due, next(self.sequence), rule)
+        heapq.heappush(self.heap, rule.entry)
+    def at(self, when, action, name=None):
+        """
+        This runs an action once at the given time.
+        """
+        return self.add(Rule(action, when, name=name))
+    def after(self, delay, action, name=None):
+        """
+        This runs an action once, delay seconds from now.
+        """
+        return self.at(self.clock() + delay, action, name)
+    def every(self, interval, action, start=None, name=None):
+        """
+        This runs an action every interval seconds, first at start or one interval from now.
+        """
+        if interval <= 0:
+            raise ValueError("interval must be positive")
+        due = start if start is not None else self.clock() + interval
+        return self.add(Rule(action, due, interval=interval, name=name))
+    def daily(self, hour, minute, action, name=None):
+        """
+        This runs an action every day when the local time is hour:minute.
+        """
+        return self.add(Rule(action, nextDailyTime(self.clock(), hour, minute), daily=(hour, minute), name=name))
+    def switchOnFor(self, deviceId, seconds, name=None):
+        """
+        This switches a device on now and schedules it to be switched off after seconds. Returns the rule that switches it off.
+        """
+        self.home.applyBatch([("switchOn", deviceId)])
+        return self.after(seconds, [("switchOff", deviceId)], name)
+    def _cancelled(self, rule):
+        if rule.entry is None:
+            return
+        # The rule's entry is left in the heap, and is skipped once it is stale.
+        rule.entry = None
+        self.live -= 1
+        self.cancelledCount += 1
+        if self.cancelledCount > 64 and self.cancelledCount > len(self.heap) // 2:
+            self.heap = [entry for entry in self.heap if entry is entry[2].entry]
+            heapq.heapify(self.heap)
+            self.cancelledCount = 0
+    def nextDue(self):
+        """
+        This returns when the next rule is due, or None when there are no rules.
+        """
+        heap = self.heap
+        while heap and heap[0] is not heap[0][2].entry:
+            heapq.heappop(heap)
+            self.cancelledCount -= 1
+        return heap[0][0] if heap else None
+    def _run(self, rule):
+        try:
+            if callable(rule.action):
+                rule.action(self.home)
+            else:
+                self.home.applyBatch(rule.action)
+        except Exception as error:
+            self.onError(rule, error)
+    def runDue(self, now=None):
+        """
+        This runs every rule that is due by now, in order of when they were due, and returns how many ran. The home's
+        change listeners hear about all the changes together once the rules have run.
+        """
+        now = self.clock() if now is None else now
+        ran = 0
+        with self.home.batchChanges():
+            while True:
+                due = self.nextDue()
+                if due is None or due > now:
+                    break
+                rule = heapq.heappop(self.heap)[2]
+                rule.entry = None
+                self.live -= 1
+                # The rule is out of the heap while it runs, so an action that cancels its own rule just stops it recurring.
+                rule.scheduler = None
+                self._run(rule)
+                ran += 1
+                # An action that added its own rule again has already rescheduled it.
+                if not rule.cancelled and rule.entry is None:
+                    nextDue = rule.nextDue(now)
+                    if nextDue is not None:
+                        rule.due = nextDue
+                        rule.scheduler = self
+                        self._push(rule)
+                        self.live += 1
+        self._arm()
+        return ran
+    def runUntil(self, when):
+        """
+        This moves a VirtualClock forward to when, stopping at each due rule on the way so every rule sees the time it was due
+        at. Returns how many rules ran.
+        """
+        ran = 0
+        while True:
+            due = self.nextDue()
+            if due is None or due > when:
+                break
+            self.clock.now = max(self.clock.now, due)
+            ran += self.runDue()
+        self.clock.now = max(self.clock.now, when)
+        return ran
+    def attach(self, window):
+        """
+        This runs the rules from the Tk event loop of window, with one after() call pending for the earliest rule.
+        """
+        self.window = window
+        self._arm()
+    def detach(self):
+        if self.pending is not None:
+            self.window.after_cancel(self.pending)
+        self.window = None
+        self.pending = None
+        self.pendingDue = None
+    def _arm(self):
+        """
+        This makes sure the pending after() call is set for the earliest rule, moving it when a sooner rule is added.
+        The wait is capped at MAX_WAIT, so a rule far in the future is checked again now and then in case the system clock
+        has been changed.
+        """
+        if self.window is None:
+            return
+        due = self.nextDue()
+        if due == self.pendingDue:
+            return
+        if self.pending is not None:
+            self.window.after_cancel(self.pending)
+            self.pending = None
+        self.pendingDue = due
+        if due is not None:
+            delay = min(max(0, int((due - self.clock()) * 1000)), self.MAX_WAIT)
+            self.pending = self.window.after(delay, self._fire)
+    def _fire(self):
+        self.pending = None
+        self.pendingDue = None
+        self.runDue()
@@ -0,0 +1,99 @@
+"""
+This is a local server that simulates networked smart devices, for developing and benchmarking the driver layer without real
+hardware. It speaks the same newline delimited JSON protocol as the devices: every request carries an "id" that is echoed in
+the response, and requests on one connection are answered as soon as each one is done, so they can be pipelined.
+
+Run it with:
+    python simserver.py [--host HOST] [--port PORT] [--latency SECONDS] [--jitter SECONDS] [--failure-rate RATE]
+"""
+import argparse
+import asyncio
+import json
+import random
+from backend import WASH_MODE_NAMES
+
+class SimulatedDeviceServer():
+    """
+    This holds the state of every simulated device, keyed by device ID, and answers each request after latency seconds plus a
+    random extra of up to jitter seconds. A fraction failureRate of requests is dropped without an answer, to exercise the
+    driver's timeouts and retries. Devices are created the first time they are addressed.
+    """
+    def __init__(self, host="127.0.0.1", port=0, latency=0.05, jitter=0.0, failureRate=0.0):
+        self.host = host
+        self.port = port
+        self.latency = latency
+        self.jitter = jitter
+        self.failureRate = failureRate
+        self.devices = {}
+        self.requests = 0
+        self.server = None
+    async def start(self):
+        """
+        This starts listening, and returns the port, which is picked by the system when port is 0.
+        """
+        self.server = await asyncio.start_server(self.handleConnection, self.host, self.port)
+        self.port = self.server.sockets[0].getsockname()[1]
+        return self.port
+    async def stop(self):
+        self.server.close()
+        await self.server.wait_closed()
+    async def handleConnection(self, reader, writer):
+        tasks = set()
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                task = asyncio.ensure_future(self.answer(json.loads(line), writer))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+        except (ConnectionError, asyncio.CancelledError):
+            pass
+        finally:
+            for task in tasks:
+                task.cancel()
+            writer.close()
+    async def answer(self, request, writer):
+        self.requests += 1
+        await asyncio.sleep(self.latency + random.uniform(0, self.jitter))
+        if self.failureRate and random.random() < self.failureRate:
+            return
+        writer.write(json.dumps(self.handle(request)).encode() + b"\n")
+    def handle(self, request):
+        """
+        This applies one request to the simulated device and returns the response.
+        """
+        state = self.devices.setdefault(request["device"], {"on": False, "rate": 0, "mode": WASH_MODE_NAMES[0]})
+        op = request["op"]
+        if op == "set":
+            state["on"] = bool(request["on"])
+        elif op == "rate":
+            if not 0 <= request["value"] <= 150:
+                return {"id": request["id"], "ok": False, "error": "Invalid consumption rate entered!"}
+            state["rate"] = request["value"]
+        elif op == "mode":
+            if request["value"] not in WASH_MODE_NAMES:
+                return {"id": request["id"], "ok": False, "error": "Invalid wash mode entered!"}
+            state["mode"] = request["value"]
+        elif op != "get":
+            return {"id": request["id"], "ok": False, "error": "Unknown operation {}".format(op)}
+        return dict(state, id=request["id"], ok=True)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    args = parser.parse_args()
+
+    async def serve():
+        server = SimulatedDeviceServer(args.host, args.port, args.latency, args.jitter, args.failure_rate)
+        port = await server.start()
+        print("Simulating devices on {}:{} with {}s latency".format(args.host, port, args.latency))
+        await server.server.serve_forever()
+    asyncio.run(serve())
+
+if __name__ == "__main__":
+    main()
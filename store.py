@@ -0,0 +1,310 @@
+"""
+This saves a smart home to disk as a compact binary snapshot plus an append-only journal of the changes made since.
+
+Every change to the home is one fixed size journal record, so a toggle costs a single small write. Compaction folds the journal
+into a new snapshot on a background thread: the journal is rotated first, so the home keeps writing to a fresh journal while
+the old one is folded. On startup the snapshot is memory-mapped and read column by column, and only the journal records
+written after it are replayed.
+"""
+import mmap
+import os
+import struct
+import threading
+from array import array
+from itertools import compress
+import backend
+from backend import SmartPlug, SmartWashingMachine, WashMode
+from columnar import ColumnarSmartHome, EMPTY, PLUG, WASHER
+
+SNAPSHOT_MAGIC = b"SHSNAP01"
+# magic, generation of the first journal not folded in, number of devices
+SNAPSHOT_HEADER = struct.Struct("<8sQQ8x")
+# operation, argument byte, device ID, value
+RECORD = struct.Struct("<BBqd")
+
+ADD = 1
+DELETE = 2
+TOGGLE = 3
+RATE = 4
+MODE = 5
+MOVE = 6
+
+_EVENT_OPS = {"delete": DELETE, "toggle": TOGGLE}
+
+def encodeRecord(event, device, home=None):
+    """
+    This returns the journal record for a change to a device, as sent to home listeners.
+    For an add the argument byte holds the type code and the on flag, and the value holds the rate or wash mode code.
+    """
+    if event == "add":
+        if isinstance(device, SmartPlug):
+            return RECORD.pack(ADD, PLUG | device.switchedOn << 4, device.deviceId, device.consumptionRate)
+        return RECORD.pack(ADD, WASHER | device.switchedOn << 4, device.deviceId, device.washModeCode)
+    if event == "rate":
+        return RECORD.pack(RATE, 0, device.deviceId, device.consumptionRate)
+    if event == "mode":
+        return RECORD.pack(MODE, 0, device.deviceId, device.washModeCode)
+    if event == "move":
+        return RECORD.pack(MOVE, 0, device.deviceId, home.getIndex(device))
+    return RECORD.pack(_EVENT_OPS[event], 0, device.deviceId, 0)
+
+def iterRecords(data):
+    """
+    This yields (operation, argument, deviceId, value) for every whole record in a block of journal bytes. A record cut short
+    by a crash part way through a write is ignored.
+    """
+    usable = len(data) - len(data) % RECORD.size
+    return RECORD.iter_unpack(memoryview(data)[:usable])
+
+class _Columns():
+    """
+    This is the state of a saved home as one array per field, in device order. Deleted devices are left as empty rows until
+    the columns are compacted, so replaying a journal never has to shift the arrays.
+    """
+    def __init__(self):
+        self.ids = array("q")
+        self.rates = array("d")
+        self.types = array("B")
+        self.switches = array("B")
+        self.modes = array("B")
+        self.rowOf = None
+    def __len__(self):
+        return len(self.ids)
+    @classmethod
+    def fromSnapshot(cls, path):
+        """
+        This reads a snapshot file by memory-mapping it and copying each column straight out of the map.
+        Returns the columns and the generation of the first journal to replay after it.
+        """
+        columns = cls()
+        if not os.path.exists(path) or os.path.getsize(path) == 0:
+            return columns, 0
+        with open(path, "rb") as file:
+            with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                magic, generation, size = SNAPSHOT_HEADER.unpack_from(data)
+                if magic != SNAPSHOT_MAGIC:
+                    raise ValueError("{} is not a smart home snapshot".format(path))
+                offset = SNAPSHOT_HEADER.size
+                for name, itemSize in (("ids", 8), ("rates", 8), ("types", 1), ("switches", 1), ("modes", 1)):
+                    getattr(columns, name).frombytes(data[offset:offset + size * itemSize])
+                    offset += size * itemSize
+        return columns, generation
+    def write(self, path, generation):
+        """
+        This writes the live rows to a snapshot file. The file is written beside the old one and renamed over it, so a crash
+        leaves either the old snapshot or the new one.
+        """
+        self.compact()
+        temporary = path + ".tmp"
+        with open(temporary, "wb") as file:
+            file.write(SNAPSHOT_HEADER.pack(SNAPSHOT_MAGIC, generation, len(self.ids)))
+            for column in (self.ids, self.rates, self.types, self.switches, self.modes):
+                column.tofile(file)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temporary, path)
+    def compact(self):
+        """
+        This drops the empty rows left by deleted devices.
+        """
+        if self.types.count(EMPTY) == 0:
+            return
+        live = self.types.tobytes().translate(bytes([0] + [1] * 255))
+        for name in ("ids", "rates", "types", "switches", "modes"):
+            column = getattr(self, name)
+            setattr(self, name, array(column.typecode, compress(column, live)))
+        self.rowOf = None
+    def _rows(self):
+        if self.rowOf is None:
+            self.rowOf = dict(zip(self.ids, range(len(self.ids))))
+        return self.rowOf
+    def apply(self, operation, argument, deviceId, value):
+        """
+        This applies one journal record to the columns.
+        """
+        rowOf = self._rows()
+        if operation == ADD:
+            rowOf[deviceId] = len(self.ids)
+            self.ids.append(deviceId)
+            typeCode = argument & 0x0F
+            self.types.append(typeCode)
+            self.switches.append(argument >> 4)
+            self.rates.append(value if typeCode == PLUG else 0)
+            self.modes.append(int(value) if typeCode == WASHER else 0)
+            return
+        row = rowOf[deviceId]
+        if operation == TOGGLE:
+            self.switches[row] ^= 1
+        elif operation == RATE:
+            self.rates[row] = value
+        elif operation == MODE:
+            self.modes[row] = int(value)
+        elif operation == DELETE:
+            del rowOf[deviceId]
+            self.types[row] = EMPTY
+        elif operation == MOVE:
+            self.compact()
+            row = self._rows()[deviceId]
+            index = int(value)
+            for name in ("ids", "rates", "types", "switches", "modes"):
+                column = getattr(self, name)
+                item = column.pop(row)
+                column.insert(index, item)
+            self.rowOf = None
+    def replay(self, path):
+        """
+        This applies every record in a journal file.
+        """
+        with open(path, "rb") as file:
+            data = file.read()
+        for record in iterRecords(data):
+            self.apply(*record)
+
+class HomeStore():
+    """
+    This keeps a smart home saved in a directory holding a snapshot file and numbered journal files.
+
+    load() restores a home and attach() starts journaling its changes. Once compactAfter records have been written since the
+    last compaction, a background compaction folds them into a new snapshot. Set sync to fsync every record, otherwise records
+    are written straight to the operating system without being buffered in the process.
+    """
+    def __init__(self, path, compactAfter=100000, sync=False):
+        self.path = path
+        self.compactAfter = compactAfter
+        self.sync = sync
+        self.home = None
+        self.journal = None
+        self.generation = 0
+        self.records = 0
+        self.compactor = None
+        self.lock = threading.Lock()
+        os.makedirs(path, exist_ok=True)
+    def snapshotPath(self):
+        return os.path.join(self.path, "snapshot")
+    def journalPath(self, generation):
+        return os.path.join(self.path, "journal.{}".format(generation))
+    def journalGenerations(self):
+        """
+        This returns the generations of the journal files on disk, oldest first.
+        """
+        generations = []
+        for name in os.listdir(self.path):
+            prefix, _, suffix = name.partition(".")
+            if prefix == "journal" and suffix.isdigit():
+                generations.append(int(suffix))
+        return sorted(generations)
+    def _readColumns(self):
+        """
+        This reads the snapshot and replays the journals written after it.
+        """
+        columns, generation = _Columns.fromSnapshot(self.snapshotPath())
+        for journalGeneration in self.journalGenerations():
+            if journalGeneration >= generation:
+                columns.replay(self.journalPath(journalGeneration))
+        columns.compact()
+        return columns
+    def load(self, home=None):
+        """
+        This restores the saved devices into an empty smart home (a new one if none is given), with their saved IDs, and
+        starts journaling the home's changes. Returns the home.
+        """
+        if home is None:
+            home = backend.SmartHome()
+        columns = self._readColumns()
+        devices = []
+        append = devices.append
+        newPlug = SmartPlug.__new__
+        newWasher = SmartWashingMachine.__new__
+        modes = tuple(WashMode)
+        for deviceId, rate, typeCode, switch, mode in zip(columns.ids, columns.rates, columns.types, columns.switches,
+                                                          columns.modes):
+            if typeCode == PLUG:
+                device = newPlug(SmartPlug)
+                device.consumptionRate = int(rate) if rate == int(rate) else rate
+            else:
+                device = newWasher(SmartWashingMachine)
+                device.washModeCode = modes[mode]
+            device.deviceId = deviceId
+            device.switchedOn = switch == 1
+            device.home = None
+            append(device)
+        if columns.ids:
+            backend.reserveDeviceIds(max(columns.ids))
+        home.addDevices(devices)
+        self.attach(home)
+        return home
+    def loadColumnar(self):
+        """
+        This restores the saved devices into a ColumnarSmartHome, copying the columns across without building a python object
+        per device. Device IDs in a columnar home are row numbers, so they do not match the saved IDs.
+        """
+        columns = self._readColumns()
+        home = ColumnarSmartHome()
+        home.typeCodes = columns.types
+        home.switches = columns.switches
+        home.rates = columns.rates
+        home.washModes = columns.modes
+        home.liveCount = len(columns)
+        return home
+    def attach(self, home):
+        """
+        This starts writing every change to the home into a new journal.
+        """
+        generations = self.journalGenerations()
+        self.generation = generations[-1] + 1 if generations else 1
+        self.journal = open(self.journalPath(self.generation), "ab", buffering=0)
+        self.home = home
+        home.addListener(self.record)
+    def record(self, event, device):
+        """
+        This appends the record for one change to the journal. It is registered as a listener on the home.
+        """
+        self.journal.write(encodeRecord(event, device, self.home))
+        if self.sync:
+            os.fsync(self.journal.fileno())
+        self.records += 1
+        if self.records >= self.compactAfter:
+            self.compact()
+    def compact(self, wait=False):
+        """
+        This rotates the journal and folds everything up to the rotation into a new snapshot on a background thread.
+        Only one compaction runs at a time, asking for another while one is running does nothing.
+        """
+        with self.lock:
+            if self.compactor is not None and self.compactor.is_alive():
+                if not wait:
+                    return
+                self.compactor.join()
+            self.journal.close()
+            self.generation += 1
+            self.journal = open(self.journalPath(self.generation), "ab", buffering=0)
+            self.records = 0
+            self.compactor = threading.Thread(target=self._fold, args=(self.generation,), daemon=True)
+            self.compactor.start()
+        if wait:
+            self.compactor.join()
+    def _fold(self, generation):
+        """
+        This writes a snapshot of everything before the given journal generation and deletes the journals it replaces.
+        """
+        columns, snapshotGeneration = _Columns.fromSnapshot(self.snapshotPath())
+        folded = [old for old in self.journalGenerations() if snapshotGeneration <= old < generation]
+        for old in folded:
+            columns.replay(self.journalPath(old))
+        columns.write(self.snapshotPath(), generation)
+        for old in self.journalGenerations():
+            if old < generation:
+                os.remove(self.journalPath(old))
+    def close(self, compact=False):
+        """
+        This stops journaling, optionally folding the journal into the snapshot first.
+        """
+        if self.journal is None:
+            return
+        if compact:
+            self.compact(wait=True)
+        elif self.compactor is not None:
+            self.compactor.join()
+        self.home.removeListener(self.record)
+        self.journal.close()
+        self.journal = None
@@ -0,0 +1,232 @@
+"""
+This is a local server that streams the state of a smart home to remote clients, such as dashboards, and takes commands from
+them. It speaks newline delimited JSON over TCP or a Unix socket.
+
+A client is sent one snapshot of every device when it connects, and after that only deltas: the changes made to the home are
+collected for batchInterval seconds and sent together, with the changes to one device merged into a single entry. A client's
+first delta starts exactly where its snapshot ends. Messages sent to a client:
+    {"type": "snapshot", "devices": [{"id": 1, "type": "plug", "on": false, "rate": 0}, ...]}
+    {"type": "delta", "changes": [{"id": 1, "on": true}, {"id": 7, "add": {...}}, {"id": 3, "deleted": true}, ...]}
+    {"type": "result", "id": 12, "ok": true, "changes": 3}
+Entries in a delta are applied in order. An added device goes to the end of the home and a moved device carries its new
+"index". Clients send commands as {"id": 12, "commands": [["toggle", 1], ["setConsumptionRate", 2, 50], ...]}, which are
+applied together with SmartHome.applyBatch.
+
+Run a demo home with:
+    python streaming.py [--host HOST] [--port PORT | --unix PATH] [--devices N] [--churn CHANGES_PER_SECOND]
+"""
+import argparse
+import asyncio
+import concurrent.futures
+import json
+import random
+from backend import SmartHome, SmartPlug, SmartWashingMachine
+
+def deviceState(device):
+    """
+    This returns the full state of a device as it is sent to clients.
+    """
+    if isinstance(device, SmartPlug):
+        return {"id": device.deviceId, "type": "plug", "on": device.switchedOn, "rate": device.consumptionRate}
+    return {"id": device.deviceId, "type": "washer", "on": device.switchedOn, "mode": device.getWashMode()}
+
+def deviceDelta(event, device, home):
+    """
+    This returns the fields a change sets on a device.
+    """
+    if event == "toggle":
+        return {"on": device.switchedOn}
+    if event == "rate":
+        return {"rate": device.consumptionRate}
+    if event == "mode":
+        return {"mode": device.getWashMode()}
+    if event == "add":
+        return {"add": deviceState(device)}
+    if event == "delete":
+        return {"deleted": True}
+    return {"index": home.getIndex(device)}
+
+class HomeStreamServer():
+    """
+    This streams a smart home to every connected client. The server runs on an asyncio event loop, and the home can live on
+    another thread, such as the Tk main thread: callInHome is then given functions to run on the home's thread (for example
+    MainThreadDispatcher.call), and by default they are run straight away on the loop. The server must be created on the home's
+    thread, so it can start listening to the home's changes. A client that falls more than maxBuffer bytes behind is
+    disconnected rather than letting its messages pile up.
+    """
+    def __init__(self, home, host="127.0.0.1", port=0, path=None, batchInterval=0.05, callInHome=None, maxBuffer=16 << 20):
+        self.home = home
+        self.host = host
+        self.port = port
+        self.path = path
+        self.batchInterval = batchInterval
+        self.callInHome = callInHome
+        self.maxBuffer = maxBuffer
+        self.loop = None
+        self.server = None
+        self.clients = set()
+        # The pending changes are segments of {deviceId: fields}. A move starts a new segment, so moves stay in order with
+        # the other changes.
+        self.segments = [{}]
+        self.flushHandle = None
+        # The deltas worked out on the home's thread that have not been handed to the event loop yet.
+        self.changed = []
+        home.addListener(self.onChange)
+        home.addChangeListener(self.onChanges)
+    async def start(self):
+        """
+        This starts listening, and returns the port, which is picked by the system when port is 0, or the socket path.
+        """
+        self.loop = asyncio.get_running_loop()
+        if self.path is not None:
+            self.server = await asyncio.start_unix_server(self.handleConnection, path=self.path)
+            return self.path
+        self.server = await asyncio.start_server(self.handleConnection, self.host, self.port)
+        self.port = self.server.sockets[0].getsockname()[1]
+        return self.port
+    async def stop(self):
+        self.home.removeListener(self.onChange)
+        self.home.removeChangeListener(self.onChanges)
+        self.server.close()
+        for writer in list(self.clients):
+            writer.close()
+        await self.server.wait_closed()
+    def onChange(self, event, device):
+        """
+        This is registered as a listener on the home. It works out the delta on the home's thread as each change is made,
+        while the device still holds the values the change set and sits where a move put it, even inside a batch.
+        """
+        if self.loop is not None:
+            self.changed.append((event, device.deviceId, deviceDelta(event, device, self.home)))
+    def onChanges(self, changes):
+        """
+        This is registered as a change listener on the home, and hands the deltas of a change, or of a whole batch, to the
+        event loop together.
+        """
+        self._handOver()
+    def _handOver(self):
+        if self.changed:
+            deltas = self.changed
+            self.changed = []
+            self.loop.call_soon_threadsafe(self._collect, deltas)
+    def _collect(self, deltas):
+        for event, deviceId, fields in deltas:
+            if event == "move":
+                self.segments.append({deviceId: fields})
+                self.segments.append({})
+                continue
+            segment = self.segments[-1]
+            entry = segment.get(deviceId)
+            if event == "delete" or entry is None:
+                segment[deviceId] = fields
+            elif "add" in entry:
+                entry["add"].update(fields)
+            else:
+                entry.update(fields)
+        if self.flushHandle is None:
+            self.flushHandle = self.loop.call_later(self.batchInterval, self.flush)
+    def flush(self):
+        """
+        This sends the changes collected since the last flush to every client as one delta.
+        """
+        if self.flushHandle is not None:
+            self.flushHandle.cancel()
+            self.flushHandle = None
+        changes = [dict(fields, id=deviceId) for segment in self.segments for deviceId, fields in segment.items()]
+        self.segments = [{}]
+        if changes and self.clients:
+            self._broadcast(json.dumps({"type": "delta", "changes": changes}).encode() + b"\n")
+    def _broadcast(self, message):
+        for writer in list(self.clients):
+            self._send(writer, message)
+    def _send(self, writer, message):
+        if writer.transport.get_write_buffer_size() > self.maxBuffer:
+            self.clients.discard(writer)
+            writer.close()
+            return
+        writer.write(message)
+    async def _inHome(self, function):
+        """
+        This runs a function on the home's thread and returns its result.
+        """
+        if self.callInHome is None:
+            return function()
+        future = concurrent.futures.Future()
+        def run():
+            try:
+                future.set_result(function())
+            except Exception as error:
+                future.set_exception(error)
+        self.callInHome(run)
+        return await asyncio.wrap_future(future)
+    async def handleConnection(self, reader, writer):
+        def join(devices):
+            # Changes collected before the snapshot are sent to the other clients first, and the snapshot is written here
+            # rather than after the await, so the new client's first delta starts where its snapshot ends.
+            if writer.is_closing():
+                return
+            self.flush()
+            writer.write(json.dumps({"type": "snapshot", "devices": devices}).encode() + b"\n")
+            self.clients.add(writer)
+        def snapshot():
+            # Joining is queued on the loop from the home's thread, so it comes after every change the snapshot includes
+            # has been handed over and before any later one. Deltas not handed over yet, such as those of a batch that was
+            # undone, go first. The home's lock is held throughout, so no change made from another thread can fall between
+            # the deltas handed over and the snapshot.
+            with self.home.lock:
+                self._handOver()
+                self.loop.call_soon_threadsafe(join, [deviceState(device) for device in self.home.getDevices()])
+        try:
+            await self._inHome(snapshot)
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                await self.answer(json.loads(line), writer)
+        except (ConnectionError, asyncio.CancelledError, ValueError):
+            pass
+        finally:
+            self.clients.discard(writer)
+            writer.close()
+    async def answer(self, request, writer):
+        """
+        This applies a client's commands and sends back the result. A request that is not shaped like the commands described
+        above gets a result that is not ok, rather than dropping the client.
+        """
+        requestId = request.get("id") if isinstance(request, dict) else None
+        try:
+            if not isinstance(request, dict):
+                raise ValueError("a request must be a JSON object")
+            commands = request.get("commands", [])
+            if not isinstance(commands, list) or not all(isinstance(command, list) for command in commands):
+                raise ValueError("commands must be a list of lists")
+            commands = [tuple(command) for command in commands]
+            changes = await self._inHome(lambda: self.home.applyBatch(commands))
+            result = {"type": "result", "id": requestId, "ok": True, "changes": len(changes)}
+        except (KeyError, ValueError, TypeError) as error:
+            result = {"type": "result", "id": requestId, "ok": False, "error": str(error)}
+        self._send(writer, json.dumps(result).encode() + b"\n")
+
+def main():
+    parser = argparse.ArgumentParser(description="Stream a demo smart home to dashboard clients.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8766)
+    parser.add_argument("--unix", help="listen on a Unix socket at this path instead of TCP")
+    parser.add_argument("--devices", type=int, default=1000)
+    parser.add_argument("--churn", type=float, default=100, help="random toggles per second")
+    args = parser.parse_args()
+
+    async def serve():
+        home = SmartHome()
+        home.addDevices([SmartPlug() if number % 2 == 0 else SmartWashingMachine() for number in range(args.devices)])
+        server = HomeStreamServer(home, args.host, args.port, args.unix)
+        address = await server.start()
+        print("Streaming {} devices on {}".format(args.devices, address))
+        while args.churn > 0:
+            await asyncio.sleep(1 / args.churn)
+            home.toggleSwitch(random.randrange(args.devices))
+        await server.server.serve_forever()
+    asyncio.run(serve())
+
+if __name__ == "__main__":
+    main()
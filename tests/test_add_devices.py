@@ -0,0 +1,42 @@
+import pytest
+
+from backend import SmartHome, SmartPlug, SmartWashingMachine
+
+@pytest.fixture(params=[0, 3], ids=["empty home", "home with devices"])
+def home(request):
+    home = SmartHome(checkConsistency=True)
+    home.addDevices([SmartPlug() for number in range(request.param)])
+    return home
+
+def test_device_in_another_home_raises_and_adds_nothing(home):
+    other = SmartHome()
+    taken = SmartPlug()
+    other.addDevice(taken)
+    before = list(home.getDevices())
+    with pytest.raises(ValueError):
+        home.addDevices([SmartPlug(), taken, SmartWashingMachine()])
+    assert list(home.getDevices()) == before
+    assert taken.home is other
+
+def test_device_listed_twice_raises_and_adds_nothing(home):
+    plug = SmartPlug()
+    before = list(home.getDevices())
+    with pytest.raises(ValueError):
+        home.addDevices([plug, SmartWashingMachine(), plug])
+    assert list(home.getDevices()) == before
+    assert plug.home is None
+
+def test_device_already_in_this_home_raises(home):
+    plug = SmartPlug()
+    home.addDevice(plug)
+    with pytest.raises(ValueError):
+        home.addDevices([plug])
+    assert len(home.getDevices()) == len(set(device.deviceId for device in home.getDevices()))
+
+def test_devices_are_added_in_order(home):
+    before = list(home.getDevices())
+    devices = [SmartPlug(), SmartWashingMachine(), SmartPlug()]
+    devices[1].toggleSwitch()
+    home.addDevices(devices)
+    assert list(home.getDevices()) == before + devices
+    assert home.countTotalOn() == 1
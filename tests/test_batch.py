@@ -0,0 +1,55 @@
+import pytest
+
+from backend import SmartHome, SmartPlug, SmartWashingMachine
+
+def makeHome(size):
+    home = SmartHome(checkConsistency=True)
+    home.addDevices([SmartPlug() if number % 2 == 0 else SmartWashingMachine() for number in range(size)])
+    return home
+
+def test_changes_are_returned_from_a_home_nobody_listens_to():
+    home = makeHome(4)
+    plug, washer = list(home.getDevices())[:2]
+    changes = home.applyBatch([("toggle", plug.deviceId), ("setWashMode", washer.deviceId, "Eco"),
+                               ("setConsumptionRate", plug.deviceId, 30)])
+    assert changes == [("toggle", plug), ("mode", washer), ("rate", plug)]
+    assert not home.observed
+
+def test_change_listeners_hear_a_batch_once():
+    home = makeHome(4)
+    heard = []
+    home.addChangeListener(heard.append)
+    changes = home.applyBatch([("turnOnAll",)])
+    assert heard == [changes]
+    assert len(changes) == 4
+    assert home.observed
+
+def test_failed_batch_leaves_the_home_untouched():
+    home = makeHome(4)
+    plug = home.getDeviceAt(0)
+    heard = []
+    home.addChangeListener(heard.append)
+    with pytest.raises(ValueError):
+        home.applyBatch([("toggle", plug.deviceId), ("setConsumptionRate", plug.deviceId, 1000)])
+    with pytest.raises(KeyError):
+        home.applyBatch([("toggle", plug.deviceId), ("toggle", -1)])
+    assert heard == []
+    assert home.countTotalOn() == 0
+    assert plug.consumptionRate == 0
+
+def test_step_failing_part_way_undoes_what_it_changed():
+    home = makeHome(4)
+    plug = home.getDeviceAt(0)
+    calls = []
+    def listener(event, device):
+        calls.append(device)
+        if len(calls) == 3:
+            raise OSError("listener failed")
+    heard = []
+    home.addListener(listener)
+    home.addChangeListener(heard.append)
+    with pytest.raises(OSError):
+        home.applyBatch([("toggle", plug.deviceId), ("turnOnAll",)])
+    assert [device.switchedOn for device in home.getDevices()] == [False] * 4
+    assert heard == []
+    home.verifyAggregates()
@@ -0,0 +1,93 @@
+import random
+
+import pytest
+
+import columnar
+from backend import SmartHome, SmartPlug, SmartWashingMachine, WASH_MODE_NAMES
+from columnar import ColumnarPlug, ColumnarSmartHome
+
+@pytest.fixture(params=["array", "numpy"])
+def bulk(request, monkeypatch):
+    """
+    This runs a test once with the array module doing the bulk operations and once with numpy, when it is installed.
+    """
+    if request.param == "numpy":
+        monkeypatch.setattr(columnar, "numpy", pytest.importorskip("numpy"))
+    else:
+        monkeypatch.setattr(columnar, "numpy", None)
+    return request.param
+
+def state(device):
+    if isinstance(device, (SmartPlug, ColumnarPlug)):
+        return (device.getDeviceName(), device.switchedOn, device.getConsumptionRate())
+    return (device.getDeviceName(), device.switchedOn, device.getWashMode())
+
+def addPlug(home, columns, rate, switchedOn):
+    plug = SmartPlug()
+    plug.setConsumptionRate(rate)
+    if switchedOn:
+        plug.toggleSwitch()
+    home.addDevice(plug)
+    columns.addPlug(rate, switchedOn)
+
+def addWasher(home, columns, mode, switchedOn):
+    washer = SmartWashingMachine()
+    washer.setWashMode(mode)
+    if switchedOn:
+        washer.toggleSwitch()
+    home.addDevice(washer)
+    columns.addWashingMachine(mode, switchedOn)
+
+def checkSame(home, columns):
+    assert [state(device) for device in home.getDevices()] == [state(device) for device in columns.getDevices()]
+    assert columns.countTotalOn() == home.countTotalOn()
+    for name in (SmartPlug.name, SmartWashingMachine.name):
+        assert columns.countTotalOnByType(name) == home.countTotalOnByType(name)
+    assert columns.getTotalConsumption() == pytest.approx(home.getTotalConsumption())
+
+def test_columnar_home_matches_the_smart_home(bulk):
+    chooser = random.Random(9)
+    home = SmartHome()
+    columns = ColumnarSmartHome()
+    for number in range(30):
+        addPlug(home, columns, chooser.randrange(151), chooser.random() < 0.5)
+        addWasher(home, columns, chooser.choice(WASH_MODE_NAMES), chooser.random() < 0.5)
+    checkSame(home, columns)
+    for step in range(800):
+        size = len(home.getDevices())
+        index = chooser.randrange(size)
+        choice = chooser.random()
+        if choice < 0.35:
+            home.toggleSwitch(index)
+            columns.toggleSwitch(index)
+        elif choice < 0.5:
+            device, row = home.getDeviceAt(index), columns.getDeviceAt(index)
+            if isinstance(device, SmartPlug):
+                rate = chooser.randrange(151)
+                device.setConsumptionRate(rate)
+                row.setConsumptionRate(rate)
+            else:
+                mode = chooser.choice(WASH_MODE_NAMES)
+                device.setWashMode(mode)
+                row.setWashMode(mode)
+        elif choice < 0.65 and size > 5:
+            home.deleteDeviceAt(index)
+            columns.deleteDeviceAt(index)
+        elif choice < 0.75:
+            addPlug(home, columns, chooser.randrange(151), chooser.random() < 0.5)
+        elif choice < 0.85:
+            addWasher(home, columns, chooser.choice(WASH_MODE_NAMES), chooser.random() < 0.5)
+        elif choice < 0.9:
+            home.addDevices([SmartPlug() for number in range(5)])
+            columns.addDevices(SmartPlug.name, 5)
+        elif choice < 0.95:
+            home.turnOnAll()
+            columns.turnOnAll()
+        else:
+            home.turnOffAll()
+            columns.turnOffAll()
+        checkSame(home, columns)
+        device = home.getDeviceAt(index % len(home.getDevices()))
+        row = columns.getDeviceAt(index % len(columns.getDevices()))
+        assert columns.getIndex(row) == home.getIndex(device)
+    home.verifyAggregates()
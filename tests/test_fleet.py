@@ -0,0 +1,38 @@
+import pytest
+
+from fleet import HomeManager, shardOf
+
+@pytest.fixture(scope="module")
+def manager():
+    with HomeManager(workers=2) as manager:
+        yield manager
+
+def homeIds(start, count):
+    """
+    This returns count home IDs from start on that include homes on both workers.
+    """
+    ids = ["home{}".format(number) for number in range(start, start + count)]
+    assert len(set(shardOf(homeId, 2) for homeId in ids)) == 2
+    return ids
+
+def test_duplicate_home_raises_and_later_calls_get_their_own_answers(manager):
+    ids = homeIds(0, 6)
+    manager.addHomes([(homeId, 2, 1) for homeId in ids])
+    with pytest.raises(ValueError):
+        manager.addHomes([(homeId, 1, 0) for homeId in homeIds(100, 6)] + [(ids[0], 1, 0)])
+    assert len(manager.describe(ids[1])) == 3
+    stats = manager.fleetStats()
+    assert stats["homes"] == 12
+    assert stats["devices"] == 6 * 3 + 6
+
+def test_malformed_command_only_fails_its_own_batch(manager):
+    ids = homeIds(200, 6)
+    deviceIds = manager.addHomes([(homeId, 2, 0) for homeId in ids])
+    batches = [(homeId, [("toggle", deviceIds[homeId][0])]) for homeId in ids]
+    batches.insert(1, (ids[0], [5]))
+    batches.append(("missing", [("toggle", 1)]))
+    results = manager.applyMany(batches)
+    assert isinstance(results[1], TypeError)
+    assert isinstance(results[-1], KeyError)
+    assert results[:1] + results[2:-1] == [1] * len(ids)
+    assert manager.describe(ids[2])[0][2]
@@ -0,0 +1,68 @@
+import importlib
+import sys
+
+import pytest
+
+from backend import SmartPlug
+from benchmarks import stubtk
+
+@pytest.fixture
+def frontend(monkeypatch):
+    """
+    This imports a fresh frontend drawn on the stub widgets in benchmarks.stubtk, and opens its main window. The real modules
+    are put back afterwards.
+    """
+    monkeypatch.setitem(sys.modules, "tkinter", stubtk)
+    for name in ("tkview", "frontend"):
+        monkeypatch.delitem(sys.modules, name, raising=False)
+    monkeypatch.setattr(stubtk, "pending", [])
+    module = importlib.import_module("frontend")
+    module.home.addDevices([SmartPlug() for number in range(20)])
+    module.mainWin = stubtk.Tk()
+    module.dispatcher = module.MainThreadDispatcher(module.mainWin)
+    module.setUpMainWin()
+    stubtk.runPending()
+    return module
+
+@pytest.fixture
+def created(monkeypatch):
+    """
+    This collects every Toplevel, Label and Button made while the test runs.
+    """
+    widgets = []
+    for widget in (stubtk.Toplevel, stubtk.Label, stubtk.Button):
+        def init(self, *args, original=widget.__init__, **options):
+            original(self, *args, **options)
+            widgets.append(self)
+        monkeypatch.setattr(widget, "__init__", init)
+    return widgets
+
+def confirmButton(widgets):
+    return next(widget for widget in widgets if isinstance(widget, stubtk.Button) and widget.options.get("text") == "Delete")
+
+def test_delete_button_on_a_row_deletes_its_device(frontend, created):
+    home = frontend.home
+    device = home.getDeviceAt(2)
+    row = frontend.listView.rowOf[device.deviceId]
+    row.deleteBtn.options["command"]()
+    assert any(isinstance(widget, stubtk.Toplevel) for widget in created)
+    assert any(isinstance(widget, stubtk.Label) and widget.options.get("text") == "Delete 3.{}?".format(SmartPlug.name)
+               for widget in created)
+    confirmButton(created).options["command"]()
+    stubtk.runPending()
+    assert device.home is None and len(home.getDevices()) == 19
+    assert device.deviceId not in frontend.listView.rowOf
+    assert all(row.device is home.getDeviceAt(row.rowNum) for row in frontend.listView.rowOf.values())
+
+def test_deleting_a_device_that_is_already_gone_does_nothing(frontend, created):
+    home = frontend.home
+    first, second = home.getDeviceAt(0), home.getDeviceAt(1)
+    frontend.listView.rowOf[first.deviceId].deleteBtn.options["command"]()
+    home.deleteDevice(first.deviceId)
+    confirmButton(created).options["command"]()
+    assert len(home.getDevices()) == 19
+    del created[:]
+    home.deleteDevice(second.deviceId)
+    frontend.deleteDevice(second)
+    assert created == []
+    assert len(home.getDevices()) == 18
@@ -0,0 +1,95 @@
+import random
+
+import pytest
+
+from backend import SmartHome, SmartPlug, SmartWashingMachine
+
+def makeHome(size):
+    home = SmartHome(checkConsistency=True)
+    home.addDevices([SmartPlug() if number % 2 == 0 else SmartWashingMachine() for number in range(size)])
+    return home
+
+def assertOrder(home, model):
+    assert [device.deviceId for device in home.getDevices()] == model
+    assert len(home.getDevices()) == len(model)
+    for position, deviceId in enumerate(model):
+        assert home.getIndex(home.getDevice(deviceId)) == position
+        assert home.getDeviceAt(position).deviceId == deviceId
+
+def test_move_to_negative_index_counts_from_the_end():
+    home = makeHome(5)
+    model = [device.deviceId for device in home.getDevices()]
+    first = model.pop(0)
+    home.moveDevice(first, -1)
+    model.append(first)
+    assertOrder(home, model)
+    home.moveDevice(model[1], -5)
+    model.insert(0, model.pop(1))
+    assertOrder(home, model)
+
+@pytest.mark.parametrize("index", [5, -6, 100])
+def test_move_out_of_range_raises_and_leaves_the_order_alone(index):
+    home = makeHome(5)
+    model = [device.deviceId for device in home.getDevices()]
+    with pytest.raises(IndexError):
+        home.moveDevice(model[2], index)
+    assertOrder(home, model)
+
+def test_random_operations_match_a_list():
+    chooser = random.Random(7)
+    home = makeHome(20)
+    model = [device.deviceId for device in home.getDevices()]
+    for step in range(3000):
+        choice = chooser.random()
+        if choice < 0.3:
+            device = SmartPlug()
+            home.addDevice(device)
+            model.append(device.deviceId)
+        elif choice < 0.5 and model:
+            position = chooser.randrange(-len(model), len(model))
+            home.deleteDeviceAt(position)
+            del model[position]
+        elif model:
+            deviceId = chooser.choice(model)
+            index = chooser.randrange(-len(model), len(model))
+            home.moveDevice(deviceId, index)
+            model.remove(deviceId)
+            model.insert(index % (len(model) + 1), deviceId)
+        if step % 100 == 0:
+            assertOrder(home, model)
+    assertOrder(home, model)
+
+def test_adding_and_deleting_over_and_over_keeps_the_index_small():
+    home = makeHome(10)
+    for step in range(20000):
+        device = SmartPlug()
+        home.addDevice(device)
+        if step % 3 == 0:
+            home.moveDevice(device.deviceId, step % 10)
+        home.deleteDevice(device.deviceId)
+    assert len(home.order.slots) <= 256
+    assert len(home.order.tree) == len(home.order.slots)
+    home.verifyAggregates()
+
+def test_deleting_most_devices_shrinks_the_index():
+    home = SmartHome()
+    home.addDevices([SmartPlug() for number in range(5000)])
+    model = [device.deviceId for device in home.getDevices()]
+    for deviceId in model[10:]:
+        home.deleteDevice(deviceId)
+    assert len(home.order.slots) <= 256
+    assertOrder(home, model[:10])
+
+def test_device_view_behaves_like_a_list():
+    home = makeHome(5)
+    devices = list(home.getDevices())
+    view = home.getDevices()
+    assert view[1:3] == devices[1:3]
+    assert view[::-1] == devices[::-1]
+    assert view[-1] is devices[-1]
+    assert view == devices
+    assert view == home.getDevices()
+    assert view != devices[:4]
+    assert repr(view) == repr(devices)
+    home.deleteDeviceAt(0)
+    assert view == devices[1:]
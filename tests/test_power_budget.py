@@ -0,0 +1,167 @@
+import random
+
+import pytest
+
+from backend import SmartHome, SmartPlug, SmartWashingMachine
+
+def makePlugs(home, rates):
+    plugs = []
+    for rate in rates:
+        plug = SmartPlug()
+        plug.setConsumptionRate(rate)
+        plugs.append(plug)
+    home.addDevices(plugs)
+    return plugs
+
+def used(home):
+    return sum(device.consumptionRate for device in home.getDevices() if isinstance(device, SmartPlug) and device.switchedOn)
+
+def checkBudget(home):
+    """
+    This checks the budget against a count of every plug: the plugs that are on fit under the cap, the waiting plugs are off,
+    and the first waiting plug could not be let on even by switching off every running plug of lower priority.
+    """
+    cap = home.getPowerBudget()
+    assert used(home) <= cap
+    waiting = home.getWaitingPlugs()
+    assert all(not plug.switchedOn and plug.consumptionRate > 0 for plug in waiting)
+    if waiting:
+        first = waiting[0]
+        priority = home.priorities.get(first.deviceId, 0)
+        lower = sum(device.consumptionRate for device in home.getDevices() if isinstance(device, SmartPlug)
+                    and device.switchedOn and home.priorities.get(device.deviceId, 0) < priority)
+        assert first.consumptionRate > cap - used(home) + lower
+        priorities = [home.priorities.get(plug.deviceId, 0) for plug in waiting]
+        assert priorities == sorted(priorities, reverse=True)
+
+def test_plugs_that_do_not_fit_wait_their_turn_for_room():
+    home = SmartHome(checkConsistency=True)
+    home.setPowerBudget(100)
+    first, second, third = makePlugs(home, [60, 50, 30])
+    first.toggleSwitch()
+    second.toggleSwitch()
+    assert first.switchedOn and not second.switchedOn
+    assert home.getWaitingPlugs() == [second]
+    # The smaller plug would fit, but it does not jump the queue.
+    third.toggleSwitch()
+    assert not third.switchedOn
+    assert home.getWaitingPlugs() == [second, third]
+    checkBudget(home)
+    first.toggleSwitch()
+    assert second.switchedOn and third.switchedOn
+    assert home.getWaitingPlugs() == []
+    checkBudget(home)
+
+def test_higher_priority_plug_switches_lower_ones_off():
+    home = SmartHome(checkConsistency=True)
+    low, high = makePlugs(home, [80, 70])
+    home.setPowerBudget(100, {high.deviceId: 2})
+    low.toggleSwitch()
+    high.toggleSwitch()
+    assert high.switchedOn and not low.switchedOn
+    assert home.getWaitingPlugs() == [low]
+    high.setConsumptionRate(10)
+    assert low.switchedOn
+    checkBudget(home)
+
+def test_switching_a_waiting_plug_off_stops_it_waiting():
+    home = SmartHome(checkConsistency=True)
+    home.setPowerBudget(50)
+    first, second = makePlugs(home, [40, 40])
+    first.toggleSwitch()
+    second.toggleSwitch()
+    assert home.getWaitingPlugs() == [second]
+    home.applyBatch([("switchOff", second.deviceId)])
+    assert home.getWaitingPlugs() == []
+    first.toggleSwitch()
+    assert not second.switchedOn
+
+def test_negative_cap_and_priorities_for_washers_raise():
+    home = SmartHome(checkConsistency=True)
+    washer = SmartWashingMachine()
+    home.addDevice(washer)
+    with pytest.raises(ValueError):
+        home.setPowerBudget(-1)
+    with pytest.raises(ValueError):
+        home.setPriority(washer.deviceId, 1)
+
+def test_random_changes_keep_the_budget():
+    chooser = random.Random(17)
+    home = SmartHome(checkConsistency=True)
+    makePlugs(home, [chooser.randrange(151) for number in range(40)])
+    home.addDevices([SmartWashingMachine() for number in range(5)])
+    home.setPowerBudget(600, {device.deviceId: chooser.randrange(4) for device in home.getDevices()
+                              if isinstance(device, SmartPlug)})
+    for step in range(3000):
+        plugs = [device for device in home.getDevices() if isinstance(device, SmartPlug)]
+        plug = chooser.choice(plugs)
+        choice = chooser.random()
+        if choice < 0.4:
+            plug.toggleSwitch()
+        elif choice < 0.55:
+            plug.setConsumptionRate(chooser.randrange(151))
+        elif choice < 0.65:
+            home.setPriority(plug.deviceId, chooser.randrange(4))
+        elif choice < 0.72:
+            home.deleteDevice(plug.deviceId)
+            makePlugs(home, [chooser.randrange(151)])
+        elif choice < 0.8:
+            home.applyBatch([("toggle", chooser.choice(plugs).deviceId) for number in range(chooser.randrange(1, 5))])
+        elif choice < 0.85:
+            home.turnOnAll()
+        elif choice < 0.88:
+            home.turnOffAll()
+        elif choice < 0.93:
+            with home.batchChanges():
+                for number in range(3):
+                    chooser.choice(plugs).toggleSwitch()
+        else:
+            home.setPowerBudget(chooser.randrange(200, 1000))
+        checkBudget(home)
+
+class CountingList(list):
+    """
+    This is a list that counts how many times it is read, to check how much of the priority totals a step looks at.
+    """
+    reads = 0
+    def __getitem__(self, index):
+        CountingList.reads += 1
+        return list.__getitem__(self, index)
+
+def test_a_plug_that_cannot_fit_does_not_look_at_every_priority():
+    home = SmartHome()
+    plugs = makePlugs(home, [1] * 4000)
+    for plug in plugs:
+        plug.toggleSwitch()
+    home.setPowerBudget(4000, {plug.deviceId: number for number, plug in enumerate(plugs)})
+    big = makePlugs(home, [150])[0]
+    home.setPriority(big.deviceId, 10)
+    totals = home.powerBudget.usedByPriority
+    totals.tree = CountingList(totals.tree)
+    CountingList.reads = 0
+    for step in range(50):
+        big.toggleSwitch()
+        assert not big.switchedOn and home.getWaitingPlugs() == [big]
+        big.toggleSwitch()
+    assert CountingList.reads <= 50 * 2 * 13
+    for plug in plugs[10:]:
+        plug.toggleSwitch()
+    # The priorities left without running plugs are dropped.
+    assert len(totals.levels) + len(totals.extra) <= 64
+    home.verifyAggregates()
+
+def test_many_priorities_keep_the_budget():
+    chooser = random.Random(23)
+    home = SmartHome(checkConsistency=True)
+    makePlugs(home, [chooser.randrange(151) for number in range(60)])
+    home.setPowerBudget(1500, {device.deviceId: chooser.randrange(1000) for device in home.getDevices()})
+    for step in range(1500):
+        plug = chooser.choice(list(home.getDevices()))
+        choice = chooser.random()
+        if choice < 0.5:
+            plug.toggleSwitch()
+        elif choice < 0.7:
+            plug.setConsumptionRate(chooser.randrange(151))
+        else:
+            home.setPriority(plug.deviceId, chooser.randrange(1000))
+        checkBudget(home)
@@ -0,0 +1,70 @@
+import random
+
+import pytest
+
+from backend import SmartHome, SmartPlug, SmartWashingMachine, WASH_MODE_NAMES
+
+def matches(device, name, switchedOn, washMode, minRate, maxRate):
+    if name is not None and device.name != name:
+        return False
+    if switchedOn is not None and device.switchedOn != switchedOn:
+        return False
+    if washMode is not None and (not isinstance(device, SmartWashingMachine) or device.getWashMode() != washMode):
+        return False
+    if minRate is not None or maxRate is not None:
+        if not isinstance(device, SmartPlug):
+            return False
+        if minRate is not None and device.consumptionRate < minRate:
+            return False
+        if maxRate is not None and device.consumptionRate > maxRate:
+            return False
+    return True
+
+def randomQuery(chooser):
+    minRate = chooser.choice([None, chooser.randrange(151)])
+    maxRate = chooser.choice([None, chooser.randrange(151)])
+    return {
+        "name": chooser.choice([None, SmartPlug.name, SmartWashingMachine.name]),
+        "switchedOn": chooser.choice([None, True, False]),
+        "washMode": chooser.choice([None] + list(WASH_MODE_NAMES)),
+        "minRate": minRate,
+        "maxRate": maxRate,
+    }
+
+def test_random_queries_match_a_brute_force_search():
+    chooser = random.Random(11)
+    home = SmartHome(checkConsistency=True)
+    home.addDevices([SmartPlug() if number % 2 == 0 else SmartWashingMachine() for number in range(60)])
+    for step in range(2000):
+        devices = list(home.getDevices())
+        device = chooser.choice(devices)
+        choice = chooser.random()
+        if choice < 0.3:
+            device.toggleSwitch()
+        elif choice < 0.55:
+            if isinstance(device, SmartPlug):
+                device.setConsumptionRate(chooser.randrange(151))
+            else:
+                device.setWashMode(chooser.choice(WASH_MODE_NAMES))
+        elif choice < 0.65:
+            home.deleteDevice(device.deviceId)
+            home.addDevice(SmartPlug() if chooser.random() < 0.5 else SmartWashingMachine())
+        elif choice < 0.75:
+            home.moveDevice(device.deviceId, chooser.randrange(len(devices)))
+        elif choice < 0.8:
+            home.applyBatch([(chooser.choice(["turnOnAll", "turnOffAll"]), chooser.choice([SmartPlug.name,
+                                                                                           SmartWashingMachine.name]))])
+        query = randomQuery(chooser)
+        assert home.findDevices(**query) == [device for device in home.getDevices() if matches(device, **query)]
+        plugs = home.getPlugsByRate(query["minRate"], query["maxRate"])
+        rates = [plug.consumptionRate for plug in plugs]
+        assert rates == sorted(rates)
+        assert set(plugs) == set(device for device in home.getDevices()
+                                 if matches(device, None, None, None, query["minRate"], query["maxRate"])
+                                 and isinstance(device, SmartPlug))
+
+def test_unknown_wash_mode_raises():
+    home = SmartHome()
+    home.addDevice(SmartWashingMachine())
+    with pytest.raises(ValueError):
+        home.findDevices(washMode="Boil")
@@ -0,0 +1,66 @@
+import pytest
+
+from backend import SmartHome, SmartPlug
+from scheduler import Rule, Scheduler, VirtualClock
+
+def makeScheduler():
+    home = SmartHome(checkConsistency=True)
+    plug = SmartPlug()
+    home.addDevice(plug)
+    return Scheduler(home, clock=VirtualClock()), plug
+
+def test_cancelled_rule_added_again_runs_once():
+    scheduler, plug = makeScheduler()
+    rule = scheduler.after(10, [("toggle", plug.deviceId)])
+    rule.cancel()
+    assert len(scheduler) == 0
+    scheduler.add(rule)
+    assert len(scheduler) == 1
+    assert scheduler.runUntil(20) == 1
+    assert plug.switchedOn
+    assert len(scheduler) == 0
+    assert scheduler.nextDue() is None
+
+def test_adding_a_waiting_rule_again_raises():
+    scheduler, plug = makeScheduler()
+    rule = scheduler.after(10, [("toggle", plug.deviceId)])
+    with pytest.raises(ValueError):
+        scheduler.add(rule)
+    with pytest.raises(ValueError):
+        Scheduler(scheduler.home, clock=scheduler.clock).add(rule)
+    assert len(scheduler) == 1
+
+def test_recurring_rule_moved_to_another_scheduler():
+    scheduler, plug = makeScheduler()
+    rule = scheduler.every(10, [("toggle", plug.deviceId)])
+    rule.cancel()
+    other = Scheduler(scheduler.home, clock=scheduler.clock)
+    other.add(rule)
+    assert other.runUntil(35) == 3
+    assert scheduler.runDue() == 0
+    assert plug.switchedOn
+    assert len(other) == 1 and len(scheduler) == 0
+
+def test_action_that_adds_its_own_rule_again_runs_it_once_more():
+    scheduler, plug = makeScheduler()
+    ran = []
+    def action(home):
+        ran.append(scheduler.clock())
+        if len(ran) == 1:
+            rule.due = scheduler.clock() + 5
+            scheduler.add(rule)
+    rule = scheduler.add(Rule(action, 10, interval=100))
+    assert scheduler.runUntil(300) == 4
+    assert ran == [10, 15, 115, 215]
+
+def test_many_cancelled_rules_are_cleared_from_the_heap():
+    scheduler, plug = makeScheduler()
+    rules = [scheduler.after(number, [("toggle", plug.deviceId)]) for number in range(1, 201)]
+    for rule in rules[:150]:
+        rule.cancel()
+    for rule in rules[:10]:
+        scheduler.add(rule)
+    assert len(scheduler) == 60
+    assert scheduler.runUntil(1000) == 60
+    assert len(scheduler) == 0
+    assert not plug.switchedOn
@@ -0,0 +1,58 @@
+from backend import SmartHome, SmartPlug, SmartWashingMachine
+from store import HomeStore
+
+def describe(home):
+    return [(device.deviceId, device.switchedOn, getattr(device, "consumptionRate", None),
+             getattr(device, "washModeCode", None)) for device in home.getDevices()]
+
+def reload(path, home):
+    expected = describe(home)
+    store = HomeStore(str(path))
+    loaded = store.load(SmartHome(checkConsistency=True))
+    store.close()
+    assert describe(loaded) == expected
+    return loaded
+
+def makeSavedHome(path, size):
+    home = SmartHome(checkConsistency=True)
+    HomeStore(str(path)).attach(home)
+    home.addDevices([SmartPlug() if number % 2 == 0 else SmartWashingMachine() for number in range(size)])
+    return home
+
+def test_changes_are_saved(tmp_path):
+    home = makeSavedHome(tmp_path, 6)
+    devices = home.getDevices()
+    devices[0].toggleSwitch()
+    devices[0].setConsumptionRate(40)
+    devices[1].setWashMode("Eco")
+    home.moveDevice(devices[4].deviceId, 1)
+    home.deleteDeviceAt(2)
+    reload(tmp_path, home)
+
+def test_moves_in_a_batch_are_saved_in_order(tmp_path):
+    home = makeSavedHome(tmp_path, 5)
+    first, second, third = list(home.getDevices())[:3]
+    with home.batchChanges():
+        home.moveDevice(first.deviceId, 2)
+        home.moveDevice(second.deviceId, 2)
+    assert list(home.getDevices())[:3] == [third, first, second]
+    reload(tmp_path, home)
+
+def test_device_switched_after_being_added_in_a_batch_is_saved_on(tmp_path):
+    home = makeSavedHome(tmp_path, 2)
+    plug = SmartPlug()
+    with home.batchChanges():
+        home.addDevice(plug)
+        plug.toggleSwitch()
+    assert reload(tmp_path, home).getDevice(plug.deviceId).switchedOn
+
+def test_plugs_the_power_budget_switches_off_when_added_are_saved_off(tmp_path):
+    home = makeSavedHome(tmp_path, 0)
+    home.setPowerBudget(100)
+    plugs = [SmartPlug() for number in range(3)]
+    for plug in plugs:
+        plug.setConsumptionRate(60)
+        plug.toggleSwitch()
+    home.addDevices(plugs)
+    assert home.countTotalOn() == 1
+    reload(tmp_path, home)
@@ -0,0 +1,141 @@
+import asyncio
+import json
+import random
+
+from backend import SmartHome, SmartPlug, SmartWashingMachine, WASH_MODE_NAMES
+from streaming import HomeStreamServer, deviceState
+
+class Client():
+    """
+    This keeps a client's copy of the home, built from the snapshot and the deltas the server sends.
+    """
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+        self.devices = None
+        self.results = []
+    @classmethod
+    async def connect(cls, port):
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        client = cls(reader, writer)
+        client.task = asyncio.ensure_future(client.read())
+        return client
+    async def read(self):
+        while True:
+            line = await self.reader.readline()
+            if not line:
+                return
+            self.apply(json.loads(line))
+    def apply(self, message):
+        if message["type"] == "snapshot":
+            self.devices = [dict(device) for device in message["devices"]]
+            return
+        if message["type"] == "result":
+            self.results.append(message)
+            return
+        for change in message.get("changes", []):
+            position = next((number for number, device in enumerate(self.devices) if device["id"] == change["id"]), None)
+            if change.get("deleted"):
+                del self.devices[position]
+            elif "add" in change:
+                self.devices.append(dict(change["add"]))
+            elif "index" in change:
+                self.devices.insert(change["index"], self.devices.pop(position))
+            else:
+                self.devices[position].update((key, value) for key, value in change.items() if key != "id")
+    async def send(self, request):
+        self.writer.write(json.dumps(request).encode() + b"\n")
+        await self.writer.drain()
+    async def close(self):
+        self.writer.close()
+        self.task.cancel()
+
+def expected(home):
+    return [deviceState(device) for device in home.getDevices()]
+
+async def settle(server):
+    await asyncio.sleep(0.05)
+    server.flush()
+    await asyncio.sleep(0.05)
+
+def test_moves_in_one_batch_reach_clients_in_order():
+    async def run():
+        home = SmartHome(checkConsistency=True)
+        home.addDevices([SmartPlug() for number in range(6)])
+        server = HomeStreamServer(home, batchInterval=0.01)
+        client = await Client.connect(await server.start())
+        await settle(server)
+        first, second = list(home.getDevices())[:2]
+        with home.batchChanges():
+            home.moveDevice(first.deviceId, 2)
+            home.moveDevice(second.deviceId, 2)
+            first.toggleSwitch()
+        await settle(server)
+        assert client.devices == expected(home)
+        await client.close()
+        await server.stop()
+    asyncio.run(run())
+
+def change(home, chooser):
+    devices = list(home.getDevices())
+    device = chooser.choice(devices)
+    choice = chooser.random()
+    if choice < 0.4:
+        device.toggleSwitch()
+    elif choice < 0.55:
+        if isinstance(device, SmartPlug):
+            device.setConsumptionRate(chooser.randrange(151))
+        else:
+            device.setWashMode(chooser.choice(WASH_MODE_NAMES))
+    elif choice < 0.65:
+        home.addDevice(SmartPlug() if chooser.random() < 0.5 else SmartWashingMachine())
+    elif choice < 0.72 and len(devices) > 5:
+        home.deleteDevice(device.deviceId)
+    elif choice < 0.85:
+        home.moveDevice(device.deviceId, chooser.randrange(-len(devices), len(devices)))
+    else:
+        with home.batchChanges():
+            for number in range(3):
+                home.moveDevice(chooser.choice(devices).deviceId, chooser.randrange(len(devices)))
+                chooser.choice(devices).toggleSwitch()
+
+def test_clients_joining_mid_stream_end_up_with_the_home():
+    async def run():
+        chooser = random.Random(5)
+        home = SmartHome(checkConsistency=True)
+        home.addDevices([SmartPlug() if number % 2 == 0 else SmartWashingMachine() for number in range(40)])
+        server = HomeStreamServer(home, batchInterval=0.005)
+        port = await server.start()
+        clients = []
+        for joined in range(5):
+            clients.append(await Client.connect(port))
+            for step in range(200):
+                change(home, chooser)
+                if step % 20 == 0:
+                    await asyncio.sleep(0.001)
+        await settle(server)
+        for client in clients:
+            assert client.devices == expected(home)
+        for client in clients:
+            await client.close()
+        await server.stop()
+    asyncio.run(run())
+
+def test_badly_shaped_requests_get_an_error_result():
+    async def run():
+        home = SmartHome(checkConsistency=True)
+        home.addDevices([SmartPlug() for number in range(3)])
+        plug = home.getDeviceAt(0)
+        server = HomeStreamServer(home, batchInterval=0.01)
+        client = await Client.connect(await server.start())
+        for request in ([1], {"id": 1, "commands": 5}, {"id": 2, "commands": [5]}, {"id": 3, "commands": [["toggle", -1]]},
+                        {"id": 4, "commands": [["toggle", plug.deviceId]]}):
+            await client.send(request)
+        await settle(server)
+        assert [(result["id"], result["ok"]) for result in client.results] == \
+            [(None, False), (1, False), (2, False), (3, False), (4, True)]
+        assert plug.switchedOn
+        assert client.devices == expected(home)
+        await client.close()
+        await server.stop()
+    asyncio.run(run())
@@ -0,0 +1,161 @@
+import random
+import sys
+import threading
+
+from backend import SmartHome, SmartPlug, SmartWashingMachine, WASH_MODE_NAMES
+from tkview import MainThreadDispatcher
+
+def makeHome(size):
+    home = SmartHome(checkConsistency=True)
+    home.addDevices([SmartPlug() if number % 2 == 0 else SmartWashingMachine() for number in range(size)])
+    return home
+
+class FakeWindow():
+    """
+    This stands in for the Tk window, keeping the callbacks the dispatcher asks to be run later.
+    """
+    def __init__(self):
+        self.pending = []
+    def after(self, ms, function):
+        self.pending.append(function)
+    def after_idle(self, function):
+        self.pending.append(function)
+    def runPending(self):
+        callbacks = self.pending
+        self.pending = []
+        for function in callbacks:
+            function()
+
+def test_snapshot_inside_a_batch_shows_the_batch_so_far():
+    home = makeHome(4)
+    before = home.snapshot()
+    assert home.snapshot() is before
+    plug = home.getDeviceAt(0)
+    seen = []
+    with home.batchChanges():
+        plug.toggleSwitch()
+        inside = home.snapshot()
+        thread = threading.Thread(target=lambda: seen.append(home.snapshot()))
+        thread.start()
+        thread.join()
+    assert inside.onCount == 1 and inside.devices[0].switchedOn
+    assert seen == [before]
+    after = home.snapshot()
+    assert after is not before and after.onCount == 1
+    assert home.snapshot() is after
+
+def test_snapshot_matches_the_home():
+    home = makeHome(6)
+    home.getDeviceAt(1).toggleSwitch()
+    home.getDeviceAt(2).setConsumptionRate(70)
+    home.getDeviceAt(2).toggleSwitch()
+    snapshot = home.snapshot()
+    assert [state.deviceId for state in snapshot] == [device.deviceId for device in home.getDevices()]
+    assert snapshot.onCount == 2
+    assert snapshot.consumption == 70
+    assert snapshot.onCountByType == home.onCountByType
+
+def test_dispatcher_keeps_draining_after_a_call_raises():
+    window = FakeWindow()
+    errors = []
+    dispatcher = MainThreadDispatcher(window, onError=lambda function, error: errors.append(error))
+    ran = []
+    def fail():
+        raise RuntimeError("broken")
+    dispatcher.call(ran.append, 1)
+    dispatcher.call(fail)
+    dispatcher.call(ran.append, 2)
+    window.runPending()
+    assert ran == [1, 2]
+    assert [str(error) for error in errors] == ["broken"]
+    dispatcher.call(ran.append, 3)
+    window.runPending()
+    assert ran == [1, 2, 3]
+    assert len(window.pending) == 1
+
+def test_dispatcher_runs_calls_from_other_threads():
+    window = FakeWindow()
+    dispatcher = MainThreadDispatcher(window, maxBatch=10)
+    ran = []
+    threads = [threading.Thread(target=lambda number=number: [dispatcher.call(ran.append, number) for step in range(25)])
+               for number in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    while len(ran) < 100:
+        window.runPending()
+    assert sorted(ran) == sorted(list(range(4)) * 25)
+
+def checkSnapshot(snapshot):
+    on = [device for device in snapshot.devices if device.switchedOn]
+    assert len(on) == snapshot.onCount
+    assert abs(sum(device.consumptionRate for device in on if device.consumptionRate is not None)
+               - snapshot.consumption) < 1e-6
+    for name, count in snapshot.onCountByType.items():
+        assert count == sum(1 for device in on if device.name == name)
+
+def test_many_threads_changing_the_home_keep_its_totals():
+    home = SmartHome()
+    home.addDevices([SmartPlug() if number % 2 == 0 else SmartWashingMachine() for number in range(200)])
+    home.setPowerBudget(3000, {device.deviceId: number % 4 for number, device in enumerate(home.getDevices())
+                               if isinstance(device, SmartPlug)})
+    done = threading.Event()
+    failures = []
+
+    def writer(seed):
+        chooser = random.Random(seed)
+        try:
+            for step in range(1500):
+                devices = list(home.getDevices())
+                device = chooser.choice(devices)
+                choice = chooser.random()
+                # Another thread may delete the device first, which raises KeyError.
+                try:
+                    if choice < 0.4:
+                        device.toggleSwitch()
+                    elif choice < 0.55:
+                        if isinstance(device, SmartPlug):
+                            device.setConsumptionRate(chooser.randrange(151))
+                        else:
+                            device.setWashMode(chooser.choice(WASH_MODE_NAMES))
+                    elif choice < 0.75:
+                        home.applyBatch([("toggle", chooser.choice(devices).deviceId)
+                                         for number in range(chooser.randrange(1, 5))])
+                    elif choice < 0.9:
+                        home.deleteDevice(device.deviceId)
+                        home.addDevice(SmartPlug() if chooser.random() < 0.5 else SmartWashingMachine())
+                    else:
+                        home.moveDevice(device.deviceId, chooser.randrange(len(devices)))
+                except KeyError:
+                    pass
+        except Exception as error:
+            failures.append(error)
+
+    def reader():
+        try:
+            while not done.is_set():
+                checkSnapshot(home.snapshot())
+                assert 0 <= home.countTotalOn() <= len(home.getDevices())
+                home.getTotalConsumption()
+        except Exception as error:
+            failures.append(error)
+
+    writers = [threading.Thread(target=writer, args=(number,)) for number in range(4)]
+    readers = [threading.Thread(target=reader) for number in range(2)]
+    interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-5)
+    try:
+        for thread in writers + readers:
+            thread.start()
+        for thread in writers:
+            thread.join(60)
+        done.set()
+        for thread in readers:
+            thread.join(60)
+    finally:
+        sys.setswitchinterval(interval)
+    assert not any(thread.is_alive() for thread in writers + readers)
+    assert failures == []
+    home.verifyAggregates()
+    checkSnapshot(home.snapshot())
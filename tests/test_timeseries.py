@@ -0,0 +1,98 @@
+import random
+
+import pytest
+
+from backend import SmartHome, SmartPlug, SmartWashingMachine
+from timeseries import EnergySeries
+
+class Clock():
+    def __init__(self):
+        self.now = 0.0
+    def __call__(self):
+        return self.now
+
+def makePlug(rate):
+    plug = SmartPlug()
+    plug.setConsumptionRate(rate)
+    plug.toggleSwitch()
+    return plug
+
+def test_reused_slot_does_not_show_the_deleted_device():
+    clock = Clock()
+    home = SmartHome(checkConsistency=True)
+    old = makePlug(150)
+    home.addDevices([old, makePlug(5)])
+    series = EnergySeries(home, clock=clock)
+    for second in range(120):
+        clock.now = second
+        series.sample()
+    clock.now = 120
+    home.deleteDevice(old.deviceId)
+    new = makePlug(10)
+    home.addDevice(new)
+    assert series.slotOf[new.deviceId] == 0
+    for second in range(120, 240):
+        clock.now = second
+        series.sample()
+    assert series.devicePeaks(0, 240)[new.deviceId] == 10
+    assert series.aggregate(0, 240, deviceId=new.deviceId)["peak"] == 10
+    assert series.aggregate(0, 240, deviceId=new.deviceId)["samples"] == 120
+    for resolution in ("raw", "minute"):
+        rows = series.series(0, 240, resolution, deviceId=new.deviceId)
+        assert rows and all(time >= 120 and mean == 10 and peak == 10 for time, mean, peak in rows)
+    assert series.aggregate(0, 240, "minute", deviceId=new.deviceId)["sum"] == 60 * 10
+
+def test_totals_match_a_brute_force_count():
+    chooser = random.Random(3)
+    clock = Clock()
+    home = SmartHome(checkConsistency=True)
+    home.addDevices([makePlug(chooser.randrange(151)) if number % 3 else SmartWashingMachine() for number in range(30)])
+    series = EnergySeries(home, capacities={"raw": 4000}, clock=clock)
+    since = {device.deviceId: 0.0 for device in home.getDevices()}
+    samples = []
+    for second in range(3 * 3600):
+        clock.now = second
+        for change in range(chooser.randrange(3)):
+            device = chooser.choice(list(home.getDevices()))
+            choice = chooser.random()
+            if choice < 0.6:
+                device.toggleSwitch()
+            elif choice < 0.8 and isinstance(device, SmartPlug):
+                device.setConsumptionRate(chooser.randrange(151))
+            elif choice < 0.9:
+                home.deleteDevice(device.deviceId)
+                del since[device.deviceId]
+                plug = makePlug(chooser.randrange(151))
+                home.addDevice(plug)
+                since[plug.deviceId] = clock.now
+        series.sample()
+        samples.append((second, home.getTotalConsumption(),
+                        {device.deviceId: device.consumptionRate if device.switchedOn and isinstance(device, SmartPlug)
+                         else 0 for device in home.getDevices()}))
+
+    def bruteForce(start, end, bucket, deviceId=None):
+        chosen = [sample for sample in samples if start <= sample[0] < end]
+        if deviceId is None:
+            values = [total for second, total, devices in chosen]
+        else:
+            values = [devices[deviceId] for second, total, devices in chosen
+                      if second // bucket * bucket >= since[deviceId]]
+        return len(values), sum(values), max(values, default=0)
+
+    closed = {"raw": (7000, 10800, 1), "minute": (0, 10740, 60), "hour": (0, 7200, 3600)}
+    for resolution, (start, end, bucket) in closed.items():
+        count, total, peak = bruteForce(start, end, bucket)
+        found = series.aggregate(start, end, resolution)
+        assert found["samples"] == count
+        assert found["sum"] == pytest.approx(total, rel=1e-5)
+        assert found["peak"] == peak
+        for deviceId in since:
+            count, total, peak = bruteForce(start, end, bucket, deviceId)
+            found = series.aggregate(start, end, resolution, deviceId=deviceId)
+            assert found["samples"] == count
+            assert found["sum"] == pytest.approx(total, rel=1e-5, abs=1e-3)
+            assert found["peak"] == peak
+        peaks = series.devicePeaks(start, end, resolution)
+        for deviceId in since:
+            count, total, peak = bruteForce(start, end, bucket, deviceId)
+            assert peaks.get(deviceId, 0) == peak
@@ -0,0 +1,287 @@
+"""
+This records the energy use of a smart home over time.
+
+The home's current consumption and on/off state are kept in two arrays, one slot per device, which a home listener updates as
+devices change. Taking a sample copies both arrays into a fixed size ring buffer, so sampling costs one copy however the home
+changed. When a sample starts a new minute the finished minute is rolled up from the raw ring into the minute ring, and in the
+same way minutes roll up into hours and hours into days. Every ring has a fixed capacity, so memory per device is bounded no
+matter how long the process runs. Rollups and range queries work on whole rows of devices at once, with numpy when it is
+installed and with the array module otherwise.
+"""
+import bisect
+import operator
+import time
+from array import array
+from itertools import repeat
+from backend import SmartPlug
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+RESOLUTIONS = ("raw", "minute", "hour", "day")
+BUCKET_SECONDS = {"minute": 60, "hour": 3600, "day": 86400}
+
+class _Row():
+    """
+    This is one entry of a ring: the devices' mean and peak consumption and the fraction of samples they were on for, plus the
+    home's mean and peak total, over samples samples starting at time.
+    """
+    __slots__ = ("time", "samples", "mean", "peak", "onFraction", "homeMean", "homePeak")
+
+    def __init__(self, time, samples, mean, peak, onFraction, homeMean, homePeak):
+        self.time = time
+        self.samples = samples
+        self.mean = mean
+        self.peak = peak
+        self.onFraction = onFraction
+        self.homeMean = homeMean
+        self.homePeak = homePeak
+
+class _Ring():
+    """
+    This is a fixed size ring buffer of rows, oldest overwritten first.
+    """
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.rows = [None] * capacity
+        self.next = 0
+        self.count = 0
+    def append(self, row):
+        self.rows[self.next] = row
+        self.next = (self.next + 1) % self.capacity
+        self.count = min(self.count + 1, self.capacity)
+    def between(self, start, end):
+        """
+        This returns the rows starting in [start, end), oldest first.
+        """
+        first = (self.next - self.count) % self.capacity
+        rows = []
+        for offset in range(self.count):
+            row = self.rows[(first + offset) % self.capacity]
+            if start <= row.time < end:
+                rows.append(row)
+        return rows
+
+def _padded(values, width, typecode="f"):
+    """
+    This returns values extended with zeros to width, for rows recorded before later devices were added.
+    """
+    if len(values) >= width:
+        return values
+    padded = array(typecode, values)
+    padded.frombytes(bytes(padded.itemsize * (width - len(values))))
+    return padded
+
+def _combine(rows, time):
+    """
+    This rolls a list of rows up into one row starting at time. Means are weighted by the samples behind each row.
+    """
+    samples = sum(row.samples for row in rows)
+    width = max(len(row.mean) for row in rows)
+    if numpy is not None:
+        weights = numpy.array([row.samples for row in rows], dtype=numpy.float64)[:, None]
+        def stack(field):
+            return numpy.vstack([numpy.frombuffer(_padded(getattr(row, field), width), dtype=numpy.float32) for row in rows])
+        mean = array("f", ((stack("mean") * weights).sum(axis=0) / samples).astype(numpy.float32).tobytes())
+        onFraction = array("f", ((stack("onFraction") * weights).sum(axis=0) / samples).astype(numpy.float32).tobytes())
+        peak = array("f", stack("peak").max(axis=0).tobytes())
+    else:
+        meanTotal = array("d", bytes(8 * width))
+        onTotal = array("d", bytes(8 * width))
+        peak = array("f", bytes(4 * width))
+        for row in rows:
+            meanTotal = array("d", map(operator.add, meanTotal, map(operator.mul, _padded(row.mean, width), repeat(row.samples))))
+            onTotal = array("d", map(operator.add, onTotal,
+                                     map(operator.mul, _padded(row.onFraction, width), repeat(row.samples))))
+            peak = array("f", map(max, peak, _padded(row.peak, width)))
+        mean = array("f", map(operator.truediv, meanTotal, repeat(samples)))
+        onFraction = array("f", map(operator.truediv, onTotal, repeat(samples)))
+    homeMean = sum(row.homeMean * row.samples for row in rows) / samples
+    homePeak = max(row.homePeak for row in rows)
+    return _Row(time, samples, mean, peak, onFraction, homeMean, homePeak)
+
+class EnergySeries():
+    """
+    This samples the consumption of a smart home into ring buffers at raw, minute, hour and day resolution.
+
+    interval is the seconds between raw samples, and capacities gives the number of rows kept at each resolution. Each ring
+    must cover at least one bucket of the next one, so the raw ring needs at least a minute of samples, the minute ring at least
+    60 rows and the hour ring at least 24. clock returns the current time in seconds and is time.time by default.
+    """
+    def __init__(self, home, interval=1.0, capacities=None, clock=time.time):
+        self.home = home
+        self.interval = interval
+        self.clock = clock
+        self.capacities = {"raw": 600, "minute": 1440, "hour": 168, "day": 365}
+        self.capacities.update(capacities or {})
+        if self.capacities["raw"] * interval < 60 or self.capacities["minute"] < 60 or self.capacities["hour"] < 24:
+            raise ValueError("each ring must hold at least one bucket of the next resolution")
+        self.rings = {resolution: _Ring(self.capacities[resolution]) for resolution in RESOLUTIONS}
+        # The bucket the latest row of each rollup ring has been taken up to.
+        self.openBuckets = {resolution: None for resolution in BUCKET_SECONDS}
+        self.slotOf = {}
+        # A deleted device's slot is given to the next device added, so rows before slotSince belong to someone else.
+        self.freeSlots = []
+        self.slotSince = array("d")
+        self.consumption = array("f")
+        self.states = array("B")
+        self.pending = None
+        for device in home.getDevices():
+            self._track(device, 0.0)
+        home.addListener(self.onChange)
+    def close(self):
+        """
+        This stops following the home's changes.
+        """
+        self.home.removeListener(self.onChange)
+    def _track(self, device, since):
+        if self.freeSlots:
+            slot = self.freeSlots.pop()
+            self.slotSince[slot] = since
+        else:
+            slot = len(self.consumption)
+            self.consumption.append(0)
+            self.states.append(0)
+            self.slotSince.append(since)
+        self.slotOf[device.deviceId] = slot
+        self._update(device)
+    def _update(self, device):
+        slot = self.slotOf[device.deviceId]
+        self.states[slot] = device.switchedOn
+        if device.switchedOn and isinstance(device, SmartPlug):
+            self.consumption[slot] = device.consumptionRate
+        else:
+            self.consumption[slot] = 0
+    def onChange(self, event, device):
+        """
+        This keeps the current arrays up to date. It is registered as a listener on the home.
+        """
+        if event == "add":
+            self._track(device, self.clock())
+        elif event == "delete":
+            slot = self.slotOf.pop(device.deviceId)
+            self.consumption[slot] = 0
+            self.states[slot] = 0
+            self.freeSlots.append(slot)
+        elif event != "move":
+            self._update(device)
+    def sample(self, now=None):
+        """
+        This records the home's current consumption as a raw row, rolling up any bucket the new row closes first.
+        """
+        now = self.clock() if now is None else now
+        self._rollUp(now)
+        total = self.home.getTotalConsumption()
+        states = array("f", self.states)
+        self.rings["raw"].append(_Row(now, 1, array("f", self.consumption), array("f", self.consumption), states, total,
+                                      total))
+    def _rollUp(self, now):
+        """
+        This closes the buckets that end at or before now, from the finest resolution up.
+        """
+        finer = "raw"
+        for resolution, seconds in BUCKET_SECONDS.items():
+            bucket = now // seconds * seconds
+            opened = self.openBuckets[resolution]
+            if opened is None:
+                rows = self.rings[finer].between(float("-inf"), bucket)
+                opened = rows[0].time // seconds * seconds if rows else bucket
+            while opened < bucket:
+                rows = self.rings[finer].between(opened, opened + seconds)
+                if rows:
+                    self.rings[resolution].append(_combine(rows, opened))
+                opened += seconds
+                if not rows:
+                    # Skip straight over gaps with no samples at all.
+                    later = self.rings[finer].between(opened, bucket)
+                    opened = later[0].time // seconds * seconds if later else bucket
+            self.openBuckets[resolution] = opened
+            finer = resolution
+    def startSampling(self, window):
+        """
+        This samples every interval seconds using the Tk event loop of window.
+        """
+        def tick():
+            self.sample()
+            self.pending = window.after(int(self.interval * 1000), tick)
+        self.pending = window.after(int(self.interval * 1000), tick)
+    def stopSampling(self, window):
+        if self.pending is not None:
+            window.after_cancel(self.pending)
+            self.pending = None
+    def _rows(self, start, end, resolution):
+        if resolution not in self.rings:
+            raise ValueError("resolution must be one of {}".format(", ".join(RESOLUTIONS)))
+        return self.rings[resolution].between(start, end)
+    def aggregate(self, start, end, resolution="raw", deviceId=None):
+        """
+        This returns the sum, mean and peak of the sampled consumption between start and end, for the whole home or for one
+        device. sum adds up every sample, so sum times the interval is the energy used. A device's history only counts from
+        the first row that starts once it has been added.
+        """
+        rows = self._rows(start, end, resolution)
+        if deviceId is not None:
+            slot = self.slotOf[deviceId]
+            rows = self._rowsSince(rows, slot)
+            means = [(row.mean[slot] if slot < len(row.mean) else 0.0, row.samples) for row in rows]
+            peaks = [row.peak[slot] if slot < len(row.peak) else 0.0 for row in rows]
+        else:
+            means = [(row.homeMean, row.samples) for row in rows]
+            peaks = [row.homePeak for row in rows]
+        samples = sum(count for mean, count in means)
+        total = sum(mean * count for mean, count in means)
+        return {
+            "samples": samples,
+            "sum": total,
+            "mean": total / samples if samples else 0.0,
+            "peak": max(peaks, default=0.0),
+            "energy": total * self.interval,
+        }
+    def _rowsSince(self, rows, slot):
+        """
+        This returns the rows, oldest first, that start once the device now in slot had been added.
+        """
+        return rows[bisect.bisect_left([row.time for row in rows], self.slotSince[slot]):]
+    def devicePeaks(self, start, end, resolution="raw"):
+        """
+        This returns the peak consumption of every device between start and end, computed over whole rows at once. Like
+        aggregate(), a device's peak only counts the rows that start once it has been added, and devices with no such rows
+        are left out.
+        """
+        rows = self._rows(start, end, resolution)
+        times = [row.time for row in rows]
+        byFirstRow = {}
+        for deviceId, slot in self.slotOf.items():
+            first = bisect.bisect_left(times, self.slotSince[slot])
+            if first < len(rows):
+                byFirstRow.setdefault(first, []).append((deviceId, slot))
+        # Devices added at different times see different suffixes of the rows, so the peaks are built up from the newest rows
+        # back, combining each stretch of rows only once.
+        result = {}
+        peaks = None
+        last = len(rows)
+        for first in sorted(byFirstRow, reverse=True):
+            stretch = _combine(rows[first:last], start).peak
+            if peaks is None:
+                peaks = stretch
+            else:
+                width = max(len(peaks), len(stretch))
+                peaks = array("f", map(max, _padded(peaks, width), _padded(stretch, width)))
+            last = first
+            for deviceId, slot in byFirstRow[first]:
+                if slot < len(peaks):
+                    result[deviceId] = peaks[slot]
+        return result
+    def series(self, start, end, resolution="minute", deviceId=None):
+        """
+        This returns (time, mean, peak) for every row between start and end, for charting the whole home or one device. A
+        device's rows start once it has been added.
+        """
+        rows = self._rows(start, end, resolution)
+        if deviceId is None:
+            return [(row.time, row.homeMean, row.homePeak) for row in rows]
+        slot = self.slotOf[deviceId]
+        return [(row.time, row.mean[slot] if slot < len(row.mean) else 0.0, row.peak[slot] if slot < len(row.peak) else 0.0)
+                for row in self._rowsSince(rows, slot)]
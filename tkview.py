@@ -0,0 +1,315 @@
+"""
+This is the Tk view layer: the widgets that show a smart home. The backend model does not import it, so the model can be used
+without tkinter or a display.
+"""
+import queue
+import threading
+import traceback
+from tkinter import *
+
+def totalOnLabel(frame, count):
+    """
+    This creates and packs the label showing how many devices are activated.
+    """
+    label = Label(frame, text="Total activated: {}".format(count), font=("Arial", 16), pady=15)
+    label.pack(fill="both", expand=TRUE)
+    return label
+
+def deviceLabel(index, device):
+    """
+    This returns the text shown for a device at a given index in the list.
+    """
+    return "{}.".format(index+1) + str(device)
+
+class DeviceRow():
+    """
+    This is one row of the device list: the text box with the device's information and its toggle, configure and delete
+    buttons. A row is bound to one device while that device is in view, its buttons call onToggle, onConfigure or onDelete with
+    that device, and it is moved to whichever position of the list the device is shown in.
+    """
+    def __init__(self, parent, rowNum, onToggle, onConfigure, onDelete):
+        self.device = None
+        self.text = None
+        self.textBox = Text(parent, height=1, pady=20)
+        self.toggleBtn = Button(parent, text="Toggle this", command=self.toggle)
+        self.configBtn = Button(parent, text="Configure", command=self.configure)
+        self.deleteBtn = Button(parent, text="Delete", command=self.delete)
+        self.rowNum = rowNum
+        self.onToggle = onToggle
+        self.onConfigure = onConfigure
+        self.onDelete = onDelete
+        self.shown = False
+    def widgets(self):
+        return (self.textBox, self.toggleBtn, self.configBtn, self.deleteBtn)
+    def show(self):
+        if not self.shown:
+            for column, widget in enumerate(self.widgets()):
+                widget.grid(row=self.rowNum, column=column, sticky=NSEW)
+            self.shown = True
+    def place(self, rowNum):
+        """
+        This moves the row to another position in the list, re-gridding its widgets only if the position has changed.
+        """
+        if rowNum != self.rowNum:
+            self.rowNum = rowNum
+            if self.shown:
+                for widget in self.widgets():
+                    widget.grid_configure(row=rowNum)
+    def hide(self):
+        self.device = None
+        if self.shown:
+            for widget in self.widgets():
+                widget.grid_remove()
+            self.shown = False
+    def bind(self, device, index):
+        """
+        This binds the row to a device and shows the device's information in the text box.
+        """
+        self.device = device
+        self.setText(deviceLabel(index, device))
+    def setText(self, text):
+        """
+        This shows text in the text box, leaving the widget alone if it already shows that text.
+        """
+        if text != self.text:
+            self.textBox.delete("1.0", "end")
+            self.textBox.insert("1.0", text)
+            self.text = text
+    def toggle(self):
+        if self.device is not None:
+            self.onToggle(self.device)
+    def configure(self):
+        if self.device is not None:
+            self.onConfigure(self.device)
+    def delete(self):
+        if self.device is not None:
+            self.onDelete(self.device)
+
+class DeviceListView():
+    """
+    This shows the devices in the home as a scrollable list. Only enough rows to fill the visible area are created, and scrolling
+    rebinds the same rows to the devices that come into view, so the number of widgets stays the same however many devices
+    the home has. Rows are keyed by device ID: a device that stays in view keeps its row, which is only moved or relabelled
+    when its position or text changes, and rows are only rebound for devices that come into view. Each row has its own delete
+    button, so a device is picked for deleting straight from the list.
+    """
+    defaultRowHeight = 56
+
+    def __init__(self, parent, home, onToggle, onConfigure, onDelete, visibleRows=8):
+        self.home = home
+        self.onToggle = onToggle
+        self.onConfigure = onConfigure
+        self.onDelete = onDelete
+        self.frame = Frame(parent)
+        self.frame.grid_columnconfigure(0, weight=1)
+        self.scrollbar = Scrollbar(self.frame, orient=VERTICAL, command=self.yview)
+        self.scrollbar.grid(row=0, column=4, rowspan=visibleRows, sticky=N+S)
+        self.rows = []
+        self.rowOf = {}
+        self.spareRows = []
+        self.visibleRows = visibleRows
+        self.top = 0
+        self.frame.bind("<Configure>", self.onResize)
+        self.bindWheel(self.frame)
+        self.refresh()
+    def bindWheel(self, widget):
+        widget.bind("<MouseWheel>", self.onWheel)
+        widget.bind("<Button-4>", lambda event: self.scrollBy(-1))
+        widget.bind("<Button-5>", lambda event: self.scrollBy(1))
+    def onWheel(self, event):
+        self.scrollBy(-1 if event.delta > 0 else 1)
+    def onResize(self, event):
+        """
+        This works out how many rows fit in the list's new height and refreshes the list if that has changed.
+        """
+        rowHeight = self.rows[0].textBox.winfo_reqheight() if self.rows else self.defaultRowHeight
+        visibleRows = max(1, event.height // max(1, rowHeight))
+        if visibleRows != self.visibleRows:
+            self.visibleRows = visibleRows
+            self.scrollbar.grid_configure(rowspan=visibleRows)
+            self.refresh()
+    def yview(self, *args):
+        """
+        This is called by the scroll bar, either to move to a fraction of the list or to scroll by units or pages.
+        """
+        if args[0] == "moveto":
+            self.scrollTo(int(float(args[1]) * len(self.home.getDevices())))
+        elif args[0] == "scroll":
+            step = int(args[1])
+            if args[2] == "pages":
+                step *= self.visibleRows
+            self.scrollBy(step)
+    def scrollBy(self, step):
+        self.scrollTo(self.top + step)
+    def scrollTo(self, top):
+        """
+        This scrolls the list so the device at index top is the first one shown.
+        """
+        top = max(0, min(top, len(self.home.getDevices()) - self.visibleRows))
+        if top != self.top:
+            self.top = top
+            self.refresh()
+    def see(self, index):
+        """
+        This scrolls the list just enough for the device at an index to be shown.
+        """
+        if index < self.top:
+            self.scrollTo(index)
+        elif index >= self.top + self.visibleRows:
+            self.scrollTo(index - self.visibleRows + 1)
+    def _spareRow(self):
+        """
+        This returns a row that is not bound to a device, creating one if they are all in use.
+        """
+        if self.spareRows:
+            return self.spareRows.pop()
+        row = DeviceRow(self.frame, len(self.rows), self.onToggle, self.onConfigure, self.onDelete)
+        for widget in row.widgets():
+            self.bindWheel(widget)
+        self.rows.append(row)
+        return row
+    def refresh(self):
+        """
+        This reconciles the rows with the devices in view. Rows of devices that have left the view are hidden and kept spare,
+        devices that are still in view keep their rows, and only devices that have come into view are given a spare row.
+        Each row is then moved and relabelled only if its position or text has changed.
+        """
+        numOfDevices = len(self.home.getDevices())
+        self.top = max(0, min(self.top, numOfDevices - self.visibleRows))
+        shown = min(self.visibleRows, numOfDevices - self.top)
+        inView = [self.home.getDeviceAt(self.top + rowNum) for rowNum in range(shown)]
+        wanted = {device.deviceId: device for device in inView}
+        for deviceId, row in list(self.rowOf.items()):
+            if wanted.get(deviceId) is not row.device:
+                del self.rowOf[deviceId]
+                row.hide()
+                self.spareRows.append(row)
+        for rowNum, device in enumerate(inView):
+            row = self.rowOf.get(device.deviceId)
+            if row is None:
+                row = self.rowOf[device.deviceId] = self._spareRow()
+            row.place(rowNum)
+            row.bind(device, self.top + rowNum)
+            row.show()
+        if numOfDevices:
+            self.scrollbar.set(self.top / numOfDevices, (self.top + shown) / numOfDevices)
+        else:
+            self.scrollbar.set(0, 1)
+    def rowFor(self, device):
+        """
+        This returns the row showing a device, or None if the device is scrolled out of view.
+        """
+        row = self.rowOf.get(device.deviceId)
+        if row is not None and row.device is device:
+            return row
+        return None
+    def redrawDevice(self, device):
+        """
+        This updates the text of a device's row if the device is in view.
+        """
+        row = self.rowFor(device)
+        if row is not None:
+            row.setText(deviceLabel(self.home.getIndex(device), device))
+
+class RenderScheduler():
+    """
+    This collects the changes made to the home during one pass of the event loop and repaints them together in a single
+    after_idle callback. It remembers which devices changed, whether the list needs rebinding after an add or delete, and
+    whether the total needs updating, so a repaint only costs as much as what actually changed.
+    When the home is changed from other threads a dispatcher must be given: changes heard on another thread are then passed to
+    the main thread through it, so the widgets are only ever touched from the main loop.
+    """
+    def __init__(self, window, listView, home, dispatcher=None):
+        self.window = window
+        self.listView = listView
+        self.home = home
+        self.dispatcher = dispatcher
+        self.dirtyDevices = {}
+        self.layoutDirty = False
+        self.totalDirty = False
+        self.pending = None
+    def schedule(self):
+        if self.pending is None:
+            self.pending = self.window.after_idle(self.flush)
+    def markDevices(self, devices):
+        """
+        This marks devices whose state has changed, so their rows are repainted if they are in view.
+        """
+        for device in devices:
+            self.dirtyDevices[device.deviceId] = device
+        self.totalDirty = True
+        self.schedule()
+    def markDevice(self, device):
+        self.markDevices((device,))
+    def onChanges(self, changes):
+        """
+        This is registered as a change listener on the home, and marks what each batch of changes needs repainted.
+        """
+        if self.dispatcher is not None and not self.dispatcher.onMainThread():
+            self.dispatcher.call(self.onChanges, changes)
+            return
+        for event, device in changes:
+            if event in ("add", "delete", "move"):
+                self.markLayout()
+                return
+        self.markDevices(device for event, device in changes)
+    def markLayout(self):
+        """
+        This marks the list as needing to be rebound to the devices in view, after devices are added or deleted.
+        """
+        self.layoutDirty = True
+        self.totalDirty = True
+        self.schedule()
+    def flush(self):
+        """
+        This repaints everything marked since the last flush. The home is locked while it is read, so a repaint never shows
+        half of a change made on another thread.
+        """
+        self.pending = None
+        with self.home.lock:
+            if self.layoutDirty:
+                self.listView.refresh()
+            else:
+                for device in self.dirtyDevices.values():
+                    if device.home is self.home:
+                        self.listView.redrawDevice(device)
+            if self.totalDirty:
+                self.home.updateTotalOn()
+        self.dirtyDevices = {}
+        self.layoutDirty = False
+        self.totalDirty = False
+
+class MainThreadDispatcher():
+    """
+    This lets other threads run functions on the Tk main thread. call() can be used from any thread and only puts the function
+    on a queue, the main loop drains the queue every interval milliseconds and runs what it finds there. At most maxBatch
+    calls are run in one go, so a flood of calls from background threads cannot freeze the window: when more are left the
+    rest are run once the window has caught up with its own events and repaints. It must be created on the main thread.
+    A call that raises is reported to onError(function, error), which prints the traceback by default, and the calls after it
+    still run.
+    """
+    def __init__(self, window, interval=20, maxBatch=1000, onError=None):
+        self.window = window
+        self.interval = interval
+        self.maxBatch = maxBatch
+        self.onError = onError if onError is not None else (lambda function, error: traceback.print_exception(
+            type(error), error, error.__traceback__))
+        self.mainThread = threading.get_ident()
+        self.calls = queue.SimpleQueue()
+        self.window.after(self.interval, self.drain)
+    def onMainThread(self):
+        return threading.get_ident() == self.mainThread
+    def call(self, function, *args):
+        self.calls.put((function, args))
+    def drain(self):
+        for number in range(self.maxBatch):
+            try:
+                function, args = self.calls.get_nowait()
+            except queue.Empty:
+                self.window.after(self.interval, self.drain)
+                return
+            try:
+                function(*args)
+            except Exception as error:
+                self.onError(function, error)
+        self.window.after_idle(self.drain)
@@ -0,0 +1,289 @@
+"""
+This records the changes made to a smart home into a compact trace file and replays traces for load testing.
+
+A trace starts with an add for every device already in the home, so it can be replayed into an empty home, followed by one
+fixed size record per change: the microseconds since recording started and the same operation, argument, device ID and value
+that the store journals. A replay maps the recorded device IDs onto the devices it creates, and can run as fast as possible,
+at the recorded pace or at any multiple of it, either headless or through the frontend handlers of a running window. It
+reports the operations per second it sustained and the latency of every operation, both the time to apply it and the time
+from when it was due to when it finished, so falling behind shows up in the tail.
+
+Generate a synthetic workload and replay it headless with:
+    python tracing.py generate FILE [--devices N] [--operations N] [--rate OPS_PER_SECOND] [--seed N]
+    python tracing.py replay FILE [--speed FACTOR]
+"""
+import argparse
+import random
+import struct
+import time
+from backend import SmartHome, SmartPlug, SmartWashingMachine, WASH_MODE_NAMES, WashMode
+from columnar import PLUG, WASHER
+from instrument import LatencyHistogram
+from store import ADD, DELETE, MODE, MOVE, RATE, RECORD, TOGGLE, encodeRecord
+
+TRACE_MAGIC = b"SHTRACE1"
+# magic, wall clock time recording started
+TRACE_HEADER = struct.Struct("<8sd")
+# microseconds since recording started, then a journal record
+TRACE_RECORD = struct.Struct("<Q" + RECORD.format.lstrip("<"))
+
+class TraceRecorder():
+    """
+    This writes every change to a home into a trace file, starting with the devices it already holds. It is registered as a
+    listener on the home until close() is called.
+    """
+    def __init__(self, home, path):
+        self.home = home
+        self.file = open(path, "wb")
+        self.started = time.perf_counter()
+        self.count = 0
+        self.file.write(TRACE_HEADER.pack(TRACE_MAGIC, time.time()))
+        for device in home.getDevices():
+            self.record("add", device)
+        home.addListener(self.record)
+    def record(self, event, device):
+        elapsed = int((time.perf_counter() - self.started) * 1e6)
+        self.file.write(struct.pack("<Q", elapsed) + encodeRecord(event, device, self.home))
+        self.count += 1
+    def close(self):
+        self.home.removeListener(self.record)
+        self.file.close()
+
+def readTrace(path):
+    """
+    This returns the list of (microseconds, operation, argument, deviceId, value) records in a trace file.
+    """
+    with open(path, "rb") as file:
+        data = file.read()
+    magic, started = TRACE_HEADER.unpack_from(data)
+    if magic != TRACE_MAGIC:
+        raise ValueError("{} is not a smart home trace".format(path))
+    body = memoryview(data)[TRACE_HEADER.size:]
+    usable = len(body) - len(body) % TRACE_RECORD.size
+    return list(TRACE_RECORD.iter_unpack(body[:usable]))
+
+class HomeTarget():
+    """
+    This applies replayed records straight to a SmartHome, keeping a map from recorded device IDs to the devices it created.
+    """
+    def __init__(self, home=None):
+        self.home = home if home is not None else SmartHome()
+        self.devices = {}
+    def makeDevice(self, argument, value):
+        if argument & 0x0F == PLUG:
+            device = SmartPlug()
+            device.consumptionRate = int(value) if value == int(value) else value
+        else:
+            device = SmartWashingMachine()
+            device.washModeCode = WashMode(int(value))
+        device.switchedOn = bool(argument >> 4)
+        return device
+    def add(self, deviceId, argument, value):
+        device = self.makeDevice(argument, value)
+        self.home.addDevice(device)
+        self.devices[deviceId] = device
+    def delete(self, deviceId):
+        self.home.deleteDevice(self.devices.pop(deviceId).deviceId)
+    def toggle(self, deviceId):
+        self.devices[deviceId].toggleSwitch()
+    def rate(self, deviceId, value):
+        self.devices[deviceId].setConsumptionRate(int(value) if value == int(value) else value)
+    def mode(self, deviceId, value):
+        self.devices[deviceId].setWashMode(WASH_MODE_NAMES[int(value)])
+    def move(self, deviceId, value):
+        self.home.moveDevice(self.devices[deviceId].deviceId, int(value))
+    def apply(self, operation, argument, deviceId, value):
+        if operation == TOGGLE:
+            self.toggle(deviceId)
+        elif operation == ADD:
+            self.add(deviceId, argument, value)
+        elif operation == DELETE:
+            self.delete(deviceId)
+        elif operation == RATE:
+            self.rate(deviceId, value)
+        elif operation == MODE:
+            self.mode(deviceId, value)
+        elif operation == MOVE:
+            self.move(deviceId, value)
+
+class FrontendTarget(HomeTarget):
+    """
+    This replays through the frontend handlers, as if the user were clicking, so the run includes repainting the window.
+    Adds go through addDeviceProcess and are then given their recorded state, and config changes are made on the device as the
+    configure dialog does.
+    """
+    def __init__(self, frontend):
+        super().__init__(frontend.home)
+        self.frontend = frontend
+    def add(self, deviceId, argument, value):
+        self.frontend.addDeviceProcess("Smart Plug" if argument & 0x0F == PLUG else "Smart Washing Machine")
+        device = self.home.getDeviceAt(-1)
+        recorded = self.makeDevice(argument, value)
+        if isinstance(device, SmartPlug):
+            device.setConsumptionRate(recorded.consumptionRate)
+        else:
+            device.setWashMode(recorded.getWashMode())
+        if recorded.switchedOn:
+            self.frontend.toggleDevice(device)
+        self.devices[deviceId] = device
+    def delete(self, deviceId):
+        self.frontend.deleteSelection(self.devices.pop(deviceId))
+    def toggle(self, deviceId):
+        self.frontend.toggleDevice(self.devices[deviceId])
+
+class TraceReplayer():
+    """
+    This replays a trace into a target, a HomeTarget on a new home by default. speed scales the recorded pace, so 2 replays
+    twice as fast and None replays as fast as possible.
+    """
+    def __init__(self, path, target=None):
+        self.records = readTrace(path)
+        self.target = target if target is not None else HomeTarget()
+        self.service = LatencyHistogram()
+        self.response = LatencyHistogram()
+        self.position = 0
+        self.started = None
+        self.finished = None
+    def _applyNext(self, due):
+        elapsed, operation, argument, deviceId, value = self.records[self.position]
+        start = time.perf_counter_ns()
+        self.target.apply(operation, argument, deviceId, value)
+        end = time.perf_counter_ns()
+        self.service.record(end - start)
+        self.response.record(end - (due if due is not None else start))
+        self.position += 1
+    def _due(self, speed):
+        """
+        This returns when the next record is due in perf_counter_ns, or None when replaying as fast as possible.
+        """
+        if speed is None:
+            return None
+        return self.started + int(self.records[self.position][0] * 1000 / speed)
+    def run(self, speed=None):
+        """
+        This replays the whole trace on this thread and returns the report.
+        """
+        self.started = time.perf_counter_ns()
+        while self.position < len(self.records):
+            due = self._due(speed)
+            if due is not None:
+                wait = due - time.perf_counter_ns()
+                if wait > 0:
+                    time.sleep(wait / 1e9)
+            self._applyNext(due)
+        self.finished = time.perf_counter_ns()
+        return self.report()
+    def startInWindow(self, window, speed=None, onDone=None, chunk=200):
+        """
+        This replays the trace from the Tk event loop of window, applying what is due (at most chunk records) on each pass so
+        the window keeps repainting, and calls onDone with the report at the end.
+        """
+        self.started = time.perf_counter_ns()
+        def step():
+            applied = 0
+            while self.position < len(self.records) and applied < chunk:
+                due = self._due(speed)
+                if due is not None and due > time.perf_counter_ns():
+                    break
+                self._applyNext(due)
+                applied += 1
+            if self.position < len(self.records):
+                due = self._due(speed)
+                wait = 0 if due is None else max(0, (due - time.perf_counter_ns()) // 1000000)
+                window.after(int(wait), step)
+                return
+            self.finished = time.perf_counter_ns()
+            if onDone is not None:
+                onDone(self.report())
+        window.after(0, step)
+    def report(self):
+        seconds = ((self.finished or time.perf_counter_ns()) - self.started) / 1e9
+        return {
+            "operations": self.position,
+            "seconds": seconds,
+            "operationsPerSecond": self.position / seconds if seconds else 0.0,
+            "service": dict(self.service.summary(), p999Ns=self.service.percentile(0.999)),
+            "response": dict(self.response.summary(), p999Ns=self.response.percentile(0.999)),
+        }
+
+def formatReport(report):
+    lines = ["{:,} operations in {:.2f} s: {:,.0f} operations/s".format(report["operations"], report["seconds"],
+                                                                          report["operationsPerSecond"])]
+    for name in ("service", "response"):
+        summary = report[name]
+        lines.append("{:<9} mean {:>8.1f} us  p50 {:>8.1f} us  p99 {:>8.1f} us  p99.9 {:>8.1f} us  max {:>9.1f} us".format(
+            name, summary["meanNs"] / 1e3, summary["p50Ns"] / 1e3, summary["p99Ns"] / 1e3, summary["p999Ns"] / 1e3,
+            summary["maxNs"] / 1e3))
+    return "\n".join(lines)
+
+# The default mix of a synthetic workload, as relative weights.
+DEFAULT_MIX = {"toggle": 70, "rate": 10, "mode": 5, "add": 7.5, "delete": 7.5}
+
+def generateWorkload(path, devices=1000, operations=100000, rate=10000, mix=None, seed=None):
+    """
+    This writes a synthetic trace: a fleet of devices, half plugs and half washing machines, followed by operations drawn
+    from mix and spaced randomly at an average of rate operations per second.
+    """
+    generator = random.Random(seed)
+    mix = mix or DEFAULT_MIX
+    kinds = list(mix)
+    weights = [mix[kind] for kind in kinds]
+    live = []
+    plugs = set()
+    nextId = 1
+    elapsed = 0.0
+    with open(path, "wb") as file:
+        file.write(TRACE_HEADER.pack(TRACE_MAGIC, time.time()))
+        def add(timestamp):
+            nonlocal nextId
+            deviceId = nextId
+            nextId += 1
+            if generator.random() < 0.5:
+                plugs.add(deviceId)
+                file.write(TRACE_RECORD.pack(timestamp, ADD, PLUG, deviceId, generator.randrange(151)))
+            else:
+                file.write(TRACE_RECORD.pack(timestamp, ADD, WASHER, deviceId, generator.randrange(len(WASH_MODE_NAMES))))
+            live.append(deviceId)
+        for number in range(devices):
+            add(0)
+        for number in range(operations):
+            elapsed += generator.expovariate(rate)
+            timestamp = int(elapsed * 1e6)
+            kind = generator.choices(kinds, weights)[0]
+            if kind == "add" or not live:
+                add(timestamp)
+                continue
+            position = generator.randrange(len(live))
+            deviceId = live[position]
+            if kind == "delete":
+                live[position] = live[-1]
+                live.pop()
+                plugs.discard(deviceId)
+                file.write(TRACE_RECORD.pack(timestamp, DELETE, 0, deviceId, 0))
+            elif kind == "rate" and deviceId in plugs:
+                file.write(TRACE_RECORD.pack(timestamp, RATE, 0, deviceId, generator.randrange(151)))
+            elif kind == "mode" and deviceId not in plugs:
+                file.write(TRACE_RECORD.pack(timestamp, MODE, 0, deviceId, generator.randrange(len(WASH_MODE_NAMES))))
+            else:
+                file.write(TRACE_RECORD.pack(timestamp, TOGGLE, 0, deviceId, 0))
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate and replay smart home traces.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    generate = commands.add_parser("generate", help="write a synthetic workload trace")
+    generate.add_argument("path")
+    generate.add_argument("--devices", type=int, default=1000)
+    generate.add_argument("--operations", type=int, default=100000)
+    generate.add_argument("--rate", type=float, default=10000, help="average operations per second")
+    generate.add_argument("--seed", type=int)
+    replay = commands.add_parser("replay", help="replay a trace headless and report throughput and latency")
+    replay.add_argument("path")
+    replay.add_argument("--speed", type=float, help="multiple of the recorded pace, as fast as possible if left out")
+    args = parser.parse_args()
+    if args.command == "generate":
+        generateWorkload(args.path, args.devices, args.operations, args.rate, seed=args.seed)
+    else:
+        print(formatReport(TraceReplayer(args.path).run(args.speed)))
+
+if __name__ == "__main__":
+    main()